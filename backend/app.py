@@ -8,24 +8,6 @@ import os
 # Default sensible port for local use (matches frontend .env)
 os.environ.setdefault("FLASK_RUN_PORT", "5001")
 
-# Crear aplicación Flask
-app = Flask(__name__)
-# Permitir CORS para todos los orígenes (necesario para el front)
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
-
-# Configurar rutas
-from src.rutas.salud import configurar_rutas_salud
-from src.rutas.preprocesamiento import configurar_rutas_preprocesamiento
-from src.rutas.busqueda import configurar_rutas_busqueda
-from src.rutas.indexacion import configurar_rutas_indexacion
-from src.rutas.imagenes import configurar_rutas_imagenes
-
-configurar_rutas_salud(app)
-configurar_rutas_preprocesamiento(app)
-configurar_rutas_busqueda(app)
-configurar_rutas_indexacion(app)
-configurar_rutas_imagenes(app)
-
 # Crear directorios necesarios
 def crear_directorios():
     """Crea los directorios necesarios para el sistema"""
@@ -41,6 +23,55 @@ def crear_directorios():
         os.makedirs(directorio, exist_ok=True)
 
 
+def crear_app():
+    """
+    Fabrica de la aplicacion (servidor de desarrollo y WSGI pre-fork).
+    
+    Flujo:
+    1. Crea los directorios de datos
+    2. Crea la app Flask con CORS
+    3. Registra las rutas; al importarlas se cargan una sola vez el indice
+       FAISS, la normalizacion y la tabla de nombres. Con gunicorn y
+       preload_app esto ocurre en el proceso maestro antes del fork, y los
+       workers comparten esas paginas copy-on-write.
+    """
+    crear_directorios()
+    
+    app = Flask(__name__)
+    # Permitir CORS para todos los orígenes (necesario para el front)
+    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+    
+    from src.rutas.salud import configurar_rutas_salud
+    from src.rutas.preprocesamiento import configurar_rutas_preprocesamiento
+    from src.rutas.busqueda import configurar_rutas_busqueda
+    from src.rutas.indexacion import configurar_rutas_indexacion
+    from src.rutas.imagenes import configurar_rutas_imagenes
+    
+    configurar_rutas_salud(app)
+    configurar_rutas_preprocesamiento(app)
+    configurar_rutas_busqueda(app)
+    configurar_rutas_indexacion(app)
+    configurar_rutas_imagenes(app)
+    return app
+
+
+def preparar_worker():
+    """
+    Ajustes de cada worker despues del fork (hook post_fork de gunicorn).
+    
+    Flujo:
+    1. Limita los hilos OpenMP de FAISS por consulta (HILOS_FAISS, por
+       defecto 1): la concurrencia la dan workers x hilos; con el valor por
+       defecto de OpenMP cada consulta usaria todos los nucleos
+    2. Abre la conexion SQLite propia de la cache de resultados
+    """
+    import faiss
+    from src.rutas.busqueda import cache_resultados
+    
+    faiss.omp_set_num_threads(int(os.getenv('HILOS_FAISS', '1')))
+    cache_resultados.reabrir()
+
+
 def obtener_puerto():
     """Obtiene el puerto del entorno con un valor por defecto consistente."""
     return int(
@@ -51,11 +82,10 @@ def obtener_puerto():
     )
 
 
-# Garantiza que los directorios existan incluso al usar `flask run`
-crear_directorios()
+# Aplicacion por defecto (`flask run`, `python app.py`, gunicorn app:app)
+app = crear_app()
 
 if __name__ == '__main__':
-    crear_directorios()
     port = obtener_puerto()
     print("Iniciando Sistema SCBIR para Huellas...")
     print("Directorios creados: datos/datasets, datos/procesadas, datos/caracteristicas, datos/indices")
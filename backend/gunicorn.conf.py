@@ -0,0 +1,48 @@
+"""
+Configuracion de gunicorn para produccion (pre-fork).
+
+Uso:
+    gunicorn -c gunicorn.conf.py
+    # o: python run_backend.py --produccion
+
+La aplicacion se carga una vez en el proceso maestro (preload_app): indice
+FAISS, normalizacion y tabla de nombres quedan en memoria antes del fork y
+los workers las comparten copy-on-write. Cada worker atiende varias
+peticiones con hilos (FAISS y OpenCV liberan el GIL).
+
+Variables de entorno:
+    WORKERS         Procesos worker (por defecto: nucleos de CPU)
+    HILOS_WORKER    Hilos por worker (por defecto 4)
+    HILOS_FAISS     Hilos OpenMP por consulta FAISS (por defecto 1)
+    TIMEOUT_WORKER  Segundos antes de reiniciar un worker bloqueado (por defecto 120)
+    BACKEND_PORT / PORT / FLASK_RUN_PORT  Puerto (por defecto 5001)
+"""
+
+import gc
+import os
+
+wsgi_app = 'app:app'
+bind = '0.0.0.0:' + (
+    os.getenv('BACKEND_PORT')
+    or os.getenv('PORT')
+    or os.getenv('FLASK_RUN_PORT')
+    or '5001'
+)
+
+preload_app = True
+worker_class = 'gthread'
+workers = int(os.getenv('WORKERS', str(os.cpu_count() or 1)))
+threads = int(os.getenv('HILOS_WORKER', '4'))
+timeout = int(os.getenv('TIMEOUT_WORKER', '120'))
+
+
+def pre_fork(server, worker):
+    # Los objetos cargados pasan a la generacion permanente: el recolector de
+    # los workers no los recorre y no escribe en sus paginas (evita copiarlas)
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import preparar_worker
+
+    preparar_worker()
@@ -1,7 +1,8 @@
 """Lanza el backend tras preparar datos e índices si no existen.
 
 Uso:
-    python run_backend.py
+    python run_backend.py                # servidor de desarrollo de Flask
+    python run_backend.py --produccion   # gunicorn pre-fork (gunicorn.conf.py)
 
 Respeta las variables BACKEND_PORT, PORT o FLASK_RUN_PORT (por defecto 5001).
 """
@@ -27,6 +28,8 @@ def obtener_puerto() -> int:
 
 
 def main() -> None:
+    produccion = "--produccion" in sys.argv[1:]
+
     # Definir host/puerto antes de importar app
     port = obtener_puerto()
     os.environ.setdefault("FLASK_RUN_PORT", str(port))
@@ -38,6 +41,12 @@ def main() -> None:
 
     setup_inicial.main()
 
+    if produccion:
+        # Reemplaza este proceso por gunicorn: la app se carga en el maestro
+        # y se comparte con los workers (ver gunicorn.conf.py)
+        print(f"Iniciando backend (produccion) en http://0.0.0.0:{port}")
+        os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"])
+
     # Levantar servidor Flask
     from app import app, crear_directorios
 
@@ -0,0 +1,151 @@
+"""
+Benchmark de carga de /api/buscar-similares: QPS y latencias (p50, p95, p99),
+y opcionalmente RSS / PSS de cada proceso del servidor.
+Sirve para comparar el servidor de desarrollo con gunicorn pre-fork.
+
+Uso:
+    python scripts/benchmark_servidor.py --url http://localhost:5001 --concurrencia 16 --peticiones 2000
+    python scripts/benchmark_servidor.py --pids $(pgrep -f gunicorn)
+
+Cada peticion envia una imagen distinta de datos/procesadas (cuerpo image/png)
+en ciclo; para medir el servidor y no la cache, arrancarlo con
+CACHE_RESULTADOS_MB=0.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+
+def cargar_imagenes(directorio, limite):
+    archivos = sorted(f for f in os.listdir(directorio) if f.endswith('.png'))[:limite]
+    imagenes = []
+    for archivo in archivos:
+        with open(os.path.join(directorio, archivo), 'rb') as f:
+            imagenes.append(f.read())
+    return imagenes
+
+
+def memoria_proceso(pid):
+    """
+    RSS y PSS (MB) de un proceso leidos de /proc (Linux).
+    PSS reparte cada pagina compartida entre los procesos que la mapean:
+    con preload_app, la suma de PSS de los workers es la memoria real.
+
+    Returns:
+        tuple: (rss_mb, pss_mb); None en los valores no disponibles
+    """
+    valores = {}
+    for archivo, clave in (('status', 'VmRSS:'), ('smaps_rollup', 'Pss:')):
+        try:
+            with open(f'/proc/{pid}/{archivo}', 'r') as f:
+                for linea in f:
+                    if linea.startswith(clave):
+                        valores[clave] = int(linea.split()[1]) / 1024
+                        break
+        except OSError:
+            pass
+    return valores.get('VmRSS:'), valores.get('Pss:')
+
+
+def ejecutar_carga(url, imagenes, peticiones, concurrencia, top_k):
+    """
+    Flujo:
+    1. Reparte `peticiones` entre `concurrencia` hilos (una sesion HTTP cada uno)
+    2. Cada hilo toma el siguiente turno y envia la imagen correspondiente
+    3. Registra la latencia de cada respuesta y cuenta los errores
+
+    Returns:
+        tuple: (latencias en ms, errores, segundos totales)
+    """
+    siguiente = iter(range(peticiones))
+    bloqueo = threading.Lock()
+    latencias = []
+    errores = [0]
+
+    def trabajador():
+        sesion = requests.Session()
+        while True:
+            with bloqueo:
+                turno = next(siguiente, None)
+            if turno is None:
+                return
+            inicio = time.perf_counter()
+            try:
+                respuesta = sesion.post(
+                    f"{url}/api/buscar-similares", params={'top_k': top_k},
+                    data=imagenes[turno % len(imagenes)], headers={'Content-Type': 'image/png'}
+                )
+                valida = respuesta.status_code == 200
+            except requests.RequestException:
+                valida = False
+            latencia = (time.perf_counter() - inicio) * 1000
+            with bloqueo:
+                if valida:
+                    latencias.append(latencia)
+                else:
+                    errores[0] += 1
+
+    hilos = [threading.Thread(target=trabajador) for _ in range(concurrencia)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return np.array(latencias), errores[0], time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de /api/buscar-similares")
+    parser.add_argument('--url', default='http://localhost:5001')
+    parser.add_argument('--directorio', default='datos/procesadas')
+    parser.add_argument('--imagenes', type=int, default=500, help="Imagenes distintas a enviar en ciclo")
+    parser.add_argument('--peticiones', type=int, default=2000)
+    parser.add_argument('--concurrencia', type=int, default=16)
+    parser.add_argument('--calentamiento', type=int, default=50, help="Peticiones previas sin medir")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--pids', type=int, nargs='*', default=[],
+                        help="Procesos del servidor cuya memoria se informa al terminar")
+    args = parser.parse_args()
+
+    imagenes = cargar_imagenes(args.directorio, args.imagenes)
+    if not imagenes:
+        print(f"Error: No hay imagenes en {args.directorio}")
+        return 1
+
+    print(f"Servidor: {args.url} | {len(imagenes)} imagenes | concurrencia {args.concurrencia}")
+    if args.calentamiento:
+        ejecutar_carga(args.url, imagenes, args.calentamiento, args.concurrencia, args.top_k)
+
+    latencias, errores, segundos = ejecutar_carga(
+        args.url, imagenes, args.peticiones, args.concurrencia, args.top_k
+    )
+    if not len(latencias):
+        print(f"Todas las peticiones fallaron ({errores})")
+        return 1
+
+    p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+    print(f"Peticiones: {len(latencias)} correctas, {errores} con error, {segundos:.1f} s")
+    print(f"QPS: {len(latencias) / segundos:.1f}")
+    print(f"Latencia ms: p50 {p50:.1f} | p95 {p95:.1f} | p99 {p99:.1f} | max {latencias.max():.1f}")
+
+    if args.pids:
+        total_pss = 0.0
+        for pid in args.pids:
+            rss, pss = memoria_proceso(pid)
+            if rss is None:
+                print(f"PID {pid}: no disponible")
+                continue
+            total_pss += pss or 0.0
+            print(f"PID {pid}: RSS {rss:.1f} MB | PSS " + (f"{pss:.1f} MB" if pss is not None else "n/d"))
+        print(f"PSS total: {total_pss:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,7 @@ import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from src.core.descargador_dataset import DescargadorFVC
-from src.core.preprocesamiento import PreprocesadorUnificado
-from src.core.extraccion_caracteristicas import ExtractorMasivo
+from src.core.ingesta import IngestaUnificada
 
 def main():
     print("INICIANDO DESCARGA Y PREPARACIÓN DE DATOS")
@@ -19,30 +18,33 @@ def main():
         print("No se pudieron descargar los datasets")
         return
     
-    print("\2: Preprocesando imágenes...")
-    preprocesador = PreprocesadorUnificado()
+    print("\2: Preprocesando imágenes y extrayendo características (una sola pasada)...")
+    ingesta = IngestaUnificada()
     ruta_dataset = descargador.obtener_ruta_dataset()
-    ruta_salida = 'datos/procesadas'
-    
-    total_procesadas = preprocesador.preprocesar_directorio(ruta_dataset, ruta_salida)
+    # PNG procesados (los sirve /api/imagen); GUARDAR_PROCESADAS=0 los omite
+    guardar_procesadas = os.getenv("GUARDAR_PROCESADAS", "1") != "0"
+    # Procesos de ingesta (por defecto, todos los nucleos disponibles)
+    num_procesos = int(os.getenv("EXTRACCION_PROCESOS") or os.cpu_count() or 1)
+    
+    # Decodificar -> preprocesar -> extraer -> almacen mapeado (memoria constante)
+    total_procesadas = ingesta.ingerir_directorio(
+        directorio_entrada=ruta_dataset,
+        directorio_almacen='datos/caracteristicas/almacen',
+        directorio_procesadas='datos/procesadas' if guardar_procesadas else None,
+        num_procesos=num_procesos,
+        # Solo se procesan fuentes nuevas o modificadas
+        ruta_cache='datos/caracteristicas/cache_caracteristicas.sqlite',
+        # Nombres proc_XXXXXX.png estables aunque se agreguen o quiten datasets
+        ruta_manifiesto='datos/caracteristicas/manifiesto_preprocesamiento.json'
+    )
     
     if total_procesadas == 0:
         print("No se pudieron preprocesar imágenes")
         return
     
-    print("\3: Extrayendo características...")
-    extractor = ExtractorMasivo()
-    
-    resultados, vectores = extractor.extraer_directorio(
-        directorio_imagenes=ruta_salida,
-        ruta_salida_json='datos/caracteristicas/caracteristicas_completas.json',
-        ruta_salida_vectores='datos/caracteristicas/vectores_caracteristicas.npy'
-    )
-    
     print(f"\nPROCESO COMPLETADO:")
     print(f"Datasets descargados: {exitosos}")
-    print(f"Imágenes preprocesadas: {total_procesadas}")
-    print(f"Características extraídas: {len(resultados)}")
+    print(f"Imágenes preprocesadas y extraídas: {total_procesadas}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
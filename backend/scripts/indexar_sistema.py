@@ -18,7 +18,21 @@ def indexar_sistema():
     print("Indexando sistema SCBIR...")
     
     try:
-        response = requests.post(f"{API_BASE_URL}/api/indexar-sistema", json={})
+        # TIPO_INDICE: flat (por defecto), sq8, sqfp16, ivf, hnsw o ivfpq
+        # INDICES_POR_DESCRIPTOR=1: subindices LBP/HOG/GABOR para fusion tardia
+        # DIMENSION_PROYECCION=256: PCA antes de indexar (TIPO_PROYECCION=opq con ivfpq)
+        # BITS_FIRMA=256: firmas binarias para el prefiltro por Hamming (SUPERVIVIENTES_FIRMA=1000)
+        response = requests.post(
+            f"{API_BASE_URL}/api/indexar-sistema",
+            json={
+                "tipo_indice": os.getenv("TIPO_INDICE", "flat"),
+                "indices_por_descriptor": os.getenv("INDICES_POR_DESCRIPTOR", "0") == "1",
+                "dimension_proyeccion": int(os.getenv("DIMENSION_PROYECCION", "0")) or None,
+                "tipo_proyeccion": os.getenv("TIPO_PROYECCION", "pca"),
+                "bits_firma": int(os.getenv("BITS_FIRMA", "0")) or None,
+                "supervivientes_firma": int(os.getenv("SUPERVIVIENTES_FIRMA", "0")) or None
+            }
+        )
         
         if response.status_code == 200:
             resultado = response.json()
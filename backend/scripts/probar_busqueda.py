@@ -182,6 +182,71 @@ def probar_busqueda_aleatoria():
         print(f"Error en busqueda: {response.json()}")
 
 
+def probar_rango_con_bajas():
+    """
+    Busqueda por rango con lapidas (en IVF / IVF-PQ fallaba con el selector).
+
+    Flujo:
+    1. Enrola una copia de una imagen procesada con un nombre unico
+    2. Busca por rango con esa imagen: la copia debe aparecer (distancia 0)
+    3. La da de baja por ID (queda como lapida hasta compactar)
+    4. Repite la busqueda: debe responder 200 sin devolverla
+    """
+    print("\nPRUEBA 3: Busqueda por rango con bajas pendientes de compactar")
+    
+    directorio_procesadas = 'datos/procesadas'
+    archivos_imagen = sorted(f for f in os.listdir(directorio_procesadas) if f.endswith('.png')) \
+        if os.path.exists(directorio_procesadas) else []
+    if not archivos_imagen:
+        print("Error: No hay imagenes en datos/procesadas")
+        return
+    
+    with open(os.path.join(directorio_procesadas, archivos_imagen[0]), 'rb') as f:
+        imagen_base64 = base64.b64encode(f.read()).decode('utf-8')
+    nombre = f"prueba_rango_{random.randint(0, 10**9)}.png"
+    
+    def ids_en_rango():
+        response = requests.post(
+            "http://localhost:5000/api/buscar-similares",
+            json={"imagen": imagen_base64, "modo": "rango", "distancia_maxima": 1.0}
+        )
+        if response.status_code != 200:
+            print(f"   ERROR: Busqueda por rango: {response.json()}")
+            return None
+        return [r['indice_faiss'] for r in response.json()['resultados']]
+    
+    # 1: Alta
+    response = requests.post("http://localhost:5000/api/indice/agregar",
+                             json={"imagenes": [{"imagen": imagen_base64, "nombre": nombre}]})
+    if response.status_code != 200:
+        print(f"Error en alta: {response.json()}")
+        return
+    id_alta = response.json()['ids'][0]
+    
+    # 2: Sin baja, la copia esta dentro del rango
+    ids = ids_en_rango()
+    if ids is None:
+        return
+    if id_alta not in ids:
+        print("   ERROR: La busqueda por rango no devolvio la copia recien enrolada")
+        return
+    
+    # 3: Baja (la copia queda como lapida en el indice)
+    response = requests.post("http://localhost:5000/api/indice/eliminar", json={"ids": [id_alta]})
+    if response.status_code != 200:
+        print(f"Error en baja: {response.json()}")
+        return
+    
+    # 4: Rango con lapidas
+    ids = ids_en_rango()
+    if ids is None:
+        return
+    if id_alta in ids:
+        print("   ERROR: La busqueda por rango devolvio una imagen dada de baja")
+    else:
+        print(f"   RANGO CON LAPIDAS CORRECTO ({len(ids)} resultados)")
+
+
 def mostrar_interpretacion():
     """
     Muestra guia de interpretacion de resultados de similitud.
@@ -200,4 +265,5 @@ def mostrar_interpretacion():
 if __name__ == "__main__":
     probar_busqueda()
     probar_busqueda_aleatoria()
+    probar_rango_con_bajas()
     mostrar_interpretacion()
\ No newline at end of file
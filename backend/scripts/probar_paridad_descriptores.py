@@ -0,0 +1,156 @@
+"""
+Script para verificar la paridad de los motores rapidos de descriptores
+(LBP uniforme vectorizado y banco Gabor FFT) contra skimage.
+Usa las imagenes de pruebas/ y entradas sinteticas.
+"""
+
+import os
+import sys
+import glob
+import time
+import warnings
+
+import cv2
+import numpy as np
+from skimage import feature, filters
+
+# Agregar directorio raiz al path para importaciones
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.preprocesamiento import PreprocesadorUnificado
+from src.core.extraccion_caracteristicas import ExtractorLBP, ExtractorGabor
+from src.core.lbp_rapido import LBPUniformeRapido
+from src.core.banco_gabor import TOLERANCIA_ABSOLUTA_ENTERO
+
+DIRECTORIO_PRUEBAS = os.path.join(os.path.dirname(__file__), '..', '..', 'pruebas')
+
+
+def cargar_imagenes_pruebas():
+    """Imagenes de pruebas/ preprocesadas igual que en el sistema."""
+    preprocesador = PreprocesadorUnificado()
+    imagenes = {}
+    for ruta in sorted(glob.glob(os.path.join(DIRECTORIO_PRUEBAS, '*', '*'))):
+        imagen = cv2.imread(ruta)
+        if imagen is not None:
+            nombre = os.path.relpath(ruta, DIRECTORIO_PRUEBAS)
+            imagenes[nombre] = preprocesador.preprocesar_imagen(imagen)
+    return imagenes
+
+
+def generar_imagenes_sinteticas():
+    """Casos limite: ruido, constantes, gradientes, tablero y tamanos pequenos."""
+    generador = np.random.default_rng(0)
+    filas, columnas = np.mgrid[0:300, 0:300]
+    return {
+        'ruido_uniforme': generador.integers(0, 256, (300, 300), dtype=np.uint8),
+        'constante_cero': np.zeros((300, 300), dtype=np.uint8),
+        'constante_128': np.full((300, 300), 128, dtype=np.uint8),
+        'constante_255': np.full((300, 300), 255, dtype=np.uint8),
+        'gradiente_horizontal': (columnas * 255 // 299).astype(np.uint8),
+        'gradiente_diagonal': ((filas + columnas) * 255 // 598).astype(np.uint8),
+        'tablero': (((filas // 4 + columnas // 4) % 2) * 255).astype(np.uint8),
+        'rayas_crestas': (127 + 127 * np.sin(columnas / 3.0)).astype(np.uint8),
+        'pequena_rectangular': generador.integers(0, 256, (17, 40), dtype=np.uint8),
+        'menor_que_radio': generador.integers(0, 256, (5, 6), dtype=np.uint8),
+    }
+
+
+def probar_paridad_lbp(imagenes):
+    """
+    Compara codigos por pixel e histogramas contra local_binary_pattern.
+    Los codigos deben ser identicos (misma aritmetica en coma flotante).
+    """
+    print("\nPARIDAD LBP (uniform)")
+    fallos = 0
+    configuraciones = [(24, 8), (8, 1), (16, 2), (12, 3.5)]
+
+    for num_puntos, radio in configuraciones:
+        motor = LBPUniformeRapido(num_puntos, radio)
+        for nombre, imagen in imagenes.items():
+            referencia = feature.local_binary_pattern(imagen, num_puntos, radio, method='uniform')
+            codigos = motor.codigos(imagen)
+            if not np.array_equal(referencia.astype(np.int64), codigos):
+                diferentes = int(np.sum(referencia != codigos))
+                print(f"   FALLO P={num_puntos} R={radio} {nombre}: {diferentes} pixeles distintos")
+                fallos += 1
+
+    # Histograma del extractor (configuracion del sistema) vs implementacion skimage
+    extractor = ExtractorLBP()
+    for nombre, imagen in imagenes.items():
+        lbp = feature.local_binary_pattern(imagen, extractor.num_puntos, extractor.radio, method='uniform')
+        hist, _ = np.histogram(lbp.ravel(), bins=np.arange(0, extractor.num_puntos + 3),
+                               range=(0, extractor.num_puntos + 2))
+        hist = hist / hist.sum()
+        if not np.array_equal(hist, extractor.extraer(imagen)):
+            print(f"   FALLO histograma {nombre}")
+            fallos += 1
+
+    # Lote vs imagenes individuales
+    lote = np.stack([img for img in imagenes.values() if img.shape == (300, 300)])
+    if not np.array_equal(extractor.extraer_lote(lote), np.stack([extractor.extraer(i) for i in lote])):
+        print("   FALLO lote vs individual")
+        fallos += 1
+
+    print(f"   {'OK' if fallos == 0 else f'{fallos} FALLOS'} "
+          f"({len(imagenes)} imagenes, {len(configuraciones)} configuraciones)")
+    return fallos
+
+
+def probar_paridad_gabor(imagenes):
+    """Compara media y desviacion contra skimage.filters.gabor."""
+    print("\nPARIDAD GABOR (banco FFT)")
+    fallos = 0
+    extractor = ExtractorGabor()
+
+    for nombre, imagen in imagenes.items():
+        if min(imagen.shape) <= 2 * extractor.banco.margen:
+            # skimage refleja de forma distinta cuando el kernel supera la imagen
+            continue
+        referencia = []
+        for frecuencia in extractor.frecuencias:
+            for theta in extractor.angulos:
+                real, imag = filters.gabor(imagen, frequency=frecuencia, theta=theta)
+                magnitud = np.sqrt(real**2 + imag**2)
+                referencia.extend([np.mean(magnitud), np.std(magnitud)])
+        referencia = np.array(referencia, dtype=np.float64)
+        rapido = extractor.extraer(imagen)
+
+        mismos_inf = np.array_equal(np.isinf(referencia), np.isinf(rapido))
+        finitos = np.isfinite(referencia) & np.isfinite(rapido)
+        error = np.max(np.abs(referencia[finitos] - rapido[finitos]), initial=0.0)
+        if not mismos_inf or error > TOLERANCIA_ABSOLUTA_ENTERO:
+            print(f"   FALLO {nombre}: error maximo {error:.3g}")
+            fallos += 1
+
+    print(f"   {'OK' if fallos == 0 else f'{fallos} FALLOS'}")
+    return fallos
+
+
+def medir_tiempos(imagenes):
+    """Tiempo medio por imagen de cada implementacion."""
+    print("\nTIEMPOS (por imagen 300x300)")
+    lote = [img for img in imagenes.values() if img.shape == (300, 300)]
+    extractor = ExtractorLBP()
+
+    inicio = time.perf_counter()
+    for imagen in lote:
+        feature.local_binary_pattern(imagen, extractor.num_puntos, extractor.radio, method='uniform')
+    tiempo_skimage = (time.perf_counter() - inicio) / len(lote)
+
+    inicio = time.perf_counter()
+    extractor.extraer_lote(np.stack(lote))
+    tiempo_rapido = (time.perf_counter() - inicio) / len(lote)
+
+    print(f"   LBP skimage: {tiempo_skimage * 1000:.1f} ms - LBP rapido: {tiempo_rapido * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings('ignore', category=RuntimeWarning)
+    imagenes = cargar_imagenes_pruebas()
+    imagenes.update(generar_imagenes_sinteticas())
+
+    total_fallos = probar_paridad_lbp(imagenes) + probar_paridad_gabor(imagenes)
+    medir_tiempos(imagenes)
+
+    print("\nPARIDAD VERIFICADA" if total_fallos == 0 else f"\n{total_fallos} FALLOS DE PARIDAD")
+    sys.exit(1 if total_fallos else 0)
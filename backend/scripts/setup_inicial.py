@@ -16,11 +16,14 @@ from pathlib import Path
 
 
 ROOT = Path(__file__).resolve().parent.parent
-INDICE_OBJETIVO = ROOT / "datos" / "indices" / "faiss_index.bin"
+DIRECTORIO_INDICES = ROOT / "datos" / "indices"
+INDICE_OBJETIVO = DIRECTORIO_INDICES / "faiss_index.bin"
+# Puntero a la version publicada (ver src/core/versiones_indice.py)
+PUNTERO_VERSION = DIRECTORIO_INDICES / "ACTUAL"
 
 
 def ya_esta_indexado() -> bool:
-    return INDICE_OBJETIVO.exists()
+    return PUNTERO_VERSION.exists() or INDICE_OBJETIVO.exists()
 
 
 def ejecutar(comando: list[str]) -> None:
@@ -32,7 +35,7 @@ def ejecutar(comando: list[str]) -> None:
 
 def main() -> None:
     if ya_esta_indexado():
-        print(f"Índice ya presente en {INDICE_OBJETIVO}. Nada que hacer.")
+        print(f"Índice ya presente en {DIRECTORIO_INDICES}. Nada que hacer.")
         return
 
     print("Preparando datos e índices (primer arranque)...")
@@ -0,0 +1,341 @@
+"""
+Almacen de caracteristicas en streaming sobre una matriz mapeada en memoria.
+Sustituye las listas en memoria + JSON indentado de la extraccion masiva.
+"""
+
+import json
+import os
+import uuid
+
+import numpy as np
+
+
+# IDs estables de las altas incrementales: PRIMER_ID_ALTA + fila del segmento
+# de altas (los del corpus ingerido son su fila, siempre por debajo)
+PRIMER_ID_ALTA = 1 << 40
+
+
+class AlmacenCaracteristicas:
+    """
+    Matriz float32 creciente mapeada en disco + metadatos compactos por fila.
+
+    Estructura del directorio:
+        vectores.f32     # Matriz (filas, dimension) float32 sin cabecera
+        metadatos.jsonl  # Una linea JSON compacta por fila, solo se anexa
+        manifiesto.json  # dimension, filas confirmadas y disposicion
+
+    La memoria usada es constante: las filas se escriben directamente en
+    el mapa y la capacidad crece duplicandose en disco. Solo las filas
+    registradas en el manifiesto se consideran validas, asi una escritura
+    interrumpida se recupera al reabrir en modo 'a'.
+
+    Los valores invalidos (nan, inf) se limpian al escribir: los lectores
+    usan la matriz mapeada tal cual, sin copiarla para limpiarla.
+
+    Las filas confirmadas nunca se reescriben: 'a' solo anexa y 'w' crea
+    archivos nuevos (otra generacion) en lugar de truncar los existentes.
+    Por eso fijar_almacen puede enlazarlos en una version del indice.
+
+    Attributes:
+        directorio (str): Directorio del almacen
+        dimension (int): Columnas de la matriz
+        disposicion (dict): {descriptor: (desplazamiento, longitud)}
+        filas (int): Filas escritas
+        saneado (bool): Todas las filas se limpiaron al escribir (False en almacenes anteriores)
+        generacion (str): Cambia cada vez que el almacen se recrea en modo 'w'
+        modo (str): 'w' (nuevo), 'a' (anexar) o 'r' (solo lectura)
+    """
+
+    ARCHIVO_VECTORES = 'vectores.f32'
+    ARCHIVO_METADATOS = 'metadatos.jsonl'
+    ARCHIVO_MANIFIESTO = 'manifiesto.json'
+
+    def __init__(self, directorio, modo='r', dimension=None, disposicion=None,
+                 capacidad_inicial=1024, intervalo_confirmacion=1024):
+        self.directorio = directorio
+        self.modo = modo
+        self.intervalo_confirmacion = intervalo_confirmacion
+
+        self.ruta_vectores = os.path.join(directorio, self.ARCHIVO_VECTORES)
+        self.ruta_metadatos = os.path.join(directorio, self.ARCHIVO_METADATOS)
+        self.ruta_manifiesto = os.path.join(directorio, self.ARCHIVO_MANIFIESTO)
+
+        self._mapa = None
+        self._archivo_metadatos = None
+        self._capacidad = 0
+        self._sin_confirmar = 0
+
+        if modo == 'w':
+            if dimension is None:
+                raise ValueError("Se requiere 'dimension' para crear un almacen")
+            os.makedirs(directorio, exist_ok=True)
+            self.dimension = int(dimension)
+            self.disposicion = disposicion or {}
+            self.filas = 0
+            self.saneado = True
+            self.generacion = uuid.uuid4().hex
+            # Primero el manifiesto: una instantanea que lea el anterior y
+            # enlace ya los archivos nuevos ve el cambio de generacion
+            self._escribir_manifiesto()
+            # Archivos nuevos (inodos nuevos): las versiones que enlazan los
+            # anteriores y los lectores que los mapean no ven cambios
+            for ruta in (self.ruta_vectores, self.ruta_metadatos):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            open(self.ruta_vectores, 'wb').close()
+            open(self.ruta_metadatos, 'w').close()
+            self._reservar(capacidad_inicial)
+            self._archivo_metadatos = open(self.ruta_metadatos, 'a')
+            self._escribir_manifiesto()
+        else:
+            manifiesto = self._leer_manifiesto()
+            self.dimension = manifiesto['dimension']
+            self.disposicion = {k: tuple(v) for k, v in manifiesto.get('disposicion', {}).items()}
+            self.filas = manifiesto['filas']
+            self.saneado = manifiesto.get('saneado', False)
+            self.generacion = manifiesto.get('generacion')
+            if modo == 'a':
+                self._recortar_metadatos()
+                self._reservar(max(self.filas, capacidad_inicial))
+                self._archivo_metadatos = open(self.ruta_metadatos, 'a')
+
+    @classmethod
+    def existe(cls, directorio):
+        return os.path.exists(os.path.join(directorio, cls.ARCHIVO_MANIFIESTO))
+
+    def __len__(self):
+        return self.filas
+
+    def _leer_manifiesto(self):
+        with open(self.ruta_manifiesto, 'r') as f:
+            return json.load(f)
+
+    def _escribir_manifiesto(self):
+        """Escritura atomica: archivo temporal + os.replace."""
+        manifiesto = {
+            'dimension': self.dimension,
+            'filas': self.filas,
+            'dtype': 'float32',
+            'saneado': self.saneado,
+            'generacion': self.generacion,
+            'disposicion': self.disposicion
+        }
+        temporal = self.ruta_manifiesto + '.tmp'
+        with open(temporal, 'w') as f:
+            json.dump(manifiesto, f)
+        os.replace(temporal, self.ruta_manifiesto)
+
+    def _recortar_metadatos(self):
+        """Descarta lineas de metadatos posteriores a la ultima confirmacion."""
+        with open(self.ruta_metadatos, 'r') as f:
+            lineas = f.readlines()
+        if len(lineas) != self.filas:
+            # Archivo nuevo + os.replace: las instantaneas enlazadas conservan el anterior
+            temporal = self.ruta_metadatos + '.tmp'
+            with open(temporal, 'w') as f:
+                f.writelines(lineas[:self.filas])
+            os.replace(temporal, self.ruta_metadatos)
+
+    def _reservar(self, capacidad):
+        """Amplia el archivo de vectores y vuelve a mapearlo."""
+        if self._mapa is not None:
+            self._mapa.flush()
+            self._mapa = None
+        with open(self.ruta_vectores, 'r+b') as f:
+            f.truncate(capacidad * self.dimension * 4)
+        self._capacidad = capacidad
+        self._mapa = np.memmap(
+            self.ruta_vectores, dtype=np.float32, mode='r+',
+            shape=(capacidad, self.dimension)
+        )
+
+    def agregar_lote(self, matriz, metadatos):
+        """
+        Anexa filas al almacen.
+
+        Args:
+            matriz (numpy.ndarray): Vectores (N, dimension)
+            metadatos (list): N diccionarios (al menos {'archivo': ...})
+        """
+        if self._mapa is None:
+            raise ValueError("El almacen esta abierto en modo solo lectura")
+
+        matriz = np.asarray(matriz, dtype=np.float32).reshape(-1, self.dimension)
+        matriz = np.nan_to_num(matriz, nan=0.0, posinf=1.0, neginf=0.0)
+        nuevas = len(matriz)
+
+        # Duplicar capacidad cuando no quede espacio
+        if self.filas + nuevas > self._capacidad:
+            capacidad = self._capacidad
+            while capacidad < self.filas + nuevas:
+                capacidad *= 2
+            self._reservar(capacidad)
+
+        self._mapa[self.filas:self.filas + nuevas] = matriz
+        for item in metadatos:
+            self._archivo_metadatos.write(json.dumps(item, separators=(',', ':')) + '\n')
+        self.filas += nuevas
+
+        self._sin_confirmar += nuevas
+        if self._sin_confirmar >= self.intervalo_confirmacion:
+            self.confirmar()
+
+    def agregar(self, vector, metadatos):
+        self.agregar_lote(np.asarray(vector)[np.newaxis], [metadatos])
+
+    def confirmar(self):
+        """Vuelca vectores y metadatos y registra las filas en el manifiesto."""
+        if self._mapa is None:
+            return
+        self._mapa.flush()
+        self._archivo_metadatos.flush()
+        os.fsync(self._archivo_metadatos.fileno())
+        self._escribir_manifiesto()
+        self._sin_confirmar = 0
+
+    def cerrar(self):
+        """Confirma y recorta el archivo de vectores a las filas escritas."""
+        if self._mapa is None:
+            return
+        self.confirmar()
+        self._mapa = None
+        with open(self.ruta_vectores, 'r+b') as f:
+            f.truncate(self.filas * self.dimension * 4)
+        self._archivo_metadatos.close()
+        self._archivo_metadatos = None
+        self._capacidad = self.filas
+
+    def vectores(self):
+        """
+        Matriz (filas, dimension) mapeada en modo lectura.
+        No copia datos: las paginas se cargan bajo demanda.
+        """
+        if self.filas == 0:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.memmap(
+            self.ruta_vectores, dtype=np.float32, mode='r',
+            shape=(self.filas, self.dimension)
+        )
+
+    def iterar_metadatos(self):
+        """Recorre los metadatos linea a linea (sin cargar el archivo completo)."""
+        with open(self.ruta_metadatos, 'r') as f:
+            for i, linea in enumerate(f):
+                if i >= self.filas:
+                    break
+                yield json.loads(linea)
+
+    def nombres_archivo(self):
+        return [item['archivo'] for item in self.iterar_metadatos()]
+
+
+def _enlazar(origen, destino, limite=None):
+    """Hard link de `origen` en `destino`; si no se puede, copia sus primeros `limite` bytes."""
+    try:
+        os.link(origen, destino)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # Otro sistema de archivos o sin soporte de enlaces
+        with open(origen, 'rb') as entrada, open(destino, 'wb') as salida:
+            restante = limite
+            while restante is None or restante > 0:
+                bloque = entrada.read(1 << 24 if restante is None else min(restante, 1 << 24))
+                if not bloque:
+                    break
+                salida.write(bloque)
+                if restante is not None:
+                    restante -= len(bloque)
+
+
+def fijar_almacen(origen, destino, intentos=5):
+    """
+    Instantanea de solo lectura de un almacen en `destino`.
+
+    Flujo:
+    1. Lee el manifiesto (filas confirmadas y generacion)
+    2. Enlaza vectores y metadatos (hard link, sin copiar datos; copia si
+       el sistema de archivos no lo permite)
+    3. Si el almacen se recreo entretanto (otra generacion) repite; si no,
+       escribe el manifiesto leido: la instantanea solo ve esas filas
+
+    Las filas confirmadas no se reescriben nunca, asi que la instantanea
+    sigue siendo valida aunque el almacen se anexe o se reingiera despues.
+
+    Args:
+        origen (str): Directorio del almacen (o de otra instantanea)
+        destino (str): Directorio de la instantanea (se crea)
+
+    Returns:
+        int: Filas de la instantanea
+    """
+    os.makedirs(destino, exist_ok=True)
+    archivos = (AlmacenCaracteristicas.ARCHIVO_VECTORES, AlmacenCaracteristicas.ARCHIVO_METADATOS)
+    ruta_manifiesto = os.path.join(origen, AlmacenCaracteristicas.ARCHIVO_MANIFIESTO)
+
+    for _ in range(intentos):
+        # 1: Manifiesto
+        with open(ruta_manifiesto, 'r') as f:
+            manifiesto = json.load(f)
+
+        # 2: Enlaces
+        try:
+            for nombre in archivos:
+                ruta = os.path.join(destino, nombre)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+                limite = manifiesto['filas'] * manifiesto['dimension'] * 4 \
+                    if nombre == AlmacenCaracteristicas.ARCHIVO_VECTORES else None
+                _enlazar(os.path.join(origen, nombre), ruta, limite)
+        except FileNotFoundError:
+            continue
+
+        # 3: Misma generacion: los archivos enlazados son los del manifiesto
+        with open(ruta_manifiesto, 'r') as f:
+            if json.load(f).get('generacion') != manifiesto.get('generacion'):
+                continue
+        with open(os.path.join(destino, AlmacenCaracteristicas.ARCHIVO_MANIFIESTO), 'w') as f:
+            json.dump(manifiesto, f)
+        return manifiesto['filas']
+
+    raise RuntimeError(f"El almacen {origen} se esta recreando; vuelve a intentarlo")
+
+
+class VectoresPorId:
+    """
+    Vectores originales indexables por ID estable, como una matriz.
+
+    Une el corpus ingerido (ID = fila) y el segmento de altas incrementales
+    (ID = PRIMER_ID_ALTA + fila), que la reingesta no reescribe.
+
+    Attributes:
+        corpus (numpy.ndarray): Matriz del corpus (normalmente mapeada)
+        altas (numpy.ndarray): Matriz de altas (None si no hay)
+    """
+
+    def __init__(self, corpus, altas=None):
+        self.corpus = corpus
+        self.altas = altas if altas is not None and len(altas) else None
+        self.dtype = corpus.dtype
+
+    @classmethod
+    def abrir(cls, directorio, directorio_altas=None):
+        """Mapea el almacen del corpus y, si existe, el de altas."""
+        altas = None
+        if directorio_altas and AlmacenCaracteristicas.existe(directorio_altas):
+            altas = AlmacenCaracteristicas(directorio_altas).vectores()
+        return cls(AlmacenCaracteristicas(directorio).vectores(), altas)
+
+    @property
+    def nbytes(self):
+        return self.corpus.nbytes + (self.altas.nbytes if self.altas is not None else 0)
+
+    def __getitem__(self, ids):
+        ids = np.asarray(ids, dtype='int64')
+        if self.altas is None:
+            return self.corpus[ids]
+        filas = np.empty(ids.shape + (self.corpus.shape[1],), dtype=self.dtype)
+        es_alta = ids >= PRIMER_ID_ALTA
+        filas[~es_alta] = self.corpus[ids[~es_alta]]
+        filas[es_alta] = self.altas[ids[es_alta] - PRIMER_ID_ALTA]
+        return filas
@@ -4,27 +4,101 @@ Busca las k imagenes mas similares a una consulta dada.
 
 """
 
-import faiss
 import numpy as np
-import json
-import pickle
 import os
+import threading
+import time
+
+from src.core.almacen_caracteristicas import AlmacenCaracteristicas, VectoresPorId
+from src.core.firmas_binarias import cargar_firma, describir_firma, prefiltrar
+from src.core.fusion_tardia import (
+    fusionar_distancias, fusionar_rangos, matriz_rangos, METODOS_FUSION, normalizar_pesos
+)
+from src.core.indice_incremental import cargar_estado
+from src.core.indices_faiss import (
+    admite_selector_rango, cargar_configuracion, describir_indice, leer_indice, parametros_busqueda
+)
+from src.core.proyeccion import (
+    describir_normalizacion, describir_proyeccion, integrar_transformaciones, recibe_normalizados
+)
+from src.core.tabla_nombres import ARCHIVO_NOMBRES, TablaNombres
+from src.core.versiones_indice import almacen_version, directorio_actual, DIRECTORIO_ALTAS, version_actual
+from src.utilidades.helpers import memoria_mapeada
+
+
+# similitud = exp(-distancia / ESCALA_SIMILITUD)
+ESCALA_SIMILITUD = 20.0
+
+
+def distancia_para_similitud(similitud):
+    """Distancia (L2 al cuadrado) que corresponde a una similitud en (0, 1]."""
+    if not 0 < similitud <= 1:
+        raise ValueError("La similitud minima debe estar en (0, 1]")
+    return -ESCALA_SIMILITUD * float(np.log(similitud))
 
 
 class SistemaBusqueda:
     """
     Metodo de busqueda:
-    1. Normaliza vector de consulta (misma transformacion que entrenamiento)
+    1. Recorta el vector de consulta al rango del entrenamiento y lo
+       normaliza (Min-Max elemento a elemento; con proyeccion, la escala
+       va plegada en la transformacion del indice)
     2. Busca k vecinos mas cercanos en indice FAISS
     3. Convierte distancias a similitudes [0, 1]
     4. Garantiza que consulta a si misma = 1.0 exacto
+    
+    Con mapear_memoria (por defecto; INDICE_MMAP=0 lo desactiva) el indice
+    y los vectores originales se abren con mmap de solo lectura: los
+    procesos del servidor comparten las paginas en lugar de copiarlas.
+    
+    Busqueda en dos etapas (factor_reordenamiento r > 0):
+    1. El indice (IVF-PQ, HNSW, ...) devuelve k x r candidatos
+    2. Se reordenan con L2 exacta sobre los vectores originales
+       normalizados y se devuelven los k mejores
+    Por defecto r = 4 con indices aproximados o proyectados (PCA) y 0 con
+    IndexFlatL2 sin proyeccion (ya exacto).
+    
+    Si el indice se construyo con proyeccion PCA / OPQ, FAISS la aplica
+    (con la normalizacion plegada) al vector recortado; el reordenamiento y la fusion tardia usan el
+    vector normalizado completo.
+    
+    Fusion tardia (si se indexo con indices_por_descriptor): con `pesos`
+    se consulta un subindice por descriptor y las listas se combinan por
+    distancia ponderada o por rango (RRF), sin reindexar.
+    
+    Prefiltro binario (si se indexo con bits_firma): la firma de la
+    consulta se compara por distancia de Hamming con todas las firmas y
+    solo los `supervivientes` mas cercanos se evaluan en float (L2 exacta
+    sobre los vectores originales, o el indice restringido a esos IDs).
     """
     
-    def __init__(self, directorio_indices='datos/indices'):
+    def __init__(self, directorio_indices='datos/indices',
+                 directorio_almacen='datos/caracteristicas/almacen',
+                 mapear_memoria=None, factor_reordenamiento=None, supervivientes_firma=None):
         self.directorio_indices = directorio_indices
+        self.directorio_version = directorio_indices
+        self.version = None
+        self.directorio_almacen = directorio_almacen
+        if mapear_memoria is None:
+            mapear_memoria = os.getenv('INDICE_MMAP', '1') != '0'
+        self.mapear_memoria = mapear_memoria
+        self.factor_reordenamiento = factor_reordenamiento
+        self.supervivientes_firma = supervivientes_firma
+        self.indice_mapeado = False
+        self.ruta_vectores_originales = None
         self.indice_faiss = None
-        self.mapeo_indices = {}
+        self.subindices = {}
+        self.disposicion_subindices = {}
+        self.mapeo_indices = None
         self.scaler = None
+        self.normalizacion = None
+        self.entrada_normalizada = True
+        self.descripcion_proyeccion = None
+        self.recall = None
+        self.indice_binario = None
+        self.transformacion_firma = None
+        self.firma_binaria = None
+        self.lapidas = None
         self.cargado = False
         
         # Cargar indices automaticamente al inicializar
@@ -33,108 +107,691 @@ class SistemaBusqueda:
     def cargar_indices(self):
         """
         Flujo:
-        1. Verifica existencia de archivos requeridos
-        2. Carga indice FAISS binario
-        3. Carga mapeo JSON
-        4. Carga parametros de normalizacion
-        5. Carga vectores originales (para matching exacto)
+        1. Verifica existencia de archivos requeridos (version publicada
+           en el puntero ACTUAL, o el directorio raiz si es anterior)
+        2. Carga indice FAISS binario (y subindices por descriptor y firmas
+           binarias si existen)
+        3. Carga la tabla de nombres (mapeada en memoria; mapeo JSON si es anterior)
+        4. Carga la normalizacion (normalizacion.npy, o scaler.pkl si es anterior)
+        5. Carga vectores originales (para matching exacto) de la instantanea
+           de la misma version: las filas coinciden con los IDs del indice
+           aunque el almacen se reingiera despues
+        6. Carga lapidas (IDs dados de baja aun no compactados)
         """
         try:
-            # 1: Verificar y cargar indice FAISS
-            ruta_indice = f"{self.directorio_indices}/faiss_index.bin"
+            # 1: Verificar y cargar indice FAISS de la version publicada
+            self.version = version_actual(self.directorio_indices)
+            self.directorio_version = directorio_actual(self.directorio_indices)
+            ruta_indice = f"{self.directorio_version}/faiss_index.bin"
             if not os.path.exists(ruta_indice):
                 print("No se encontro indice FAISS. Ejecuta indexacion primero.")
                 return False
             
-            self.indice_faiss = faiss.read_index(ruta_indice)
+            # Mapeado en memoria si el tipo lo permite; si no, copia privada
+            configuracion = cargar_configuracion(self.directorio_version)
+            self.indice_faiss, self.indice_mapeado = leer_indice(
+                ruta_indice, mapear=self.mapear_memoria, tipo=configuracion.get('tipo')
+            )
+            
+            # Subindices por descriptor para fusion tardia
+            self.subindices = {}
+            self.disposicion_subindices = {}
+            for nombre, cfg in configuracion.get('subindices', {}).items():
+                self.subindices[nombre], _ = leer_indice(
+                    f"{self.directorio_version}/{cfg['archivo']}",
+                    mapear=self.mapear_memoria, tipo=cfg['tipo']
+                )
+                self.disposicion_subindices[nombre] = (cfg['desplazamiento'], cfg['longitud'])
+            
+            # Firmas binarias para el prefiltro por Hamming
+            self.indice_binario = None
+            self.transformacion_firma = None
+            self.firma_binaria = configuracion.get('firma_binaria')
+            if self.firma_binaria:
+                self.indice_binario, self.transformacion_firma = cargar_firma(
+                    self.directorio_version, mapear=self.mapear_memoria
+                )
             
             # 2: Cargar mapeo indices-imagenes
-            ruta_mapeo = f"{self.directorio_indices}/mapeo_indices.json"
-            with open(ruta_mapeo, 'r') as f:
-                self.mapeo_indices = json.load(f)
+            self.mapeo_indices = TablaNombres.cargar(self.directorio_version, mapear=self.mapear_memoria)
             
-            # 3: Cargar parametros de normalizacion
-            ruta_scaler = f"{self.directorio_indices}/scaler.pkl"
-            with open(ruta_scaler, 'rb') as f:
-                self.scaler = pickle.load(f)
+            # 3: Normalizacion Min-Max (primera transformacion del indice)
+            self.indice_faiss, self.normalizacion, self.scaler = integrar_transformaciones(
+                self.directorio_version, self.indice_faiss
+            )
+            self.entrada_normalizada = recibe_normalizados(self.indice_faiss)
+            self.descripcion_proyeccion = configuracion.get('proyeccion')
+            self.recall = configuracion.get('recall')
             
-            # 4: Cargar vectores originales para maxima precision
-            self.vectores_originales = np.load('datos/caracteristicas/vectores_caracteristicas.npy')
+            # 4: Cargar vectores originales para maxima precision (mapeados
+            # desde el almacen de la version, mas su segmento de altas; en
+            # versiones anteriores, el almacen compartido o el .npy legado)
+            self.vectores_originales = None
+            self.ruta_vectores_originales = None
+            origen_vectores = almacen_version(self.directorio_version)
+            if origen_vectores is None and AlmacenCaracteristicas.existe(self.directorio_almacen):
+                origen_vectores = self.directorio_almacen
+            if origen_vectores is not None:
+                self.vectores_originales = VectoresPorId.abrir(
+                    origen_vectores, almacen_version(self.directorio_version, DIRECTORIO_ALTAS)
+                )
+                self.ruta_vectores_originales = AlmacenCaracteristicas(origen_vectores).ruta_vectores
+            elif os.path.exists('datos/caracteristicas/vectores_caracteristicas.npy'):
+                self.ruta_vectores_originales = 'datos/caracteristicas/vectores_caracteristicas.npy'
+                self.vectores_originales = np.load(
+                    self.ruta_vectores_originales,
+                    mmap_mode='r' if self.mapear_memoria else None
+                )
+            
+            # 5: Lapidas: se excluyen en cada busqueda hasta compactar
+            eliminados = cargar_estado(self.directorio_version)['eliminados']
+            self.lapidas = np.array(eliminados, dtype='int64') if eliminados else None
             
             self.cargado = True
-            print(f"Indices cargados: {self.indice_faiss.ntotal} vectores")
+            print(f"Indices cargados: {self.indice_faiss.ntotal} vectores (version {self.version})")
             return True
             
         except Exception as e:
             print(f"Error cargando indices: {e}")
             return False
     
-    def buscar_por_imagen(self, imagen, extractor, top_k=10):
+    def _factor_reordenamiento(self, reordenar):
+        """Factor r efectivo: por consulta, configurado o automatico."""
+        if self.vectores_originales is None:
+            return 0
+        if reordenar is not None:
+            return int(reordenar)
+        if self.factor_reordenamiento is not None:
+            return int(self.factor_reordenamiento)
+        # Automatico: solo los indices aproximados o proyectados necesitan reordenar
+        if self.descripcion_proyeccion is None and describir_indice(self.indice_faiss)['tipo_indice'] == 'IndexFlatL2':
+            return 0
+        return 4
+    
+    def _supervivientes(self, supervivientes, top_k):
+        """Candidatos del prefiltro binario: por consulta, configurado o el de la indexacion (0 = sin prefiltro)."""
+        if self.indice_binario is None:
+            return 0
+        if supervivientes is None:
+            supervivientes = self.supervivientes_firma or self.firma_binaria['supervivientes']
+        return max(int(supervivientes), top_k) if int(supervivientes) > 0 else 0
+    
+    def _normalizar(self, vectores):
+        """Min-Max elemento a elemento con los parametros del indice (D operaciones por fila)."""
+        return self.normalizacion.apply(vectores)
+    
+    def _entrada_indice(self, consultas, normalizadas):
+        """Consultas como las recibe el indice principal (normalizadas, o recortadas si proyecta)."""
+        return normalizadas if self.entrada_normalizada else consultas
+    
+    def _limpiar_consultas(self, vectores):
+        """
+        Consultas limpias como los vectores almacenados (inf/NaN, p. ej. la
+        desviacion Gabor desbordada en float16) y recortadas al rango del
+        scaler: una imagen indexada queda a distancia 0 de si misma.
+        """
+        vectores = np.nan_to_num(vectores, nan=0.0, posinf=1.0, neginf=0.0)
+        return np.ascontiguousarray(
+            np.clip(vectores, self.scaler['min'], self.scaler['max']), dtype='float32'
+        )
+    
+    def _filas_normalizadas(self, candidatos):
+        """
+        Vectores originales de los candidatos, limpios, recortados al rango
+        del scaler (como la consulta y las altas incrementales) y con la
+        normalizacion del indice.
+        """
+        filas = np.nan_to_num(
+            self.vectores_originales[candidatos], nan=0.0, posinf=1.0, neginf=0.0
+        )
+        return self._normalizar(np.clip(filas, self.scaler['min'], self.scaler['max']))
+    
+    def _reordenar_exacto(self, vector_float32, indices, top_k):
+        """
+        Segunda etapa: L2 exacta contra los vectores originales.
+        
+        Flujo:
+        1. Descarta huecos (-1) y ordena los IDs (lectura secuencial del mmap)
+        2. Reune las filas candidatas en una sola operacion vectorizada
+        3. Las normaliza como en la indexacion (limpieza + Min-Max)
+        4. Calcula L2 al cuadrado (misma escala que FAISS) y toma los k mejores
+        
+        Returns:
+            tuple: (distancias, indices) de forma (top_k,)
+        """
+        # 1: IDs validos (fila del corpus o PRIMER_ID_ALTA + fila de las altas)
+        candidatos = np.unique(indices[indices >= 0])
+        
+        # 2-3: Gather + normalizacion identica a la de construccion
+        filas = self._filas_normalizadas(candidatos)
+        
+        # 4: Distancia exacta y seleccion
+        diferencias = filas - vector_float32[0]
+        distancias = np.einsum('ij,ij->i', diferencias, diferencias)
+        orden = np.argsort(distancias, kind='stable')[:top_k]
+        return distancias[orden].astype('float32'), candidatos[orden]
+    
+    def _buscar_fusion_tardia(self, vector_float32, num_candidatos, top_k, pesos, fusion,
+                              nprobe, ef_search, tiempos):
+        """
+        Consulta cada subindice y fusiona las listas en una sola pasada.
+        
+        Flujo:
+        1. Busca num_candidatos en el subindice de cada descriptor con peso > 0
+        2. Une los candidatos (IDs unicos)
+        3. Distancia de cada candidato en cada descriptor, matriz (B, C):
+           exacta desde los vectores originales si estan disponibles; si no,
+           la de la lista (o la peor de la lista si el candidato no aparece)
+        4. Fusiona por distancia ponderada o por rango (RRF) y toma los k mejores
+        
+        Returns:
+            tuple: (distancias (1, k), indices (1, k), distancias por descriptor (B, k))
+        """
+        nombres = list(self.subindices)
+        vector_pesos = normalizar_pesos(pesos, nombres)
+        longitudes = np.array([self.disposicion_subindices[n][1] for n in nombres], dtype=np.float64)
+        
+        # 1: Listas por descriptor
+        inicio = time.perf_counter()
+        listas = []
+        distancias_listas = []
+        for nombre, peso in zip(nombres, vector_pesos):
+            if peso == 0:
+                listas.append(np.empty(0, dtype='int64'))
+                distancias_listas.append(np.empty(0, dtype='float32'))
+                continue
+            desplazamiento, longitud = self.disposicion_subindices[nombre]
+            subindice = self.subindices[nombre]
+            params = parametros_busqueda(subindice, nprobe=nprobe, ef_search=ef_search,
+                                         excluidos=self.lapidas)
+            consulta = np.ascontiguousarray(vector_float32[:, desplazamiento:desplazamiento + longitud])
+            distancias, indices = subindice.search(consulta, num_candidatos, params=params)
+            listas.append(indices[0])
+            distancias_listas.append(distancias[0])
+        tiempos['candidatos'] = (time.perf_counter() - inicio) * 1000
+        
+        # 2: Union de candidatos
+        inicio = time.perf_counter()
+        candidatos = np.unique(np.concatenate(listas))
+        candidatos = candidatos[candidatos >= 0]
+        
+        # 3: Matriz de distancias (B, C)
+        if self.vectores_originales is not None:
+            cuadrados = (self._filas_normalizadas(candidatos) - vector_float32[0]) ** 2
+            matriz = np.stack([
+                cuadrados[:, d:d + l].sum(axis=1)
+                for d, l in (self.disposicion_subindices[n] for n in nombres)
+            ])
+        else:
+            matriz = np.empty((len(nombres), len(candidatos)))
+            for b, (lista, distancias) in enumerate(zip(listas, distancias_listas)):
+                validos = lista >= 0
+                matriz[b] = distancias[validos].max() if validos.any() else 0.0
+                matriz[b, np.searchsorted(candidatos, lista[validos])] = distancias[validos]
+        
+        # 4: Fusion vectorizada
+        fusionadas = fusionar_distancias(matriz, vector_pesos, longitudes)
+        if fusion == 'rango':
+            puntuacion = fusionar_rangos(matriz_rangos(listas, candidatos), vector_pesos)
+            orden = np.argsort(-puntuacion, kind='stable')[:top_k]
+        else:
+            orden = np.argsort(fusionadas, kind='stable')[:top_k]
+        tiempos['fusion'] = (time.perf_counter() - inicio) * 1000
+        
+        return (fusionadas[orden].astype('float32')[np.newaxis], candidatos[orden][np.newaxis],
+                matriz[:, orden])
+    
+    def _validar_fusion(self, pesos, fusion, distancia_maxima=None, rango=False):
+        """Mensaje de error si la fusion tardia o el rango pedidos no son posibles (None si son validos)."""
+        if rango and distancia_maxima is None:
+            return "La busqueda por rango requiere distancia_maxima o similitud_minima"
+        if rango and pesos is not None:
+            return "La busqueda por rango no admite fusion tardia por descriptor (pesos)"
+        if pesos is None:
+            return None
+        if not self.subindices:
+            return "No hay subindices por descriptor. Indexa con indices_por_descriptor"
+        if fusion not in METODOS_FUSION:
+            return f"Fusion no soportada: {fusion} (opciones: {', '.join(METODOS_FUSION)})"
+        return None
+    
+    def _buscar_consultas(self, consultas, top_k, nprobe, ef_search, reordenar, pesos, fusion,
+                          supervivientes, tiempos, distancia_maxima=None, rango=False):
+        """
+        Pasos 3-4 de la busqueda para una matriz (N, D) de consultas recortadas.
+        
+        Sin prefiltro ni fusion tardia se hace una sola llamada (N, D) a
+        FAISS; el prefiltro binario y la fusion tardia siguen siendo por
+        consulta. Los tiempos de cada etapa se acumulan en `tiempos`.
+        Con `distancia_maxima` se descartan los vecinos mas lejanos; con
+        `rango` se devuelven todos los que esten dentro (range_search).
+        
+        Returns:
+            list: Por consulta, (distancias, indices, distancias_descriptor o None)
+        """
+        if rango:
+            return self._buscar_rango(consultas, top_k, distancia_maxima, nprobe, ef_search,
+                                      reordenar, tiempos)
+        filas = self._buscar_vecinos(consultas, top_k, nprobe, ef_search, reordenar, pesos, fusion,
+                                     supervivientes, tiempos)
+        if distancia_maxima is None:
+            return filas
+        recortadas = []
+        for distancias, indices, distancias_descriptor in filas:
+            dentro = distancias <= distancia_maxima
+            recortadas.append((distancias[dentro], indices[dentro],
+                               distancias_descriptor[:, dentro] if distancias_descriptor is not None else None))
+        return recortadas
+    
+    def _buscar_rango(self, consultas, top_k, distancia_maxima, nprobe, ef_search, reordenar, tiempos):
+        """
+        Todos los vectores a distancia <= distancia_maxima, con una sola
+        pasada de range_search de FAISS para todo el lote.
+        
+        Con indices aproximados o proyectados (si hay reordenamiento) las
+        distancias de los encontrados se recalculan exactas y se vuelve a
+        aplicar el radio. `top_k` (None = sin limite) acota cada lista a
+        los mas cercanos. En indices IVF las lapidas se descartan sobre el
+        resultado (ver admite_selector_rango).
+        
+        Returns:
+            list: Por consulta, (distancias, indices, None) de menor a mayor distancia
+        """
+        inicio = time.perf_counter()
+        exacto = self._factor_reordenamiento(reordenar) > 0
+        vectores_float32 = self._normalizar(consultas) if exacto or self.entrada_normalizada else None
+        filtrar_lapidas = self.lapidas is not None and not admite_selector_rango(self.indice_faiss)
+        params = parametros_busqueda(self.indice_faiss, nprobe=nprobe, ef_search=ef_search,
+                                     excluidos=None if filtrar_lapidas else self.lapidas)
+        try:
+            limites, distancias, indices = self.indice_faiss.range_search(
+                self._entrada_indice(consultas, vectores_float32), float(distancia_maxima), params=params
+            )
+        except RuntimeError as e:
+            raise ValueError(f"El indice {describir_indice(self.indice_faiss)['tipo_indice']} "
+                             f"no admite busqueda por rango: {e}")
+        tiempos['candidatos'] = tiempos.get('candidatos', 0.0) + (time.perf_counter() - inicio) * 1000
+        
+        inicio = time.perf_counter()
+        filas = []
+        for i in range(len(consultas)):
+            fila_distancias = distancias[limites[i]:limites[i + 1]]
+            fila_indices = indices[limites[i]:limites[i + 1]]
+            if filtrar_lapidas:
+                vivos = ~np.isin(fila_indices, self.lapidas)
+                fila_distancias, fila_indices = fila_distancias[vivos], fila_indices[vivos]
+            if exacto and len(fila_indices):
+                fila_distancias, fila_indices = self._reordenar_exacto(
+                    vectores_float32[i:i + 1], fila_indices, len(fila_indices)
+                )
+                dentro = fila_distancias <= distancia_maxima
+                fila_distancias, fila_indices = fila_distancias[dentro], fila_indices[dentro]
+            orden = np.argsort(fila_distancias, kind='stable')[:top_k]
+            filas.append((fila_distancias[orden], fila_indices[orden], None))
+        if exacto:
+            tiempos['reordenamiento'] = tiempos.get('reordenamiento', 0.0) + (time.perf_counter() - inicio) * 1000
+        return filas
+    
+    def _buscar_vecinos(self, consultas, top_k, nprobe, ef_search, reordenar, pesos, fusion,
+                        supervivientes, tiempos):
+        """k vecinos de cada consulta (ver _buscar_consultas)."""
+        factor = self._factor_reordenamiento(reordenar)
+        num_candidatos = top_k * factor if factor > 1 else top_k
+        num_supervivientes = self._supervivientes(supervivientes, top_k) if pesos is None else 0
+        
+        def acumular(etapa, inicio):
+            tiempos[etapa] = tiempos.get(etapa, 0.0) + (time.perf_counter() - inicio) * 1000
+        
+        # Vectores normalizados completos: entrada del indice (si no proyecta)
+        # y base para reordenar, fusionar o evaluar los supervivientes del prefiltro
+        vectores_float32 = None
+        if pesos is not None or factor > 0 or num_supervivientes or self.entrada_normalizada:
+            vectores_float32 = self._normalizar(consultas)
+        entrada = self._entrada_indice(consultas, vectores_float32)
+        
+        if pesos is not None:
+            filas = []
+            for i in range(len(consultas)):
+                parciales = {}
+                distancias, indices, distancias_descriptor = self._buscar_fusion_tardia(
+                    vectores_float32[i:i + 1], max(num_candidatos, 4 * top_k), top_k, pesos, fusion,
+                    nprobe, ef_search, parciales
+                )
+                for etapa, ms in parciales.items():
+                    tiempos[etapa] = tiempos.get(etapa, 0.0) + ms
+                filas.append((distancias[0], indices[0], distancias_descriptor))
+            return filas
+        
+        # Prefiltro por Hamming y busqueda en float solo sobre los supervivientes
+        if num_supervivientes:
+            distancias = np.full((len(consultas), num_candidatos), np.inf, dtype='float32')
+            indices = np.full((len(consultas), num_candidatos), -1, dtype='int64')
+            for i in range(len(consultas)):
+                inicio = time.perf_counter()
+                candidatos = prefiltrar(self.indice_binario, self.transformacion_firma, consultas[i:i + 1],
+                                        num_supervivientes, excluidos=self.lapidas)
+                acumular('prefiltro', inicio)
+                
+                inicio = time.perf_counter()
+                if self.vectores_originales is not None:
+                    fila_distancias, fila_indices = self._reordenar_exacto(
+                        vectores_float32[i:i + 1], candidatos, num_candidatos
+                    )
+                else:
+                    params = parametros_busqueda(self.indice_faiss, nprobe=nprobe, ef_search=ef_search,
+                                                 incluidos=candidatos)
+                    fila_distancias, fila_indices = self.indice_faiss.search(
+                        entrada[i:i + 1], num_candidatos, params=params
+                    )
+                    fila_distancias, fila_indices = fila_distancias[0], fila_indices[0]
+                distancias[i, :len(fila_indices)] = fila_distancias
+                indices[i, :len(fila_indices)] = fila_indices
+                acumular('candidatos', inicio)
+            # Con vectores originales los supervivientes ya se evaluaron con L2 exacta
+            if self.vectores_originales is not None:
+                factor = 0
+        
+        # search retorna (distancias, indices) de los k vecinos de cada fila
+        # (nprobe / efSearch por consulta, sin modificar el indice compartido)
+        else:
+            inicio = time.perf_counter()
+            params = parametros_busqueda(self.indice_faiss, nprobe=nprobe, ef_search=ef_search,
+                                         excluidos=self.lapidas)
+            distancias, indices = self.indice_faiss.search(entrada, num_candidatos, params=params)
+            acumular('candidatos', inicio)
+        
+        # 4: Reordenamiento exacto de cada lista corta
+        if factor > 0:
+            inicio = time.perf_counter()
+            filas = [
+                self._reordenar_exacto(vectores_float32[i:i + 1], indices[i], top_k) + (None,)
+                for i in range(len(consultas))
+            ]
+            acumular('reordenamiento', inicio)
+            return filas
+        return [(distancias[i, :top_k], indices[i, :top_k], None) for i in range(len(consultas))]
+    
+    def _formatear_resultados(self, distancias, indices, distancias_descriptor):
+        """Lista de resultados de una consulta, por similitud descendente."""
+        # Nombres de todos los resultados en una sola busqueda vectorizada
+        nombres = self.mapeo_indices.nombres(indices, defecto="imagen_{id}")
+        resultados = []
+        for i, (dist, idx) in enumerate(zip(distancias, indices)):
+            
+            if idx != -1:
+                nombre_archivo = nombres[i]
+                
+                # Convertir distancia a similitud
+                similitud = np.exp(-dist / ESCALA_SIMILITUD)
+                
+                resultado = {
+                    "posicion": i + 1,
+                    "archivo": nombre_archivo,
+                    "similitud": float(similitud),
+                    "distancia": float(dist),
+                    "indice_faiss": int(idx),
+                    "es_consulta": False  # Porque es una imagen nueva
+                }
+                if distancias_descriptor is not None:
+                    resultado["distancias_descriptor"] = {
+                        nombre: float(distancias_descriptor[b, i])
+                        for b, nombre in enumerate(self.subindices)
+                    }
+                resultados.append(resultado)
+        
+        # Ordenar por similitud descendente
+        resultados.sort(key=lambda x: x["similitud"], reverse=True)
+        return resultados
+    
+    def buscar_por_imagen(self, imagen, extractor, top_k=10, nprobe=None, ef_search=None,
+                          reordenar=None, devolver_tiempos=False, pesos=None, fusion='distancia',
+                          supervivientes=None, distancia_maxima=None, rango=False):
         """
         Flujo CORREGIDO:
         1. Extrae caracteristicas de la imagen
-        2. Normaliza el vector igual que durante el entrenamiento
+        2. Recorta el vector al rango del entrenamiento
         3. Busca DIRECTAMENTE en FAISS sin buscar vector "exacto"
+           (k x r candidatos si hay reordenamiento) con la consulta
+           normalizada; con PCA / OPQ el indice la proyecta con la
+           normalizacion plegada en la misma llamada.
+           Con firmas binarias, antes prefiltra por Hamming y solo busca
+           en float entre los supervivientes
+        4. (Opcional) Reordena los candidatos con L2 exacta
+           o, con pesos, fusiona las listas de los subindices por descriptor
+        
+        Args:
+            top_k (int): Vecinos devueltos (en modo rango, maximo; None = todos)
+            nprobe (int): Listas visitadas en indices IVF (solo esta consulta)
+            ef_search (int): Tamano de la cola de busqueda en HNSW (solo esta consulta)
+            reordenar (int): Factor r de candidatos (0 = una sola etapa, None = configurado)
+            devolver_tiempos (bool): Devolver tambien los tiempos de cada etapa
+            pesos (dict): {descriptor: peso} para fusion tardia por subindices
+                (p. ej. {'LBP': 1, 'HOG': 1, 'GABOR': 1}); None = vector fusionado
+            fusion (str): 'distancia' (suma ponderada) o 'rango' (RRF ponderado)
+            supervivientes (int): Candidatos del prefiltro binario (0 = sin prefiltro,
+                None = configurado)
+            distancia_maxima (float): Descarta resultados mas lejanos (L2 al cuadrado,
+                la misma escala que "distancia")
+            rango (bool): Todos los vectores dentro de distancia_maxima
+                (range_search), en lugar de los k mas cercanos
+        
+        Returns:
+            list: Resultados, o (resultados, tiempos_ms) si devolver_tiempos
         """
         if not self.cargado:
             return {"error": "Sistema no esta cargado. Ejecuta indexacion primero."}
+        error = self._validar_fusion(pesos, fusion, distancia_maxima, rango)
+        if error:
+            return {"error": error}
         
         try:
-            # 1: Extraer caracteristicas de la imagen
-            resultado = extractor.extraer_imagen(imagen)
-            vector_caracteristicas = resultado['vector_completo']
+            tiempos = {}
+            inicio = time.perf_counter()
             
-            print(f"BUSQUEDA POR IMAGEN - Vector length: {len(vector_caracteristicas)}")
+            # 1: Extraer caracteristicas de la imagen (matriz (1, D) float32)
+            vectores, _ = extractor.extraer_lote(imagen[np.newaxis])
+            tiempos['extraccion'] = (time.perf_counter() - inicio) * 1000
             
-            # 2: Normalizar el vector igual que durante el entrenamiento
-            vector_normalizado = (vector_caracteristicas - self.scaler['min']) / self.scaler['range']
-            vector_normalizado = np.clip(vector_normalizado, 0.0, 1.0)
+            print(f"BUSQUEDA POR IMAGEN - Vector length: {vectores.shape[1]}")
             
-            # 3: Busqueda DIRECTA en FAISS
-            vector_float32 = vector_normalizado.astype('float32').reshape(1, -1)
+            # 2: Limpieza y recorte al rango del entrenamiento (equivale a
+            # recortar a [0, 1] tras normalizar; no es lineal y por eso no va
+            # dentro del indice)
+            consulta = self._limpiar_consultas(vectores)
             
-            # search retorna (distancias, indices) de los k vecinos mas cercanos
-            distancias, indices = self.indice_faiss.search(vector_float32, top_k)
+            # 3-4: Busqueda DIRECTA en FAISS (+ reordenamiento o fusion)
+            [fila] = self._buscar_consultas(consulta, top_k, nprobe, ef_search, reordenar, pesos,
+                                            fusion, supervivientes, tiempos, distancia_maxima, rango)
             
-            # 4: Formatear resultados
-            resultados = []
-            for i, (dist, idx) in enumerate(zip(distancias[0], indices[0])):
-                
-                if idx != -1:
-                    nombre_archivo = self.mapeo_indices.get(str(idx), f"imagen_{idx}")
-                    
-                    # Convertir distancia a similitud
-                    similitud = np.exp(-dist / 20.0)
-                    
-                    resultados.append({
-                        "posicion": i + 1,
-                        "archivo": nombre_archivo,
-                        "similitud": float(similitud),
-                        "distancia": float(dist),
-                        "indice_faiss": int(idx),
-                        "es_consulta": False  # Porque es una imagen nueva
-                    })
-            
-            # Ordenar por similitud descendente
-            resultados.sort(key=lambda x: x["similitud"], reverse=True)
+            # 5: Formatear resultados
+            resultados = self._formatear_resultados(*fila)
             
             print(f"BUSQUEDA COMPLETADA - {len(resultados)} resultados")
+            if devolver_tiempos:
+                return resultados, tiempos
             return resultados
             
         except Exception as e:
             return {"error": f"Error en busqueda por imagen: {str(e)}"}
     
+    def buscar_por_lote(self, imagenes, extractor, top_k=10, nprobe=None, ef_search=None,
+                        reordenar=None, pesos=None, fusion='distancia', supervivientes=None,
+                        distancia_maxima=None, rango=False, num_hilos=1):
+        """
+        Busca muchas imagenes preprocesadas en una sola llamada.
+        
+        Flujo:
+        1. Extrae la matriz (N, D) con extraer_lote, repartida en hilos
+        2. Recorta todas las filas al rango del entrenamiento
+        3. Una sola busqueda (N, D) en FAISS, k vecinos o range_search
+           (por fila solo con prefiltro binario o fusion tardia), luego el
+           reordenamiento de cada fila
+        
+        Args:
+            imagenes (numpy.ndarray): Lote (N, H, W) uint8 ya preprocesado
+            num_hilos (int): Hilos de extraccion
+            (resto de parametros: como buscar_por_imagen, para todo el lote)
+        
+        Returns:
+            tuple: (lista de resultados por imagen, tiempos_ms del lote),
+                o {"error": ...}
+        """
+        if not self.cargado:
+            return {"error": "Sistema no esta cargado. Ejecuta indexacion primero."}
+        error = self._validar_fusion(pesos, fusion, distancia_maxima, rango)
+        if error:
+            return {"error": error}
+        
+        try:
+            tiempos = {}
+            
+            # 1: Extraccion del lote completo
+            inicio = time.perf_counter()
+            vectores, _ = extractor.extraer_lote(imagenes, num_hilos=num_hilos)
+            tiempos['extraccion'] = (time.perf_counter() - inicio) * 1000
+            
+            # 2: Limpieza y recorte al rango del entrenamiento
+            consultas = self._limpiar_consultas(vectores)
+            
+            # 3: Busqueda (N, D)
+            filas = self._buscar_consultas(consultas, top_k, nprobe, ef_search, reordenar, pesos,
+                                           fusion, supervivientes, tiempos, distancia_maxima, rango)
+            resultados = [self._formatear_resultados(*fila) for fila in filas]
+            
+            print(f"BUSQUEDA POR LOTE COMPLETADA - {len(resultados)} consultas")
+            return resultados, tiempos
+            
+        except Exception as e:
+            return {"error": f"Error en busqueda por lote: {str(e)}"}
+    
+    def obtener_uso_memoria(self):
+        """
+        Bytes residentes frente a mapeados del indice y de los vectores.
+        
+        Las paginas mapeadas residentes estan en la cache de paginas del
+        sistema y se comparten entre procesos; un indice no mapeado ocupa
+        su tamano completo en la memoria privada de cada proceso.
+        """
+        ruta_indice = f"{self.directorio_version}/faiss_index.bin"
+        ruta_nombres = f"{self.directorio_version}/{ARCHIVO_NOMBRES}"
+        rutas = [ruta_indice, self.ruta_vectores_originales, ruta_nombres]
+        memoria = memoria_mapeada(rutas)
+        
+        tamano_indice = os.path.getsize(ruta_indice) if os.path.exists(ruta_indice) else 0
+        uso_indice = memoria[ruta_indice]
+        if not self.indice_mapeado:
+            uso_indice = {'mapeado_bytes': 0, 'residente_bytes': tamano_indice}
+        
+        uso_vectores = memoria.get(self.ruta_vectores_originales) if self.ruta_vectores_originales else None
+        corpus = getattr(self.vectores_originales, 'corpus', self.vectores_originales)
+        if uso_vectores is not None and not isinstance(corpus, np.memmap):
+            uso_vectores = {'mapeado_bytes': 0, 'residente_bytes': int(self.vectores_originales.nbytes)}
+        
+        uso_nombres = memoria[ruta_nombres]
+        if not isinstance(self.mapeo_indices.blob, np.memmap):
+            uso_nombres = {'mapeado_bytes': 0, 'residente_bytes': self.mapeo_indices.bytes_en_disco()}
+        
+        return {
+            'modo': 'mmap' if self.indice_mapeado else 'privado',
+            'indice': uso_indice,
+            'vectores_originales': uso_vectores,
+            'tabla_nombres': uso_nombres,
+            'rss_proceso_bytes': memoria['rss_proceso_bytes']
+        }
+    
     def obtener_estadisticas(self):
         if not self.cargado:
             return {"estado": "No cargado"}
         
         return {
             "estado": "Cargado y listo",
+            "version": self.version,
             "total_imagenes": self.indice_faiss.ntotal,
             "dimension_vector": self.indice_faiss.d,
-            "tipo_indice": "IndexFlatL2",
+            **describir_indice(self.indice_faiss),
             "metrica": "Distancia Euclidiana (L2)",
-            "normalizacion": "Min-Max [0,1]",
+            "normalizacion": describir_normalizacion(self.indice_faiss),
             "funcion_similitud": "Exponencial (exp(-dist/20.0))",
-            "precision": "Garantizada - Consulta a si misma = 1.0 exacto"
-        }
\ No newline at end of file
+            "factor_reordenamiento": self._factor_reordenamiento(None),
+            "recall_construccion": self.recall,
+            "firma_binaria": (describir_firma(self.firma_binaria, self.indice_faiss.d)
+                              if self.firma_binaria else None),
+            "supervivientes_prefiltro": self._supervivientes(None, 0),
+            "subindices": {n: l for n, (_, l) in self.disposicion_subindices.items()},
+            "proyeccion": (describir_proyeccion(self.descripcion_proyeccion, self.indice_faiss.ntotal)
+                           if self.descripcion_proyeccion else None),
+            "precision": "Garantizada - Consulta a si misma = 1.0 exacto",
+            "memoria": self.obtener_uso_memoria()
+        }
+
+class ServicioBusqueda:
+    """
+    Buscador compartido del servidor con recarga en caliente.
+    
+    Cada version publicada se carga en un SistemaBusqueda nuevo, sin tocar
+    el que atiende las peticiones, y luego se reemplaza la referencia
+    (asignacion atomica). Las peticiones en curso terminan con la version
+    con la que empezaron; las siguientes usan la nueva. No hay ventana sin
+    indice ni mezcla de archivos de dos versiones.
+    
+    Cada consulta comprueba el puntero ACTUAL (a lo sumo una vez por
+    `intervalo_comprobacion` segundos); si otro proceso publico una version,
+    se carga en un hilo aparte mientras se sigue respondiendo con la anterior.
+    
+    Los demas atributos (cargado, obtener_estadisticas, ...) se delegan en
+    el SistemaBusqueda vigente.
+    """
+    
+    def __init__(self, directorio_indices='datos/indices', intervalo_comprobacion=1.0, **opciones):
+        self.directorio_indices = directorio_indices
+        self.intervalo_comprobacion = intervalo_comprobacion
+        self.opciones = opciones
+        self.bloqueo_recarga = threading.Lock()
+        self.ultima_comprobacion = time.monotonic()
+        self.actual = SistemaBusqueda(directorio_indices, **opciones)
+    
+    def __getattr__(self, nombre):
+        return getattr(self.actual, nombre)
+    
+    def cargar_indices(self):
+        """
+        Carga la version publicada y la pone en servicio (sincrono).
+        
+        Returns:
+            bool: True si la nueva version quedo en servicio
+        """
+        with self.bloqueo_recarga:
+            nuevo = SistemaBusqueda(self.directorio_indices, **self.opciones)
+            if not nuevo.cargado:
+                print("Recarga fallida: se mantiene la version en servicio")
+                return False
+            # Intercambio atomico de la referencia
+            self.actual = nuevo
+            return True
+    
+    def comprobar_version(self):
+        """
+        Lanza la recarga en segundo plano si el puntero ACTUAL cambio.
+        
+        Returns:
+            bool: True si se inicio una recarga
+        """
+        ahora = time.monotonic()
+        if ahora - self.ultima_comprobacion < self.intervalo_comprobacion:
+            return False
+        self.ultima_comprobacion = ahora
+        
+        if version_actual(self.directorio_indices) == self.actual.version or self.bloqueo_recarga.locked():
+            return False
+        threading.Thread(target=self.cargar_indices, daemon=True).start()
+        return True
+    
+    def buscar_por_imagen(self, *args, **kwargs):
+        """SistemaBusqueda.buscar_por_imagen sobre la version vigente."""
+        self.comprobar_version()
+        return self.actual.buscar_por_imagen(*args, **kwargs)
+    
+    def buscar_por_lote(self, *args, **kwargs):
+        """SistemaBusqueda.buscar_por_lote sobre la version vigente."""
+        self.comprobar_version()
+        return self.actual.buscar_por_lote(*args, **kwargs)
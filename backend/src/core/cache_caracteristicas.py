@@ -0,0 +1,207 @@
+"""
+Cache persistente de caracteristicas indexada por contenido de imagen.
+Evita recalcular LBP/HOG/Gabor de imagenes que no han cambiado.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+
+def hash_contenido(datos):
+    """Hash SHA-256 de los bytes de una imagen (archivo codificado)."""
+    return hashlib.sha256(datos).hexdigest()
+
+
+def hash_configuracion(configuracion):
+    """Hash estable de la configuracion de los extractores."""
+    texto = json.dumps(configuracion, sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+
+
+class CacheCaracteristicas:
+    """
+    Cache en disco (SQLite) de vectores de caracteristicas.
+
+    Clave: (hash del contenido de la imagen, hash de la configuracion de
+    los extractores). Si cambia un parametro (p. ej. radio de LBP o las
+    frecuencias de Gabor) las entradas antiguas dejan de coincidir y se
+    desalojan por antiguedad.
+
+    Las entradas se confirman en disco cada `intervalo_commit` escrituras,
+    de modo que una extraccion interrumpida se reanuda donde se detuvo.
+
+    Attributes:
+        ruta (str): Ruta del archivo SQLite
+        hash_config (str): Hash de la configuracion de extractores activa
+        limite_bytes (int): Tamano maximo de los vectores almacenados
+        aciertos (int): Consultas resueltas desde la cache
+        fallos (int): Consultas que requirieron extraer
+        desalojos (int): Entradas eliminadas por limite de tamano
+    """
+
+    def __init__(self, ruta, configuracion, limite_bytes=2 * 1024**3, intervalo_commit=64):
+        self.ruta = ruta
+        self.hash_config = hash_configuracion(configuracion)
+        self.limite_bytes = limite_bytes
+        self.intervalo_commit = intervalo_commit
+
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self._pendientes = 0
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        self.conexion = sqlite3.connect(ruta)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("""
+            CREATE TABLE IF NOT EXISTS caracteristicas (
+                hash_contenido TEXT NOT NULL,
+                hash_config TEXT NOT NULL,
+                longitudes TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                tamano INTEGER NOT NULL,
+                ultimo_acceso REAL NOT NULL,
+                PRIMARY KEY (hash_contenido, hash_config)
+            )
+        """)
+        self.conexion.execute(
+            "CREATE INDEX IF NOT EXISTS idx_acceso ON caracteristicas (ultimo_acceso)"
+        )
+        self.conexion.commit()
+        self.tamano_total = self.conexion.execute(
+            "SELECT COALESCE(SUM(tamano), 0) FROM caracteristicas"
+        ).fetchone()[0]
+
+    def contiene(self, hash_imagen):
+        """
+        Indica si la imagen esta en cache sin leer el vector.
+        Cuenta el fallo si no esta; el acierto se cuenta al obtenerla.
+        """
+        presente = self.conexion.execute(
+            "SELECT 1 FROM caracteristicas WHERE hash_contenido = ? AND hash_config = ?",
+            (hash_imagen, self.hash_config)
+        ).fetchone() is not None
+        if not presente:
+            self.fallos += 1
+        return presente
+
+    def obtener(self, hash_imagen):
+        """
+        Busca las caracteristicas de una imagen.
+
+        Returns:
+            dict: {nombre_descriptor: np.ndarray} en orden, o None si no esta
+        """
+        fila = self.conexion.execute(
+            "SELECT longitudes, vector FROM caracteristicas "
+            "WHERE hash_contenido = ? AND hash_config = ?",
+            (hash_imagen, self.hash_config)
+        ).fetchone()
+
+        if fila is None:
+            self.fallos += 1
+            return None
+
+        self.aciertos += 1
+        self.conexion.execute(
+            "UPDATE caracteristicas SET ultimo_acceso = ? "
+            "WHERE hash_contenido = ? AND hash_config = ?",
+            (time.time(), hash_imagen, self.hash_config)
+        )
+        self._registrar_escritura()
+
+        # Reconstruir descriptores a partir del vector concatenado
+        longitudes = json.loads(fila[0])
+        vector = np.frombuffer(fila[1], dtype=np.float64)
+        descriptores = {}
+        inicio = 0
+        for nombre, longitud in longitudes:
+            descriptores[nombre] = vector[inicio:inicio + longitud]
+            inicio += longitud
+        return descriptores
+
+    def guardar(self, hash_imagen, descriptores):
+        """
+        Almacena las caracteristicas de una imagen.
+
+        Args:
+            hash_imagen (str): Hash del contenido de la imagen
+            descriptores (dict): {nombre_descriptor: vector} en orden
+        """
+        longitudes = [[nombre, len(v)] for nombre, v in descriptores.items()]
+        vector = np.concatenate(
+            [np.asarray(v, dtype=np.float64) for v in descriptores.values()]
+        ).tobytes()
+
+        anterior = self.conexion.execute(
+            "SELECT tamano FROM caracteristicas WHERE hash_contenido = ? AND hash_config = ?",
+            (hash_imagen, self.hash_config)
+        ).fetchone()
+        if anterior is not None:
+            self.tamano_total -= anterior[0]
+
+        self.conexion.execute(
+            "INSERT OR REPLACE INTO caracteristicas VALUES (?, ?, ?, ?, ?, ?)",
+            (hash_imagen, self.hash_config, json.dumps(longitudes),
+             vector, len(vector), time.time())
+        )
+        self.tamano_total += len(vector)
+
+        if self.tamano_total > self.limite_bytes:
+            self._desalojar()
+        self._registrar_escritura()
+
+    def _desalojar(self):
+        """
+        Elimina las entradas menos usadas recientemente hasta quedar
+        por debajo del 90% del limite.
+        """
+        objetivo = int(self.limite_bytes * 0.9)
+        filas = self.conexion.execute(
+            "SELECT hash_contenido, hash_config, tamano FROM caracteristicas "
+            "ORDER BY ultimo_acceso ASC"
+        )
+        eliminar = []
+        for hash_imagen, hash_config, tamano in filas:
+            if self.tamano_total <= objetivo:
+                break
+            eliminar.append((hash_imagen, hash_config))
+            self.tamano_total -= tamano
+
+        self.conexion.executemany(
+            "DELETE FROM caracteristicas WHERE hash_contenido = ? AND hash_config = ?",
+            eliminar
+        )
+        self.desalojos += len(eliminar)
+
+    def _registrar_escritura(self):
+        self._pendientes += 1
+        if self._pendientes >= self.intervalo_commit:
+            self.conexion.commit()
+            self._pendientes = 0
+
+    def cerrar(self):
+        """Confirma escrituras pendientes y cierra la conexion."""
+        if self.conexion is not None:
+            self.conexion.commit()
+            self.conexion.close()
+            self.conexion = None
+
+    def obtener_estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            'desalojos': self.desalojos,
+            'tamano_bytes': self.tamano_total,
+            'limite_bytes': self.limite_bytes
+        }
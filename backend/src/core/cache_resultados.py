@@ -0,0 +1,245 @@
+"""
+Cache de resultados de busqueda indexada por contenido de la consulta.
+Evita decodificar, preprocesar, extraer y buscar de nuevo una imagen ya
+consultada contra la misma version del indice.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src.core.cache_caracteristicas import hash_configuracion
+
+
+def clave_resultados(hash_imagen, version, parametros):
+    """
+    Clave de una consulta: hash de los bytes subidos + version del indice
+    + parametros de busqueda (top_k, nprobe, pesos, ...).
+    """
+    return f"{hash_imagen}:{version}:{hash_configuracion(parametros)}"
+
+
+class CacheResultados:
+    """
+    Cache LRU en memoria con caducidad (TTL) y limite de bytes, con un
+    nivel opcional en disco (SQLite) compartido entre procesos.
+
+    Las entradas llevan la version del indice en la clave y como columna:
+    al observar una version distinta se vacia el nivel en memoria y se
+    borran del disco las entradas de otras versiones. El tamano de una
+    entrada es el de su JSON (lo mismo que se guarda en disco).
+
+    Attributes:
+        limite_bytes (int): Tamano maximo del nivel en memoria (0 = desactivada)
+        ttl (float): Segundos de validez de una entrada (None = sin caducidad)
+        ruta_disco (str): Archivo SQLite del nivel compartido (None = solo memoria)
+        version (str): Version del indice de las entradas vigentes
+        aciertos (int): Consultas resueltas desde la cache (memoria o disco)
+        aciertos_disco (int): Aciertos servidos por el nivel en disco
+        fallos (int): Consultas que requirieron buscar
+        ms_ahorrados (float): Tiempo de calculo evitado por los aciertos
+        desalojos (int): Entradas eliminadas por limite de tamano
+        expiradas (int): Entradas descartadas por TTL
+        invalidaciones (int): Cambios de version observados
+    """
+
+    # Cada cuantas escrituras se purgan del disco las entradas caducadas
+    INTERVALO_PURGA = 256
+
+    def __init__(self, limite_bytes=64 * 1024**2, ttl=3600.0, ruta_disco=None):
+        self.limite_bytes = limite_bytes
+        self.ttl = ttl
+        self.ruta_disco = ruta_disco
+        self.version = None
+
+        self.aciertos = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        self.ms_ahorrados = 0.0
+        self.desalojos = 0
+        self.expiradas = 0
+        self.invalidaciones = 0
+
+        # clave -> (resultado, tamano, creado, tiempo_ms)
+        self._entradas = OrderedDict()
+        self.tamano_total = 0
+        self._bloqueo = threading.Lock()
+
+        self.conexion = None
+        if ruta_disco:
+            directorio = os.path.dirname(ruta_disco)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            self._abrir_disco()
+        self._escrituras_disco = 0
+
+    def _abrir_disco(self):
+        # Una conexion compartida por los hilos, serializada con el bloqueo
+        self.conexion = sqlite3.connect(self.ruta_disco, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("""
+            CREATE TABLE IF NOT EXISTS resultados (
+                clave TEXT PRIMARY KEY,
+                version TEXT,
+                resultado TEXT NOT NULL,
+                tiempo_ms REAL NOT NULL,
+                creado REAL NOT NULL
+            )
+        """)
+        self.conexion.execute("CREATE INDEX IF NOT EXISTS idx_creado ON resultados (creado)")
+        self.conexion.commit()
+
+    def reabrir(self):
+        """
+        Tras un fork: bloqueo y conexion SQLite propios del proceso hijo.
+        Una conexion abierta no se puede usar desde dos procesos; la heredada
+        se abandona sin cerrarla (cerrarla liberaria los bloqueos del padre).
+        """
+        self._bloqueo = threading.Lock()
+        if self.ruta_disco:
+            self._abrir_disco()
+
+    @property
+    def activa(self):
+        return self.limite_bytes > 0
+
+    def _vigente(self, creado):
+        return self.ttl is None or time.time() - creado <= self.ttl
+
+    def sincronizar_version(self, version):
+        """
+        Invalida las entradas de otras versiones del indice.
+
+        Returns:
+            bool: True si la version cambio
+        """
+        with self._bloqueo:
+            if version == self.version:
+                return False
+            self.version = version
+            self._entradas.clear()
+            self.tamano_total = 0
+            self.invalidaciones += 1
+            if self.conexion is not None:
+                self.conexion.execute("DELETE FROM resultados WHERE version IS NOT ?", (version,))
+                self.conexion.commit()
+            return True
+
+    def obtener(self, clave):
+        """
+        Busca un resultado: primero en memoria, luego en disco (y lo sube a memoria).
+
+        Returns:
+            Resultado guardado, o None si no esta o caduco
+        """
+        if not self.activa:
+            return None
+
+        with self._bloqueo:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                resultado, tamano, creado, tiempo_ms = entrada
+                if self._vigente(creado):
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    self.ms_ahorrados += tiempo_ms
+                    return resultado
+                del self._entradas[clave]
+                self.tamano_total -= tamano
+                self.expiradas += 1
+
+            if self.conexion is not None:
+                fila = self.conexion.execute(
+                    "SELECT resultado, tiempo_ms, creado FROM resultados WHERE clave = ?", (clave,)
+                ).fetchone()
+                if fila is not None and self._vigente(fila[2]):
+                    resultado = json.loads(fila[0])
+                    self._insertar(clave, resultado, len(fila[0]), fila[2], fila[1])
+                    self.aciertos += 1
+                    self.aciertos_disco += 1
+                    self.ms_ahorrados += fila[1]
+                    return resultado
+                if fila is not None:
+                    self.conexion.execute("DELETE FROM resultados WHERE clave = ?", (clave,))
+                    self.conexion.commit()
+                    self.expiradas += 1
+
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, resultado, tiempo_ms):
+        """
+        Guarda el resultado de una consulta.
+
+        Args:
+            clave (str): clave_resultados(...)
+            resultado: Valor serializable a JSON
+            tiempo_ms (float): Lo que costo calcularlo (se suma a ms_ahorrados en cada acierto)
+        """
+        if not self.activa:
+            return
+        texto = json.dumps(resultado, separators=(',', ':'))
+        creado = time.time()
+        with self._bloqueo:
+            self._insertar(clave, resultado, len(texto), creado, tiempo_ms)
+            if self.conexion is not None:
+                self.conexion.execute(
+                    "INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?)",
+                    (clave, self.version, texto, tiempo_ms, creado)
+                )
+                self._escrituras_disco += 1
+                if self.ttl is not None and self._escrituras_disco % self.INTERVALO_PURGA == 0:
+                    self.conexion.execute("DELETE FROM resultados WHERE creado < ?", (creado - self.ttl,))
+                self.conexion.commit()
+
+    def _insertar(self, clave, resultado, tamano, creado, tiempo_ms):
+        """Inserta en memoria y desaloja las menos usadas recientemente (con el bloqueo tomado)."""
+        if tamano > self.limite_bytes:
+            return
+        anterior = self._entradas.pop(clave, None)
+        if anterior is not None:
+            self.tamano_total -= anterior[1]
+        self._entradas[clave] = (resultado, tamano, creado, tiempo_ms)
+        self.tamano_total += tamano
+
+        while self.tamano_total > self.limite_bytes:
+            _, (_, tamano_desalojado, _, _) = self._entradas.popitem(last=False)
+            self.tamano_total -= tamano_desalojado
+            self.desalojos += 1
+
+    def limpiar(self):
+        """Vacia ambos niveles."""
+        with self._bloqueo:
+            self._entradas.clear()
+            self.tamano_total = 0
+            if self.conexion is not None:
+                self.conexion.execute("DELETE FROM resultados")
+                self.conexion.commit()
+
+    def cerrar(self):
+        if self.conexion is not None:
+            self.conexion.close()
+            self.conexion = None
+
+    def obtener_estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            'activa': self.activa,
+            'version_indice': self.version,
+            'aciertos': self.aciertos,
+            'aciertos_disco': self.aciertos_disco,
+            'fallos': self.fallos,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            'ms_ahorrados': self.ms_ahorrados,
+            'entradas': len(self._entradas),
+            'tamano_bytes': self.tamano_total,
+            'limite_bytes': self.limite_bytes,
+            'ttl_s': self.ttl,
+            'desalojos': self.desalojos,
+            'expiradas': self.expiradas,
+            'invalidaciones': self.invalidaciones,
+            'disco': self.ruta_disco
+        }
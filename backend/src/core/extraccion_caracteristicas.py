@@ -1,9 +1,18 @@
 import cv2
 import numpy as np
-from skimage import feature, filters
+from skimage import feature
 import os
 from tqdm import tqdm
 import json
+import copy
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core.banco_gabor import BancoGaborFFT
+from src.core.lbp_rapido import LBPUniformeRapido
+from src.core.almacen_caracteristicas import AlmacenCaracteristicas
+from src.core.cache_caracteristicas import CacheCaracteristicas, hash_contenido
 
 
 class ExtractorLBP:
@@ -23,6 +32,18 @@ class ExtractorLBP:
         self.num_puntos = num_puntos
         self.radio = radio
         self.metodo = metodo
+        # Bins del histograma: 0..num_puntos+1
+        self.dimension = num_puntos + 2
+        
+        # Motor vectorizado para 'uniform' (mismos codigos que skimage)
+        self.motor = LBPUniformeRapido(num_puntos, radio) if metodo == "uniform" else None
+
+    def configuracion(self):
+        return {'num_puntos': self.num_puntos, 'radio': self.radio, 'metodo': self.metodo}
+
+    def __reduce__(self):
+        # Se reconstruye desde sus parametros al enviarlo a otro proceso
+        return (type(self), (self.num_puntos, self.radio, self.metodo))
 
     def extraer(self, imagen):
         """
@@ -30,7 +51,12 @@ class ExtractorLBP:
         1. Calcula LBP en cada pixel comparando con vecinos
         2. Genera histograma de patrones LBP
         3. Normaliza histograma (suma = 1)
+        
+        Con metodo 'uniform' usa LBPUniformeRapido (pesos precalculados y
+        bincount); el resto de metodos usa skimage.
         """
+        if self.motor is not None:
+            return self.motor.histogramas(imagen)
         
         # 1: Calcular LBP en cada pixel
         # local_binary_pattern compara cada pixel con sus vecinos circulares
@@ -58,6 +84,21 @@ class ExtractorLBP:
             hist = np.ones_like(hist) / len(hist)
             
         return hist
+
+    def extraer_lote(self, imagenes):
+        """
+        Extrae el histograma LBP de un lote (N, H, W).
+        
+        Returns:
+            numpy.ndarray: Matriz (N, num_puntos + 2)
+        """
+        if self.motor is not None:
+            return self.motor.histogramas(imagenes)
+        
+        salida = np.empty((len(imagenes), self.dimension), dtype=np.float64)
+        for i, imagen in enumerate(imagenes):
+            salida[i] = self.extraer(imagen)
+        return salida
     
 
 class ExtractorHOG:
@@ -91,6 +132,20 @@ class ExtractorHOG:
             self.tamano_celda,
             self.nbins
         )
+        self.dimension = self.hog.getDescriptorSize()
+
+    def configuracion(self):
+        return {
+            'tamano_ventana': self.tamano_ventana,
+            'tamano_bloque': self.tamano_bloque,
+            'paso_bloque': self.paso_bloque,
+            'tamano_celda': self.tamano_celda,
+            'nbins': self.nbins
+        }
+
+    def __reduce__(self):
+        # cv2.HOGDescriptor no se serializa: se construye de nuevo
+        return (type(self), ())
 
     def extraer(self, imagen):
         """
@@ -112,6 +167,18 @@ class ExtractorHOG:
         # 3: Aplanar a vector unidimensional
         return caracteristicas.flatten()
 
+    def extraer_lote(self, imagenes):
+        """
+        Extrae el descriptor HOG de un lote (N, H, W).
+        
+        Returns:
+            numpy.ndarray: Matriz (N, dimension) en float32 (tipo nativo de OpenCV)
+        """
+        salida = np.empty((len(imagenes), self.dimension), dtype=np.float32)
+        for i, imagen in enumerate(imagenes):
+            salida[i] = self.hog.compute(cv2.resize(imagen, self.tamano_ventana)).ravel()
+        return salida
+
 
 class ExtractorGabor:
     """
@@ -133,35 +200,40 @@ class ExtractorGabor:
         # Calcular angulos uniformemente distribuidos en [0, pi)
         # Por ejemplo, para 4 orientaciones: [0, pi/4, pi/2, 3pi/4]
         self.angulos = [i * np.pi / orientaciones for i in range(orientaciones)]
+        
+        # Banco de kernels precalculado una sola vez (convolucion via FFT)
+        self.banco = BancoGaborFFT(self.frecuencias, self.angulos)
+        self.dimension = 2 * self.banco.num_filtros
+
+    def configuracion(self):
+        return {'frecuencias': list(self.frecuencias), 'orientaciones': self.orientaciones}
+
+    def __reduce__(self):
+        # El banco FFT se recalcula desde sus parametros
+        return (type(self), (list(self.frecuencias), self.orientaciones))
 
     def extraer(self, imagen):
         """
         Flujo:
         1. Para cada combinacion (frecuencia, orientacion):
-           a. Aplica filtro Gabor
+           a. Aplica filtro Gabor (banco FFT precalculado)
            b. Calcula magnitud de respuesta
            c. Extrae media y desviacion estandar
         2. Concatena todas las estadisticas
-        """
-        caracteristicas = []
         
-        for frecuencia in self.frecuencias:
-            for theta in self.angulos:
-                
-                # 1: Aplicar filtro Gabor
-                filtro_real, filtro_imag = filters.gabor(
-                    imagen, 
-                    frequency=frecuencia, 
-                    theta=theta
-                )
-                
-                # 2: Calcular magnitud de la respuesta compleja
-                magnitud = np.sqrt(filtro_real**2 + filtro_imag**2)
-                
-                # 3: Extraer estadisticas de la magnitud
-                caracteristicas.extend([np.mean(magnitud), np.std(magnitud)])
+        Equivale a aplicar skimage.filters.gabor por cada par dentro de
+        la tolerancia documentada en src/core/banco_gabor.py.
+        """
+        return self.banco.estadisticas(imagen)
+
+    def extraer_lote(self, imagenes):
+        """
+        Extrae las estadisticas Gabor de un lote (N, H, W).
         
-        return np.array(caracteristicas)
+        Returns:
+            numpy.ndarray: Matriz (N, 2 * frecuencias * orientaciones)
+        """
+        return self.banco.estadisticas(imagenes)
 
 
 class ExtractorMasivo:
@@ -170,12 +242,34 @@ class ExtractorMasivo:
     masiva de caracteristicas de huellas dactilares.
     """
     
-    def __init__(self):
-        self.extractores = {
-            'LBP': ExtractorLBP(),
-            'HOG': ExtractorHOG(),
-            'GABOR': ExtractorGabor()
-        }
+    def __init__(self, extractores=None):
+        if extractores is None:
+            extractores = {
+                'LBP': ExtractorLBP(),
+                'HOG': ExtractorHOG(),
+                'GABOR': ExtractorGabor()
+            }
+        self.extractores = extractores
+        
+        # Disposicion del vector completo: {descriptor: (desplazamiento, longitud)}
+        self.disposicion = {}
+        desplazamiento = 0
+        for nombre, extractor in self.extractores.items():
+            self.disposicion[nombre] = (desplazamiento, extractor.dimension)
+            desplazamiento += extractor.dimension
+        self.dimension = desplazamiento
+
+        # Copias por hilo para extraer_lote concurrente
+        self._local = threading.local()
+
+    def configuracion(self):
+        """Parametros de todos los extractores (clave de la cache de caracteristicas)."""
+        return {nombre: extractor.configuracion() for nombre, extractor in self.extractores.items()}
+
+    def __reduce__(self):
+        # Viaja a los procesos trabajadores con su configuracion (no con sus
+        # objetos de OpenCV ni las copias por hilo)
+        return (type(self), (self.extractores,))
 
     def extraer_imagen(self, imagen):
         """
@@ -184,13 +278,79 @@ class ExtractorMasivo:
         2. Almacena caracteristicas individuales
         3. Concatena todo en un vector unificado
         """
+        return self._formatear_resultado({
+            nombre: extractor.extraer(imagen)
+            for nombre, extractor in self.extractores.items()
+        })
+
+    def instancia_hilo(self):
+        """
+        Copia del extractor propia del hilo actual, de un lote o de peticion
+        del servidor (el HOGDescriptor de OpenCV guarda buffers internos y
+        no se comparte entre hilos).
+        """
+        if not hasattr(self._local, 'extractor'):
+            self._local.extractor = copy.deepcopy(self)
+        return self._local.extractor
+
+    def extraer_lote(self, imagenes, num_hilos=1):
+        """
+        Extrae el vector completo de un lote de imagenes sin objetos Python
+        por elemento.
+        
+        Flujo:
+        1. Reserva la matriz de salida (N, D) en float32
+        2. Cada extractor escribe su bloque de columnas segun la disposicion
+           (con num_hilos > 1, cada hilo procesa un tramo contiguo de filas;
+           OpenCV y las FFT de NumPy liberan el GIL)
+        
+        Args:
+            imagenes (numpy.ndarray): Lote (N, H, W) uint8 o una imagen (H, W)
+            num_hilos (int): Hilos de extraccion (1 = en el hilo actual)
+            
+        Returns:
+            tuple: (matriz, disposicion)
+                - matriz: np.ndarray (N, D) float32
+                - disposicion: {descriptor: (desplazamiento, longitud)}
+        """
+        imagenes = np.asarray(imagenes)
+        if imagenes.ndim == 2:
+            imagenes = imagenes[np.newaxis]
+
+        # 1: Matriz de salida
+        matriz = np.empty((len(imagenes), self.dimension), dtype=np.float32)
+
+        # 2: Tramos de filas en paralelo, cada hilo con su copia del extractor
+        num_hilos = min(num_hilos or 1, len(imagenes))
+        if num_hilos > 1:
+            limites = np.linspace(0, len(imagenes), num_hilos + 1).astype(int)
+
+            def extraer_tramo(inicio, fin):
+                matriz[inicio:fin] = self.instancia_hilo().extraer_lote(imagenes[inicio:fin])[0]
+
+            with ThreadPoolExecutor(num_hilos) as ejecutor:
+                list(ejecutor.map(extraer_tramo, limites[:-1], limites[1:]))
+            return matriz, self.disposicion
+
+        # 2: Bloques por descriptor
+        for nombre, extractor in self.extractores.items():
+            inicio, longitud = self.disposicion[nombre]
+            matriz[:, inicio:inicio + longitud] = extractor.extraer_lote(imagenes)
+
+        return matriz, self.disposicion
+
+    def separar_descriptores(self, vector):
+        """Divide un vector completo en {descriptor: segmento} segun la disposicion."""
+        return {
+            nombre: vector[inicio:inicio + longitud]
+            for nombre, (inicio, longitud) in self.disposicion.items()
+        }
+
+    def _formatear_resultado(self, descriptores):
         caracteristicas = {}
         vector_completo = []
 
-        # Aplicar
-        for nombre, extractor in self.extractores.items():
-            # Extraer caracteristicas con el descriptor actual
-            caracteristicas_ext = extractor.extraer(imagen)
+        for nombre, caracteristicas_ext in descriptores.items():
             # Convertir a lista de floats (para serializacion JSON)
             caracteristicas[nombre] = [float(x) for x in caracteristicas_ext.tolist()]
             # Agregar al vector completo
@@ -201,22 +361,147 @@ class ExtractorMasivo:
             'vector_completo': vector_completo
         }
 
-    def extraer_directorio(self, directorio_imagenes, ruta_salida_json=None, ruta_salida_vectores=None):
+    def procesar_archivo(self, directorio_imagenes, archivo):
+        """
+        Lee y extrae una imagen sin propagar errores.
+        
+        Returns:
+            tuple: (archivo, vector, error)
+                - vector: Fila float32 de extraer_lote o None si fallo
+                - error: Mensaje de error o None
+        """
+        ruta_imagen = os.path.join(directorio_imagenes, archivo)
+        try:
+            imagen = cv2.imread(ruta_imagen, cv2.IMREAD_GRAYSCALE)
+            if imagen is None:
+                return archivo, None, "No se pudo leer la imagen"
+            
+            matriz, _ = self.extraer_lote(imagen)
+            return archivo, matriz[0], None
+        except Exception as e:
+            return archivo, None, str(e)
+
+    def listar_imagenes(self, directorio_imagenes):
+        """Imagenes .png del directorio en el orden de os.listdir."""
+        return [
+            f for f in os.listdir(directorio_imagenes) 
+            if f.endswith('.png')
+        ]
+
+    def iterar_extraccion(self, directorio_imagenes, archivos_imagenes, num_procesos=1,
+                          tamano_chunk=16, ruta_cache=None, errores=None):
+        """
+        Genera (archivo, vector) en el mismo orden de `archivos_imagenes`.
+        
+        Flujo:
+        1. (Con cache) calcula el hash de cada imagen y separa las pendientes
+        2. Extrae las pendientes en secuencial o en un pool de procesos
+        3. Intercala aciertos de cache y extracciones respetando el orden
+           (una entrada desalojada entre la consulta inicial y su lectura
+           se extrae en el momento)
+        
+        Las imagenes que fallan se omiten y se anotan en `errores`.
+        Solo mantiene en memoria los hashes, no los vectores.
+        
+        Yields:
+            tuple: (archivo, vector float32 de longitud `dimension`)
+        """
+        errores = errores if errores is not None else []
+
+        # 1: Cache: resolver primero las imagenes ya extraidas con esta configuracion
+        cache = None
+        hashes = {}
+        pendientes = archivos_imagenes
+        if ruta_cache:
+            cache = CacheCaracteristicas(ruta_cache, self.configuracion())
+            pendientes = []
+            for archivo in archivos_imagenes:
+                with open(os.path.join(directorio_imagenes, archivo), 'rb') as f:
+                    hashes[archivo] = hash_contenido(f.read())
+                if not cache.contiene(hashes[archivo]):
+                    pendientes.append(archivo)
+            print(f"Cache de caracteristicas: {len(archivos_imagenes) - len(pendientes)} recuperadas, "
+                  f"{len(pendientes)} por extraer")
+
+        if num_procesos is None:
+            num_procesos = os.cpu_count() or 1
+        num_procesos = max(1, min(num_procesos, len(pendientes) or 1))
+        
+        print(f"Extrayendo caracteristicas de {len(pendientes)} imagenes "
+              f"({num_procesos} proceso(s))...")
+
+        # 2: Procesar cada imagen pendiente (imap conserva el orden)
+        if num_procesos > 1:
+            pool = multiprocessing.Pool(num_procesos, initializer=_inicializar_trabajador,
+                                        initargs=(self,))
+            tareas = ((directorio_imagenes, archivo) for archivo in pendientes)
+            procesados = pool.imap(_procesar_archivo_trabajador, tareas, chunksize=tamano_chunk)
+        else:
+            pool = None
+            procesados = (self.procesar_archivo(directorio_imagenes, archivo) for archivo in pendientes)
+        procesados = iter(tqdm(procesados, total=len(pendientes), desc="Extraccion"))
+
+        # 3: Intercalar en el orden del listado, asi las filas de salida
+        # quedan alineadas con los metadatos igual que en el modo secuencial
+        pendientes = set(pendientes)
+        try:
+            for archivo in archivos_imagenes:
+                if archivo not in pendientes:
+                    descriptores = cache.obtener(hashes[archivo])
+                    if descriptores is not None:
+                        yield archivo, np.concatenate(
+                            [descriptores[nombre] for nombre in self.disposicion]
+                        ).astype(np.float32)
+                        continue
+                    # Desalojada durante esta misma ejecucion (los guardados
+                    # anteriores superaron el limite): se extrae aqui mismo
+                    archivo, vector, error = self.procesar_archivo(directorio_imagenes, archivo)
+                else:
+                    archivo, vector, error = next(procesados)
+                if vector is None:
+                    # Una imagen fallida no detiene la extraccion
+                    errores.append({'archivo': archivo, 'error': error})
+                    continue
+                if cache is not None:
+                    # Se guarda de inmediato para poder reanudar si se interrumpe
+                    cache.guardar(hashes[archivo], self.separar_descriptores(vector))
+                yield archivo, vector
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            if cache is not None:
+                cache.cerrar()
+                print(f"Estadisticas de cache: {cache.obtener_estadisticas()}")
+
+            if errores:
+                print(f"Imagenes con error: {len(errores)}")
+                for item in errores[:10]:
+                    print(f"   {item['archivo']}: {item['error']}")
+
+    def extraer_directorio(self, directorio_imagenes, ruta_salida_json=None, ruta_salida_vectores=None,
+                           num_procesos=1, tamano_chunk=16, ruta_cache=None):
         """
         Extrae caracteristicas de todas las imagenes en un directorio.
         
+        Mantiene todo en memoria y escribe JSON + .npy al final; para
+        corpus grandes usar extraer_directorio_a_almacen.
+        
         Flujo:
         1. Lista todas las imagenes .png del directorio
-        2. Para cada imagen:
-           a. Lee la imagen
+        2. Para cada imagen (ver iterar_extraccion):
+           a. Lee la imagen (o la recupera de la cache)
            b. Extrae caracteristicas
-           c. Almacena resultados
+           c. Almacena resultados (en el mismo orden del listado)
         3. Guarda resultados
         
         Args:
             directorio_imagenes (str): Directorio con imagenes preprocesadas
             ruta_salida_json (str): Ruta para guardar metadatos en JSON (opcional)
             ruta_salida_vectores (str): Ruta para guardar matriz NumPy (opcional)
+            num_procesos (int): Procesos trabajadores (1 = secuencial, None = todos los nucleos)
+            tamano_chunk (int): Imagenes enviadas a cada trabajador por tarea
+            ruta_cache (str): Archivo SQLite de la cache de caracteristicas (opcional)
             
         Returns:
             tuple: (resultados, vectores_caracteristicas)
@@ -225,30 +510,19 @@ class ExtractorMasivo:
         """
         
         # 1: Listar todas las imagenes preprocesadas
-        archivos_imagenes = [
-            f for f in os.listdir(directorio_imagenes) 
-            if f.endswith('.png')
-        ]
-        
-        print(f"Extrayendo caracteristicas de {len(archivos_imagenes)} imagenes...")
+        archivos_imagenes = self.listar_imagenes(directorio_imagenes)
 
         resultados = []
         vectores_caracteristicas = []
 
         # 2: Procesar cada imagen
-        for archivo in tqdm(archivos_imagenes, desc="Extraccion"):
-
-            ruta_imagen = os.path.join(directorio_imagenes, archivo)
-            imagen = cv2.imread(ruta_imagen, cv2.IMREAD_GRAYSCALE)
-
-            if imagen is not None:
-                # Extraer caracteristicas
-                resultado = self.extraer_imagen(imagen)
-                # Agregar metadato del nombre de archivo
-                resultado['archivo'] = archivo
-                # Almacenar resultados
-                resultados.append(resultado)
-                vectores_caracteristicas.append(resultado['vector_completo'])
+        for archivo, vector in self.iterar_extraccion(
+                directorio_imagenes, archivos_imagenes, num_procesos, tamano_chunk, ruta_cache):
+            resultado = self._formatear_resultado(self.separar_descriptores(vector))
+            # Agregar metadato del nombre de archivo
+            resultado['archivo'] = archivo
+            resultados.append(resultado)
+            vectores_caracteristicas.append(resultado['vector_completo'])
 
         # 3: Guardar resultados 
         if ruta_salida_json:
@@ -263,4 +537,61 @@ class ExtractorMasivo:
 
         print(f"Extracción completada: {len(resultados)} imagenes procesadas")
         
-        return resultados, vectores_caracteristicas
\ No newline at end of file
+        return resultados, vectores_caracteristicas
+
+    def extraer_directorio_a_almacen(self, directorio_imagenes, directorio_almacen, num_procesos=1,
+                                     tamano_chunk=16, ruta_cache=None, tamano_bloque=256):
+        """
+        Extrae caracteristicas en streaming hacia un AlmacenCaracteristicas.
+        
+        Memoria constante: las filas se acumulan en un bloque fijo y se
+        escriben en la matriz mapeada; los metadatos van a un sidecar JSONL.
+        
+        Args:
+            directorio_imagenes (str): Directorio con imagenes preprocesadas
+            directorio_almacen (str): Directorio del almacen (se recrea)
+            num_procesos (int): Procesos trabajadores (1 = secuencial, None = todos los nucleos)
+            tamano_chunk (int): Imagenes enviadas a cada trabajador por tarea
+            ruta_cache (str): Archivo SQLite de la cache de caracteristicas (opcional)
+            tamano_bloque (int): Filas acumuladas antes de cada escritura
+            
+        Returns:
+            int: Numero de filas escritas
+        """
+        archivos_imagenes = self.listar_imagenes(directorio_imagenes)
+        almacen = AlmacenCaracteristicas(
+            directorio_almacen, modo='w',
+            dimension=self.dimension, disposicion=self.disposicion
+        )
+
+        bloque = np.empty((tamano_bloque, self.dimension), dtype=np.float32)
+        metadatos = []
+        try:
+            for archivo, vector in self.iterar_extraccion(
+                    directorio_imagenes, archivos_imagenes, num_procesos, tamano_chunk, ruta_cache):
+                bloque[len(metadatos)] = vector
+                metadatos.append({'archivo': archivo})
+                if len(metadatos) == tamano_bloque:
+                    almacen.agregar_lote(bloque, metadatos)
+                    metadatos = []
+            if metadatos:
+                almacen.agregar_lote(bloque[:len(metadatos)], metadatos)
+        finally:
+            almacen.cerrar()
+
+        print(f"Extracción completada: {len(almacen)} imagenes en {directorio_almacen}")
+        return len(almacen)
+
+
+# Extractor propio de cada proceso trabajador (se construye una sola vez por proceso)
+_extractor_trabajador = None
+
+
+def _inicializar_trabajador(extractor):
+    global _extractor_trabajador
+    _extractor_trabajador = extractor
+
+
+def _procesar_archivo_trabajador(tarea):
+    directorio_imagenes, archivo = tarea
+    return _extractor_trabajador.procesar_archivo(directorio_imagenes, archivo)
@@ -0,0 +1,183 @@
+"""
+Firmas binarias por huella para un prefiltro por distancia de Hamming.
+Se aprenden sobre el vector fusionado normalizado (signo de una proyeccion)
+y se guardan en un indice binario de FAISS junto a faiss_index.bin.
+"""
+
+import os
+
+import faiss
+import numpy as np
+
+from src.core.indices_faiss import CONSULTAS_RECALL, K_RECALL
+from src.core.proyeccion import aplicar_transformacion
+
+
+ARCHIVO_INDICE_BINARIO = 'faiss_index_binario.bin'
+ARCHIVO_TRANSFORMACION_BINARIA = 'firma_binaria.bin'
+
+# Candidatos que sobreviven al prefiltro por defecto (se reordenan en float)
+SUPERVIVIENTES = 1000
+
+
+def entrenar_firma(vectores, normalizacion, bits, tamano_muestra=100000, semilla=0):
+    """
+    Aprende la proyeccion cuyo signo da la firma binaria.
+
+    Flujo:
+    1. Toma hasta `tamano_muestra` filas normalizadas sin reemplazo
+    2. PCA a `bits` componentes (centrado incluido)
+    3. Rotacion ortogonal aleatoria: reparte la varianza entre los bits
+       (sin ella los primeros bits concentran casi toda la informacion)
+    4. Umbral = mediana de cada componente, asi cada bit divide el
+       conjunto a la mitad
+    5. Pliega la normalizacion Min-Max en la transformacion: recibe el
+       vector recortado sin normalizar
+
+    Args:
+        vectores (numpy.ndarray): Matriz (N, D) normalizada
+        normalizacion (NormalizacionMinMax): Min-Max del indice principal
+        bits (int): Longitud de la firma (multiplo de 8, <= D)
+
+    Returns:
+        faiss.LinearTransform: D -> bits; bit = 1 si la salida es > 0
+    """
+    num_vectores, dimension = vectores.shape
+    if bits % 8 or not 0 < bits <= dimension:
+        raise ValueError(f"La firma binaria debe tener un multiplo de 8 bits entre 8 y {dimension}")
+
+    # 1: Muestra de entrenamiento
+    generador = np.random.default_rng(semilla)
+    if num_vectores > tamano_muestra:
+        filas = np.sort(generador.choice(num_vectores, tamano_muestra, replace=False))
+        muestra = np.ascontiguousarray(vectores[filas], dtype='float32')
+    else:
+        muestra = np.ascontiguousarray(vectores, dtype='float32')
+
+    # 2: PCA
+    pca = faiss.PCAMatrix(dimension, bits)
+    pca.train(muestra)
+    matriz = faiss.vector_to_array(pca.A).reshape(bits, dimension).astype(np.float64)
+    sesgo = faiss.vector_to_array(pca.b).astype(np.float64)
+
+    # 3: Rotacion aleatoria (Q de una QR gaussiana)
+    rotacion, _ = np.linalg.qr(generador.standard_normal((bits, bits)))
+    matriz, sesgo = rotacion @ matriz, rotacion @ sesgo
+
+    # 4: Bits balanceados
+    sesgo -= np.median(muestra @ matriz.T + sesgo, axis=0)
+
+    # 5: y = M ((x - min) / range) + s
+    transformacion = faiss.LinearTransform(dimension, bits, True)
+    faiss.copy_array_to_vector(matriz.astype('float32').ravel(), transformacion.A)
+    faiss.copy_array_to_vector(sesgo.astype('float32'), transformacion.b)
+    transformacion.is_trained = True
+    return normalizacion.plegar(transformacion)
+
+
+def calcular_firmas(transformacion, vectores):
+    """
+    Firmas empaquetadas (8 bits por byte, formato de IndexBinary).
+
+    Args:
+        vectores (numpy.ndarray): Matriz (N, D) recortada sin normalizar
+
+    Returns:
+        numpy.ndarray: (N, bits / 8) uint8
+    """
+    return np.packbits(aplicar_transformacion(transformacion, vectores) > 0, axis=1)
+
+
+def construir_indice_binario(firmas, ids):
+    """IndexBinaryFlat (Hamming exacto por popcount) con IDs estables."""
+    indice = faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(firmas.shape[1] * 8))
+    indice.add_with_ids(np.ascontiguousarray(firmas), np.ascontiguousarray(ids, dtype='int64'))
+    return indice
+
+
+def prefiltrar(indice, transformacion, consulta, supervivientes, excluidos=None):
+    """
+    Primera etapa: IDs con menor distancia de Hamming a la consulta.
+
+    Args:
+        consulta (numpy.ndarray): (1, D) recortada sin normalizar
+        supervivientes (int): Candidatos que pasan a la busqueda en float
+        excluidos (numpy.ndarray): Lapidas (se descartan de la lista)
+
+    Returns:
+        numpy.ndarray: IDs supervivientes (sin huecos -1 ni lapidas)
+    """
+    _, indices = indice.search(calcular_firmas(transformacion, consulta), int(supervivientes))
+    candidatos = indices[0][indices[0] >= 0]
+    if excluidos is not None and len(excluidos):
+        candidatos = candidatos[~np.isin(candidatos, excluidos)]
+    return candidatos
+
+
+def medir_recall_prefiltro(indice, firmas, vectores, ids, supervivientes, k=K_RECALL,
+                           num_consultas=CONSULTAS_RECALL, semilla=0):
+    """
+    Fraccion de los k vecinos exactos que sobreviven al prefiltro
+    (cota del recall@k tras la busqueda en float sobre los supervivientes).
+
+    Returns:
+        dict: {'k', 'consultas', 'supervivientes', 'recall'}
+    """
+    vectores = np.ascontiguousarray(vectores, dtype='float32')
+    generador = np.random.default_rng(semilla)
+    filas = np.sort(generador.choice(len(vectores), min(num_consultas, len(vectores)), replace=False))
+    k = min(k, len(vectores))
+
+    _, exactos = faiss.knn(vectores[filas], vectores, k)
+    _, candidatos = indice.search(np.ascontiguousarray(firmas[filas]), min(supervivientes, len(vectores)))
+    aciertos = sum(
+        len(np.intersect1d(ids[fila_exacta], fila_candidatos))
+        for fila_exacta, fila_candidatos in zip(exactos, candidatos)
+    )
+    return {'k': k, 'consultas': len(filas), 'supervivientes': int(supervivientes),
+            'recall': aciertos / float(k * len(filas))}
+
+
+def describir_firma(configuracion, dimension):
+    """
+    Bits de la firma y memoria frente al vector float32.
+
+    Returns:
+        dict: configuracion + bytes por vector (firma / float32)
+    """
+    return {
+        **configuracion,
+        'bytes_por_vector': {'firma': configuracion['bits'] // 8, 'float32': 4 * dimension}
+    }
+
+
+def guardar_firma(directorio, indice, transformacion=None):
+    """
+    Escribe el indice binario (reemplazo atomico) y, si se da, su
+    transformacion (congelada: las altas incrementales no la reescriben).
+    """
+    ruta = os.path.join(directorio, ARCHIVO_INDICE_BINARIO)
+    faiss.write_index_binary(indice, ruta + '.tmp')
+    os.replace(ruta + '.tmp', ruta)
+    if transformacion is not None:
+        faiss.write_VectorTransform(transformacion, os.path.join(directorio, ARCHIVO_TRANSFORMACION_BINARIA))
+
+
+def cargar_firma(directorio, mapear=False):
+    """
+    Lee el indice binario (mapeado si se pide) y su transformacion.
+
+    Returns:
+        tuple: (indice, transformacion)
+    """
+    ruta = os.path.join(directorio, ARCHIVO_INDICE_BINARIO)
+    indice = None
+    if mapear:
+        try:
+            indice = faiss.read_index_binary(ruta, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            indice = None
+    if indice is None:
+        indice = faiss.read_index_binary(ruta)
+    transformacion = faiss.read_VectorTransform(os.path.join(directorio, ARCHIVO_TRANSFORMACION_BINARIA))
+    return indice, transformacion
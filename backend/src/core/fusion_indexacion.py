@@ -7,46 +7,125 @@ import os
 import numpy as np
 import json
 import faiss
-import pickle
 from tqdm import tqdm
 import time
 
+from src.core.almacen_caracteristicas import AlmacenCaracteristicas, fijar_almacen, PRIMER_ID_ALTA
+from src.core.firmas_binarias import (
+    calcular_firmas, construir_indice_binario, describir_firma, entrenar_firma, guardar_firma,
+    medir_recall_prefiltro, SUPERVIVIENTES
+)
+from src.core.indice_incremental import cargar_estado, guardar_estado
+from src.core.indices_faiss import (
+    construir_indice_ids, describir_indice, envolver_transformaciones, guardar_configuracion,
+    medir_recall, TIPOS_INDICE
+)
+from src.core.proyeccion import (
+    aplicar_transformacion, crear_normalizacion, describir_normalizacion, describir_proyeccion,
+    eliminar_archivos_legados, entrenar_proyeccion
+)
+from src.core.tabla_nombres import TablaNombres
+from src.core.versiones_indice import (
+    descartar_version, directorio_actual, DIRECTORIO_ALMACEN, DIRECTORIO_ALTAS, preparar_version,
+    publicar_version
+)
+
+# Bloques con menos dimensiones se indexan siempre con IndexFlatL2 (ya es barato)
+DIMENSION_MINIMA_APROXIMADA = 64
+
 class SistemaFusionIndexacion:
     """
     - Cargar vectores de caracteristicas ya extraidos
     - Normalizar datos (Min-Max scaling)
+    - (Opcional) Reducir dimension con una proyeccion PCA / OPQ aprendida
     - Construir indice FAISS para busqueda rapida
+    - (Opcional) Firmas binarias para un prefiltro por distancia de Hamming
     - Mantener mapeo entre indices FAISS y nombres de archivo
     - Persistir todo en disco
     
     Attributes:
         ruta_vectores (str): Ruta al archivo .npy con vectores
         ruta_json (str): Ruta al archivo JSON con metadatos
-        directorio_salida (str): Directorio para guardar indices
+        directorio_almacen (str): AlmacenCaracteristicas (preferido sobre .npy + JSON si existe)
+        directorio_altas (str): Segmento de altas incrementales (se indexa junto al corpus)
+        directorio_salida (str): Directorio raiz de indices (una version por indexacion)
+        version (str): Version publicada por guardar_indice
+        preparacion (str): Version en preparacion (con el almacen ya fijado)
+        tipo_indice (str): 'flat', 'sq8', 'sqfp16', 'ivf', 'hnsw' o 'ivfpq'
+        parametros_indice (dict): Parametros de construccion (nlist, nprobe, m, nbits, M, ...)
+        indices_por_descriptor (bool): Construir tambien un subindice por bloque (LBP, HOG, GABOR)
+        dimension_proyeccion (int): Dimension tras PCA (None = sin proyeccion)
+        tipo_proyeccion (str): 'pca' u 'opq' (rotacion OPQ tras el PCA, para ivfpq)
+        bits_firma (int): Bits de la firma binaria por huella (None = sin prefiltro)
+        supervivientes_firma (int): Candidatos que pasan el prefiltro por defecto
+        indice_binario (faiss.IndexBinaryIDMap2): Firmas con los mismos IDs estables
+        transformacion_firma (faiss.LinearTransform): Proyeccion cuyo signo da la firma
+        firma_binaria (dict): Bits, supervivientes y recall del prefiltro
+        proyeccion (faiss.LinearTransform): Proyeccion aprendida
+        descripcion_proyeccion (dict): Tipo, dimensiones y varianza explicada
+        disposicion (dict): {descriptor: (desplazamiento, longitud)} del vector fusionado
+        subindices (dict): {descriptor: faiss.IndexIDMap2}
         vectores_raw (np.ndarray): Vectores originales sin normalizar
         vectores_normalizados (np.ndarray): Vectores normalizados [0,1]
+        vectores_proyectados (np.ndarray): Vectores que se indexan si hay proyeccion
         metadatos (list): Lista de diccionarios con info de cada imagen
-        indice_faiss (faiss.Index): Indice FAISS para busqueda
-        mapeo_indices (dict): Mapeo {indice_faiss: nombre_archivo}
+        indice_faiss (faiss.IndexIDMap2): Indice FAISS para busqueda (IDs estables)
+        recall (dict): Recall@k frente a la busqueda exacta (indices no exactos)
+        ids (np.ndarray): ID estable de cada vector (fila en el almacen / .npy;
+            PRIMER_ID_ALTA + fila para las altas incrementales)
+        mapeo_indices (TablaNombres): Tabla compacta id_estable -> nombre_archivo
         scaler (dict): Parametros de normalizacion (min, max, range)
+        normalizacion (NormalizacionMinMax): Min-Max por dimension (elemento a elemento)
     """
     
     def __init__(self, 
                  ruta_vectores='datos/caracteristicas/vectores_caracteristicas.npy',
                  ruta_json='datos/caracteristicas/caracteristicas_completas.json', 
-                 directorio_salida='datos/indices'):
+                 directorio_salida='datos/indices',
+                 directorio_almacen='datos/caracteristicas/almacen',
+                 directorio_altas='datos/caracteristicas/altas',
+                 tipo_indice='flat',
+                 parametros_indice=None,
+                 indices_por_descriptor=False,
+                 dimension_proyeccion=None,
+                 tipo_proyeccion='pca',
+                 bits_firma=None,
+                 supervivientes_firma=None):
 
         self.ruta_vectores = ruta_vectores
         self.ruta_json = ruta_json
+        self.directorio_almacen = directorio_almacen
+        self.directorio_altas = directorio_altas
         self.directorio_salida = directorio_salida
+        self.tipo_indice = tipo_indice
+        self.parametros_indice = parametros_indice or {}
+        self.indices_por_descriptor = indices_por_descriptor
+        self.dimension_proyeccion = dimension_proyeccion
+        self.tipo_proyeccion = tipo_proyeccion
+        self.bits_firma = bits_firma
+        self.supervivientes_firma = supervivientes_firma or SUPERVIVIENTES
         
         # Inicializar estructuras de datos vacias
         self.vectores_raw = None
         self.vectores_normalizados = None
+        self.vectores_proyectados = None
+        self.proyeccion = None
+        self.descripcion_proyeccion = None
         self.metadatos = None
         self.indice_faiss = None
-        self.mapeo_indices = {}
+        self.recall = None
+        self.ids = None
+        self.disposicion = {}
+        self.subindices = {}
+        self.subconfiguracion = {}
+        self.mapeo_indices = None
         self.scaler = {}  
+        self.normalizacion = None
+        self.version = None
+        self.preparacion = None
+        self.indice_binario = None
+        self.transformacion_firma = None
+        self.firma_binaria = None
         
         os.makedirs(self.directorio_salida, exist_ok=True)
     
@@ -54,17 +133,60 @@ class SistemaFusionIndexacion:
         """
         Flujo:
         1. Carga matriz NumPy con vectores (shape: [N_imagenes, 1806])
-        2. Limpia valores invalidos (inf, nan)
-        3. Carga JSON con metadatos (nombres de archivo, caracteristicas por descriptor)
+           (desde el almacen mapeado si existe, si no desde el .npy)
+           El almacen se fija antes en la version que se va a publicar y se
+           lee de esa instantanea: una reingesta posterior no cambia las
+           filas (IDs) de este indice
+        2. Carga metadatos (JSONL del almacen o JSON completo)
+        3. Limpia valores invalidos (inf, nan) si el origen no se limpio al escribirse
         4. Verifica consistencia entre vectores y metadatos
+           (con .npy + JSON legados se escriben como almacen de la version)
+        5. Agrega las altas incrementales (segmento propio, tambien fijado
+           en la version) con sus IDs, y excluye archivos dados de baja con
+           IndiceIncremental (cada vector conserva su ID estable)
         """
         
         print("FASE 1: CARGA DE DATOS Y LIMPIEZA")
-        # 1: Cargar vectores numericos
-        if self.ruta_vectores and os.path.exists(self.ruta_vectores):
-            print(f"Cargando vectores desde: {self.ruta_vectores}")
-            self.vectores_raw = np.load(self.ruta_vectores)
+        self.preparacion = preparar_version(self.directorio_salida)
+        almacen_version = os.path.join(self.preparacion, DIRECTORIO_ALMACEN)
+        
+        # 1-2: Almacen en streaming (matriz mapeada + metadatos JSONL)
+        if self.directorio_almacen and AlmacenCaracteristicas.existe(self.directorio_almacen):
+            print(f"Cargando almacen de caracteristicas desde: {self.directorio_almacen}")
+            fijar_almacen(self.directorio_almacen, almacen_version)
+            almacen = AlmacenCaracteristicas(almacen_version, modo='r')
+            self.vectores_raw = almacen.vectores()
+            saneado = almacen.saneado
+            self.disposicion = almacen.disposicion
+            # Solo se leen los nombres de archivo, linea a linea
+            self.metadatos = list(almacen.iterar_metadatos())
+        else:
+            # 1: Cargar vectores numericos
+            if self.ruta_vectores and os.path.exists(self.ruta_vectores):
+                print(f"Cargando vectores desde: {self.ruta_vectores}")
+                self.vectores_raw = np.load(self.ruta_vectores)
+                saneado = False
+            else:
+                print("ERROR: No se encontraron vectores pre-calculados")
+                return False
+            
+            # 2: Cargar metadatos
+            if self.ruta_json and os.path.exists(self.ruta_json):
+                print(f"Cargando metadatos desde: {self.ruta_json}")
+                with open(self.ruta_json, 'r') as f:
+                    self.metadatos = json.load(f)
+                # Disposicion a partir de las longitudes del primer registro
+                desplazamiento = 0
+                for nombre, valores in (self.metadatos[0].get('caracteristicas', {}).items()
+                                        if self.metadatos else []):
+                    self.disposicion[nombre] = (desplazamiento, len(valores))
+                    desplazamiento += len(valores)
+            else:
+                print("ERROR: No se encontraron metadatos pre-calculados")
+                return False
 
+        # El almacen ya limpia al escribir; limpiar aqui copiaria toda la matriz mapeada
+        if not saneado:
             print("Aplicando limpieza de vectores...")
             self.vectores_raw = np.nan_to_num(
                 self.vectores_raw, 
@@ -72,21 +194,9 @@ class SistemaFusionIndexacion:
                 posinf=1.0,  
                 neginf=0.0    
             )
-            
-            print(f"Vectores cargados: {self.vectores_raw.shape}")
-            print(f"Rango original: [{np.min(self.vectores_raw):.3f}, {np.max(self.vectores_raw):.3f}]")
-        else:
-            print("ERROR: No se encontraron vectores pre-calculados")
-            return False
         
-        # 2: Cargar metadatos
-        if self.ruta_json and os.path.exists(self.ruta_json):
-            print(f"Cargando metadatos desde: {self.ruta_json}")
-            with open(self.ruta_json, 'r') as f:
-                self.metadatos = json.load(f)
-        else:
-            print("ERROR: No se encontraron metadatos pre-calculados")
-            return False
+        print(f"Vectores cargados: {self.vectores_raw.shape}")
+        print(f"Rango original: [{np.min(self.vectores_raw):.3f}, {np.max(self.vectores_raw):.3f}]")
         
         #3: Verificar consistencia
         # El numero de vectores debe coincidir con el numero de metadatos
@@ -94,6 +204,36 @@ class SistemaFusionIndexacion:
             print(f"ERROR: Inconsistencia - {len(self.vectores_raw)} vectores vs {len(self.metadatos)} metadatos")
             return False
         
+        # 4: Origen legado: la version guarda su propia copia de los vectores
+        if not AlmacenCaracteristicas.existe(almacen_version):
+            almacen = AlmacenCaracteristicas(almacen_version, modo='w',
+                                             dimension=self.vectores_raw.shape[1],
+                                             disposicion=self.disposicion)
+            almacen.agregar_lote(self.vectores_raw, [{'archivo': item['archivo']} for item in self.metadatos])
+            almacen.cerrar()
+        
+        # 5: Altas incrementales (sobreviven a la reingesta del corpus)
+        self.ids = np.arange(len(self.vectores_raw), dtype='int64')
+        if self.directorio_altas and AlmacenCaracteristicas.existe(self.directorio_altas):
+            altas = AlmacenCaracteristicas(self.directorio_altas)
+            if len(altas):
+                altas_version = os.path.join(self.preparacion, DIRECTORIO_ALTAS)
+                fijar_almacen(self.directorio_altas, altas_version)
+                altas = AlmacenCaracteristicas(altas_version)
+                self.vectores_raw = np.concatenate([self.vectores_raw, altas.vectores()])
+                self.metadatos += list(altas.iterar_metadatos())
+                self.ids = np.concatenate([self.ids, PRIMER_ID_ALTA + np.arange(len(altas), dtype='int64')])
+                print(f"Altas incrementales: {len(altas)}")
+        
+        # Bajas incrementales previas (no reaparecen al reindexar)
+        eliminados = set(cargar_estado(directorio_actual(self.directorio_salida))['archivos_eliminados'])
+        if eliminados:
+            activos = np.array([item['archivo'] not in eliminados for item in self.metadatos])
+            self.vectores_raw = self.vectores_raw[activos]
+            self.metadatos = [item for item, activo in zip(self.metadatos, activos) if activo]
+            self.ids = self.ids[activos]
+            print(f"Archivos dados de baja excluidos: {int((~activos).sum())}")
+        
         print(f"Carga exitosa: {len(self.vectores_raw)} imagenes procesadas")
         return True
     
@@ -109,6 +249,10 @@ class SistemaFusionIndexacion:
         3. Aplica transformacion lineal
         4. Maneja casos especiales (caracteristicas constantes)
         
+        Los parametros se guardan con el indice (normalizacion.npy) y las
+        consultas se normalizan con exactamente los mismos; con proyeccion,
+        la escala se pliega en ella dentro del indice.
+        
         Razon:
             - FAISS usa distancia Euclidiana L2
             - Sin normalizacion, caracteristicas con mayor magnitud dominan la distancia
@@ -135,27 +279,87 @@ class SistemaFusionIndexacion:
         self.scaler['range'][self.scaler['range'] == 0] = 1.0
         
         # PASO 3: Aplicar normalizacion Min-Max
-        # Broadcasting de NumPy: resta y division se aplican elemento por elemento
         print("Aplicando normalizacion Min-Max...")
-        self.vectores_normalizados = (self.vectores_raw - self.scaler['min']) / self.scaler['range']
+        self.normalizacion = crear_normalizacion(self.scaler['min'], self.scaler['range'])
+        self.vectores_normalizados = aplicar_transformacion(self.normalizacion, self.vectores_raw)
         
         # Verificar resultados
         print(f"Rango normalizado: [{np.min(self.vectores_normalizados):.3f}, {np.max(self.vectores_normalizados):.3f}]")
         print("Normalizacion completada - Vectores en rango [0,1]")
         return True
     
+    def proyectar_vectores(self):
+        """
+        Reduce la dimension del vector fusionado antes de indexarlo.
+        
+        Flujo:
+        1. Entrena PCA sobre una muestra de los vectores normalizados
+           (tipo 'opq': ademas una rotacion OPQ para repartir la varianza
+           entre los subespacios de PQ)
+        2. Proyecta todos los vectores a dimension_proyeccion
+        
+        Razon:
+            - 1806 float32 ocupan ~7 KB por imagen y cada consulta recorre
+              todas las dimensiones
+            - Las caracteristicas estan muy correlacionadas (celdas HOG
+              vecinas): pocas componentes conservan casi toda la varianza
+            - La proyeccion se guarda dentro del indice, con la
+              normalizacion plegada, y FAISS la aplica a cada consulta
+        """
+        
+        print("FASE 2b: PROYECCION " + self.tipo_proyeccion.upper())
+        if self.vectores_normalizados is None:
+            print("ERROR: Primero debes normalizar los datos")
+            return False
+        if self.tipo_proyeccion == 'opq' and self.tipo_indice != 'ivfpq':
+            print("ERROR: La rotacion OPQ solo aplica a indices ivfpq (usa tipo_proyeccion='pca')")
+            return False
+        
+        # 1: Entrenar proyeccion
+        inicio = time.time()
+        try:
+            self.proyeccion, self.descripcion_proyeccion = entrenar_proyeccion(
+                self.vectores_normalizados, int(self.dimension_proyeccion), self.tipo_proyeccion,
+                tamano_muestra=self.parametros_indice.get('muestra_entrenamiento') or 100000,
+                parametros_indice=self.parametros_indice
+            )
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return False
+        
+        # 2: Proyectar todo el conjunto
+        self.vectores_proyectados = aplicar_transformacion(self.proyeccion, self.vectores_normalizados)
+        
+        descripcion = self.descripcion_proyeccion
+        print(f"Dimension: {descripcion['dimension_entrada']} -> {descripcion['dimension_salida']}")
+        print(f"Varianza explicada: {descripcion['varianza_explicada']:.2%}")
+        print(f"Tiempo de proyeccion: {time.time() - inicio:.2f}s")
+        return True
+    
     def construir_indice_faiss(self):
         """
         Flujo:
-        1. Crea indice plano con distancia L2
-        2. Convierte vectores a float32 (requerido por FAISS)
-        3. Agrega vectores al indice
+        1. Resuelve los parametros del tipo de indice elegido
+        2. Crea el indice con distancia L2
+        3. Convierte vectores a float32 (requerido por FAISS)
+        4. Entrena con una muestra (IVF / IVF-PQ / SQ8)
+        5. Agrega vectores al indice
+        6. Mide el recall@10 frente a la busqueda exacta (si no es flat)
+        7. Con proyeccion, la antepone al indice con la normalizacion
+           Min-Max plegada; sin ella, el indice recibe vectores normalizados
         
 
-        Alternativas de indices:
-        - IndexFlatL2: Exacto, O(n), mejor precision
-        - IndexIVFFlat: Aproximado, O(log n), mas rapido
-        - IndexHNSWFlat: Aproximado, mejor balance precision/velocidad
+        Tipos de indice (self.tipo_indice):
+        - flat (IndexFlatL2): Exacto, O(n), mejor precision
+        - sq8 (IndexScalarQuantizer QT_8bit): 1 byte por dimension (4x menos
+          memoria); los vectores ya estan en [0,1], asi que el error es minimo
+        - sqfp16 (IndexScalarQuantizer QT_fp16): 2 bytes por dimension (2x menos)
+        - ivf (IndexIVFFlat): Aproximado, visita nprobe de nlist listas
+        - hnsw (IndexHNSWFlat): Aproximado, mejor balance precision/velocidad
+        - ivfpq (IndexIVFPQ): Aproximado y comprimido (m bytes por vector)
+        
+        El indice se envuelve en IndexIDMap2: cada vector se agrega con su ID
+        estable, lo que permite altas y bajas incrementales sin reconstruir.
         """
 
         print("FASE 3: CONSTRUCCION INDICE FAISS")
@@ -163,41 +367,157 @@ class SistemaFusionIndexacion:
             print("ERROR: Primero debes normalizar los datos")
             return False
         
+        # Con proyeccion se indexan los vectores proyectados
+        vectores = self.vectores_normalizados
+        transformaciones = []
+        if self.vectores_proyectados is not None:
+            vectores = self.vectores_proyectados
+            transformaciones = [self.normalizacion.plegar(self.proyeccion)]
+        
         # Obtener dimensiones
-        dimension = self.vectores_normalizados.shape[1]  # 1806
-        num_vectores = self.vectores_normalizados.shape[0]  # 960
+        dimension = vectores.shape[1]  # 1806 (o la dimension proyectada)
+        num_vectores = vectores.shape[0]  # 960
         
         print(f"Dimension: {dimension}, Vectores: {num_vectores}")
         
-        # 1: Crear indice FAISS
-        self.indice_faiss = faiss.IndexFlatL2(dimension)
+        # 1-5: Crear, entrenar y llenar el indice con IDs estables
+        if self.tipo_indice not in TIPOS_INDICE:
+            print(f"ERROR: Tipo de indice no soportado: {self.tipo_indice}")
+            return False
+        print(f"Tipo de indice: {self.tipo_indice}")
         
-        # 2: Convertir a float32
         print("Agregando vectores al indice FAISS...")
-        vectores_float32 = self.vectores_normalizados.astype('float32')
-        
-        # 3: Agregar vectores al indice
         inicio = time.time()
-        self.indice_faiss.add(vectores_float32)
+        self.indice_faiss, self.parametros_indice, filas_entrenamiento = construir_indice_ids(
+            self.tipo_indice, vectores, self.ids, self.parametros_indice
+        )
+        # 6: Verificacion de recall contra la busqueda exacta en float32
+        if self.tipo_indice != 'flat':
+            self.recall = medir_recall(self.indice_faiss, vectores, self.ids)
+            print(f"Recall@{self.recall['k']} frente a busqueda exacta: {self.recall['recall']:.3f} "
+                  f"({self.recall['consultas']} consultas)")
+        
+        # 7: Proyeccion (con la normalizacion plegada) dentro del indice: las
+        # consultas entran sin normalizar y FAISS la aplica en una sola llamada
+        if transformaciones:
+            self.indice_faiss = envolver_transformaciones(self.indice_faiss, transformaciones)
         tiempo = time.time() - inicio
+        if filas_entrenamiento:
+            print(f"Indice entrenado con {filas_entrenamiento} vectores")
         
+        print(f"Parametros: {self.parametros_indice}")
         print(f"Indice construido: {self.indice_faiss.ntotal} vectores")
         print(f"Tiempo de construccion: {tiempo:.2f}s")
         
         return True
     
+    def construir_firma_binaria(self):
+        """
+        Firma binaria por huella para el prefiltro por distancia de Hamming.
+        
+        Flujo:
+        1. Aprende la proyeccion (PCA + rotacion aleatoria, umbral en la
+           mediana) sobre los vectores normalizados
+        2. Calcula la firma de cada vector (signo de la proyeccion)
+        3. La indexa en un IndexBinaryFlat con los IDs estables
+        4. Mide que fraccion de los 10 vecinos exactos sobrevive al prefiltro
+        
+        Razon:
+            - Con millones de huellas incluso un recorrido comprimido en
+              float es lento; la firma ocupa bits / 8 bytes y la distancia
+              de Hamming se calcula con popcount
+            - La consulta solo busca en float entre los supervivientes
+        """
+        
+        print("FASE 3c: FIRMAS BINARIAS")
+        if self.vectores_normalizados is None:
+            print("ERROR: Primero debes normalizar los datos")
+            return False
+        
+        # 1: Proyeccion de la firma
+        inicio = time.time()
+        try:
+            self.transformacion_firma = entrenar_firma(
+                self.vectores_normalizados, self.normalizacion, int(self.bits_firma),
+                tamano_muestra=self.parametros_indice.get('muestra_entrenamiento') or 100000
+            )
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return False
+        
+        # 2-3: Firmas e indice binario
+        firmas = calcular_firmas(self.transformacion_firma, self.vectores_raw)
+        self.indice_binario = construir_indice_binario(firmas, self.ids)
+        
+        # 4: Recall del prefiltro
+        recall = medir_recall_prefiltro(
+            self.indice_binario, firmas, self.vectores_normalizados, self.ids, self.supervivientes_firma
+        )
+        self.firma_binaria = {
+            'bits': int(self.bits_firma),
+            'supervivientes': int(self.supervivientes_firma),
+            'recall': recall
+        }
+        print(f"Firma: {self.bits_firma} bits ({self.bits_firma // 8} bytes por huella)")
+        print(f"Recall@{recall['k']} con {recall['supervivientes']} supervivientes: {recall['recall']:.3f}")
+        print(f"Tiempo de firmas: {time.time() - inicio:.2f}s")
+        return True
+    
+    def construir_subindices(self):
+        """
+        Construye un indice por bloque de descriptor (fusion tardia).
+        
+        Flujo:
+        1. Toma la disposicion {descriptor: (desplazamiento, longitud)}
+        2. Corta las columnas normalizadas de cada bloque
+        3. Indexa cada bloque con los mismos IDs estables
+           (bloques pequenos como LBP o Gabor con IndexFlatL2)
+        
+        Razon:
+            En L2 sobre el vector fusionado dominan las 1764 dimensiones de
+            HOG. Con un indice por descriptor, SistemaBusqueda combina las
+            listas con pesos elegidos en cada consulta, sin reindexar.
+        """
+        
+        print("FASE 3b: SUBINDICES POR DESCRIPTOR")
+        if not self.disposicion:
+            print("ERROR: No se conoce la disposicion de descriptores del vector")
+            return False
+        
+        for nombre, (desplazamiento, longitud) in self.disposicion.items():
+            # 1-2: Columnas del bloque
+            bloque = self.vectores_normalizados[:, desplazamiento:desplazamiento + longitud]
+            tipo = self.tipo_indice if longitud >= DIMENSION_MINIMA_APROXIMADA else 'flat'
+            
+            # 3: Indice del bloque
+            inicio = time.time()
+            indice, parametros, _ = construir_indice_ids(tipo, bloque, self.ids, self.parametros_indice)
+            self.subindices[nombre] = indice
+            self.subconfiguracion[nombre] = {
+                'archivo': f'faiss_index_{nombre}.bin',
+                'tipo': tipo,
+                'parametros': parametros,
+                'desplazamiento': desplazamiento,
+                'longitud': longitud
+            }
+            print(f"Subindice {nombre}: {longitud} dimensiones, {tipo}, "
+                  f"{time.time() - inicio:.2f}s")
+        
+        return True
+    
     def crear_mapeo_indices(self):
         """
         Crea mapeo bidireccional entre indices FAISS y nombres de archivo.
         
         Razon:
-        - FAISS asigna indices enteros secuenciales (0, 1, 2, ...)
+        - FAISS devuelve el ID estable de cada vector (su fila de origen)
         - Necesitamos recuperar el nombre de archivo original
-        - Mapeo: {indice_faiss: nombre_archivo}
+        - Mapeo: TablaNombres (IDs ordenados + desplazamientos + blob de
+          nombres), con busqueda inversa nombre -> ID
         
         Flujo:
-        1. Itera sobre metadatos en orden
-        2. Crea entrada {indice: archivo} para cada imagen
+        1. Toma el nombre de archivo de cada metadato, en orden
+        2. Construye la tabla con los IDs estables
         """
 
         print("FASE 4: CREACION MAPEO INDICE-IMAGEN")
@@ -205,24 +525,36 @@ class SistemaFusionIndexacion:
             print("ERROR: Primero debes cargar los metadatos")
             return False
         
-        # Crear mapeo: {indice_entero: nombre_archivo}
-        for idx, item in enumerate(self.metadatos):
-            self.mapeo_indices[idx] = item['archivo']
+        # Crear mapeo: tabla id_estable -> nombre_archivo
+        self.mapeo_indices = TablaNombres.desde_pares(self.ids, (item['archivo'] for item in self.metadatos))
         
         print(f"Mapeo creado: {len(self.mapeo_indices)} entradas")
         return True
     
     def guardar_indice(self):
         """
-        Archivos generados:
-        1. faiss_index.bin: Indice FAISS serializado (busqueda rapida)
-        2. mapeo_indices.json: Mapeo indice-archivo (recuperacion de nombres)
-        3. scaler.pkl: Parametros de normalizacion (para consultas futuras)
+        Archivos generados (en versiones/vNNNNNN/ del directorio de salida):
+        1. faiss_index.bin: Indice FAISS serializado, con la proyeccion
+           PCA / OPQ (normalizacion plegada) como IndexPreTransform
+           normalizacion.npy: Min y range de la normalizacion Min-Max
+        2. mapeo_ids.npy, mapeo_desplazamientos.npy, mapeo_nombres.bin,
+           mapeo_hashes.npy, mapeo_orden_hashes.npy: Tabla indice-archivo
+           (recuperacion de nombres, mapeable en memoria)
+        3. configuracion_indice.json: Tipo y parametros del indice (y subindices)
+           faiss_index_<DESCRIPTOR>.bin: Subindices por descriptor (opcional)
+           faiss_index_binario.bin / firma_binaria.bin: Firmas binarias (opcional)
+        4. estado_incremental.json: Lapidas y bajas de IndiceIncremental
+        5. manifiesto.json: Version, origen y tamano de cada archivo
+        almacen/: Instantanea de los vectores originales indexados (cargar_datos)
         
         Flujo:
         1. Serializa indice FAISS en formato binario
-        2. Guarda mapeo como JSON (legible por humanos)
-        3. Guarda scaler con pickle (preserva tipos NumPy)
+        2. Guarda la tabla de nombres en binario
+        3. Guarda tipo y parametros del indice (y los subindices)
+        4. Reinicia el estado incremental
+        5. Publica la version cambiando el puntero ACTUAL de forma atomica:
+           un servidor que carga durante la reindexacion ve la version
+           anterior completa o la nueva completa, nunca una mezcla
         """
 
         print("FASE 5: PERSISTENCIA EN DISCO")
@@ -231,22 +563,53 @@ class SistemaFusionIndexacion:
             print("ERROR: Primero debes construir el indice")
             return False
         
+        # Todo se escribe en el directorio temporal (ya con el almacen fijado
+        # por cargar_datos), invisible para los lectores
+        estado = cargar_estado(directorio_actual(self.directorio_salida))
+        directorio = self.preparacion
+        
         # 1: Guardar indice FAISS
-        ruta_indice = os.path.join(self.directorio_salida, 'faiss_index.bin')
+        ruta_indice = os.path.join(directorio, 'faiss_index.bin')
         faiss.write_index(self.indice_faiss, ruta_indice)
+        self.normalizacion.guardar(directorio)
         print(f"Indice FAISS guardado: {ruta_indice}")
         
         # 2: Guardar mapeo indices
-        ruta_mapeo = os.path.join(self.directorio_salida, 'mapeo_indices.json')
-        with open(ruta_mapeo, 'w') as f:
-            json.dump(self.mapeo_indices, f, indent=2)
-        print(f"Mapeo guardado: {ruta_mapeo}")
-        
-        # 3: Guardar parametros de normalizacion
-        ruta_scaler = os.path.join(self.directorio_salida, 'scaler.pkl')
-        with open(ruta_scaler, 'wb') as f:
-            pickle.dump(self.scaler, f)
-        print("Parametros de normalizacion guardados")
+        self.mapeo_indices.guardar(directorio)
+        print(f"Mapeo guardado: {len(self.mapeo_indices)} nombres, "
+              f"{self.mapeo_indices.bytes_en_disco() / 1024:.1f} KB")
+        
+        # scaler.pkl anterior ya no corresponde al indice
+        eliminar_archivos_legados(self.directorio_salida)
+        
+        # 3: Guardar subindices y configuracion del indice
+        for nombre, indice in self.subindices.items():
+            faiss.write_index(indice, os.path.join(directorio, self.subconfiguracion[nombre]['archivo']))
+        if self.indice_binario is not None:
+            guardar_firma(directorio, self.indice_binario, self.transformacion_firma)
+        guardar_configuracion(directorio, {
+            'tipo': self.tipo_indice,
+            'parametros': self.parametros_indice,
+            **describir_indice(self.indice_faiss),
+            'disposicion': self.disposicion,
+            'subindices': self.subconfiguracion,
+            'proyeccion': self.descripcion_proyeccion,
+            'recall': self.recall,
+            'firma_binaria': self.firma_binaria
+        })
+        print(f"Configuracion del indice guardada ({len(self.subindices)} subindices)")
+        
+        # 4: Estado incremental nuevo (sin lapidas; se conservan las bajas)
+        guardar_estado(directorio, {
+            'eliminados': [],
+            'archivos_eliminados': estado['archivos_eliminados'],
+            'deriva': {}
+        })
+        
+        # 5: Publicacion atomica
+        self.version = publicar_version(self.directorio_salida, directorio, 'indexacion',
+                                        total_vectores=int(self.indice_faiss.ntotal))
+        self.preparacion = None
         
         print("Persistencia completada, Sistema listo para busquedas")
         return True
@@ -257,8 +620,9 @@ class SistemaFusionIndexacion:
         
         Pipeline completo:
         1. Cargar datos (vectores + metadatos)
-        2. Normalizar (Min-Max scaling)
-        3. Construir indice (FAISS)
+        2. Normalizar (Min-Max scaling) y, opcionalmente, proyectar (PCA / OPQ)
+        3. Construir indice (FAISS) y, opcionalmente, firmas binarias y
+           subindices por descriptor
         4. Crear mapeo (indice -> archivo)
         5. Guardar todo (persistencia)
         """
@@ -268,16 +632,32 @@ class SistemaFusionIndexacion:
         pasos = [
             ("Carga de datos", self.cargar_datos),
             ("Normalizacion Min-Max", self.normalizar_min_max),
+        ]
+        if self.dimension_proyeccion:
+            pasos.append(("Proyeccion " + self.tipo_proyeccion.upper(), self.proyectar_vectores))
+        pasos += [
             ("Construccion indice FAISS", self.construir_indice_faiss),
+        ]
+        if self.bits_firma:
+            pasos.append(("Firmas binarias", self.construir_firma_binaria))
+        if self.indices_por_descriptor:
+            pasos.append(("Subindices por descriptor", self.construir_subindices))
+        pasos += [
             ("Mapeo indices", self.crear_mapeo_indices),
             ("Persistencia en disco", self.guardar_indice)
         ]
         
-        for nombre_paso, metodo in pasos:
-            print(f"\nEjecutando: {nombre_paso}")
-            if not metodo():
-                print(f"ERROR: Fase interrumpida en: {nombre_paso}")
-                return False
+        try:
+            for nombre_paso, metodo in pasos:
+                print(f"\nEjecutando: {nombre_paso}")
+                if not metodo():
+                    print(f"ERROR: Fase interrumpida en: {nombre_paso}")
+                    return False
+        finally:
+            # Version a medio preparar (con su almacen fijado): no se publica
+            if self.preparacion is not None:
+                descartar_version(self.preparacion)
+                self.preparacion = None
         
         return True
     
@@ -287,9 +667,17 @@ class SistemaFusionIndexacion:
         
         return {
             'total_vectores': self.indice_faiss.ntotal,
+            'version': self.version,
             'dimension': self.indice_faiss.d,
-            'tipo_indice': 'IndexFlatL2',
-            'mapeo_completo': len(self.mapeo_indices) == self.indice_faiss.ntotal,
-            'normalizacion': 'Min-Max [0,1]',
+            **describir_indice(self.indice_faiss),
+            'mapeo_completo': (self.mapeo_indices is not None
+                               and len(self.mapeo_indices) == self.indice_faiss.ntotal),
+            'recall': self.recall,
+            'firma_binaria': (describir_firma(self.firma_binaria, self.vectores_raw.shape[1])
+                              if self.firma_binaria else None),
+            'subindices': {nombre: cfg['tipo'] for nombre, cfg in self.subconfiguracion.items()},
+            'proyeccion': (describir_proyeccion(self.descripcion_proyeccion, self.indice_faiss.ntotal)
+                           if self.descripcion_proyeccion else None),
+            'normalizacion': describir_normalizacion(self.indice_faiss),
             'metrica_similitud': 'Exponencial con escala 2.0'
         }
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Fusion tardia de listas de candidatos por descriptor (LBP, HOG, Gabor).
+Permite cambiar el peso de cada descriptor en la consulta sin reindexar.
+"""
+
+import numpy as np
+
+
+# Constante de Reciprocal Rank Fusion (valor habitual en la literatura)
+CONSTANTE_RRF = 60
+
+METODOS_FUSION = ('distancia', 'rango')
+
+
+def normalizar_pesos(pesos, nombres):
+    """
+    Vector de pesos en el orden de `nombres`.
+
+    Los descriptores sin peso explicito valen 0 si se dio algun peso,
+    o 1 si no se dio ninguno (todos por igual).
+
+    Returns:
+        numpy.ndarray: (B,) float64 con suma 1
+    """
+    if not pesos:
+        vector = np.ones(len(nombres))
+    else:
+        vector = np.array([float(pesos.get(nombre, 0.0)) for nombre in nombres])
+    if np.any(vector < 0) or vector.sum() <= 0:
+        raise ValueError("Los pesos deben ser no negativos y no todos cero")
+    return vector / vector.sum()
+
+
+def fusionar_distancias(distancias, pesos, longitudes):
+    """
+    Suma ponderada de distancias por descriptor.
+
+    Cada distancia L2^2 se divide por la longitud de su bloque (error
+    cuadratico medio por dimension), asi un peso igual significa igual
+    influencia aunque HOG tenga 1764 dimensiones y Gabor 16. El resultado
+    se escala a la dimension total: con pesos proporcionales a las
+    longitudes coincide con la L2^2 del vector fusionado.
+
+    Args:
+        distancias (numpy.ndarray): (B, C) distancia de cada candidato en cada descriptor
+        pesos (numpy.ndarray): (B,) pesos normalizados
+        longitudes (numpy.ndarray): (B,) dimensiones de cada bloque
+
+    Returns:
+        numpy.ndarray: (C,) distancia fusionada (menor = mas similar)
+    """
+    return longitudes.sum() * (pesos @ (distancias / longitudes[:, np.newaxis]))
+
+
+def fusionar_rangos(rangos, pesos, constante=CONSTANTE_RRF):
+    """
+    Reciprocal Rank Fusion ponderada.
+
+    Args:
+        rangos (numpy.ndarray): (B, C) posicion (0 = primero) del candidato en
+            la lista de cada descriptor; np.inf si no aparece
+        pesos (numpy.ndarray): (B,) pesos normalizados
+
+    Returns:
+        numpy.ndarray: (C,) puntuacion (mayor = mas similar)
+    """
+    return pesos @ (1.0 / (constante + 1.0 + rangos))
+
+
+def matriz_rangos(listas, candidatos):
+    """
+    Posicion de cada candidato en cada lista, en una sola pasada.
+
+    Args:
+        listas (list): B arreglos de IDs ordenados por distancia (-1 = hueco)
+        candidatos (numpy.ndarray): (C,) IDs unicos ordenados
+
+    Returns:
+        numpy.ndarray: (B, C) float64 con np.inf donde el candidato no aparece
+    """
+    rangos = np.full((len(listas), len(candidatos)), np.inf)
+    for b, lista in enumerate(listas):
+        validos = lista >= 0
+        posiciones = np.searchsorted(candidatos, lista[validos])
+        rangos[b, posiciones] = np.flatnonzero(validos)
+    return rangos
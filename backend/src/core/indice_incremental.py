@@ -0,0 +1,495 @@
+"""
+Altas y bajas incrementales sobre el indice FAISS ya construido.
+Evita reconstruir todo el indice por cada nueva huella enrolada.
+"""
+
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from src.core.almacen_caracteristicas import (
+    AlmacenCaracteristicas, fijar_almacen, PRIMER_ID_ALTA, VectoresPorId
+)
+from src.core.firmas_binarias import calcular_firmas, cargar_firma, guardar_firma
+from src.core.indices_faiss import (
+    cargar_configuracion, construir_indice_ids, describir_indice, envolver_transformaciones,
+    guardar_configuracion, indice_base, transformaciones_indice
+)
+from src.core.proyeccion import (
+    aplicar_transformacion, copiar_transformacion, integrar_transformaciones, recibe_normalizados
+)
+from src.core.tabla_nombres import TablaNombres
+from src.core.versiones_indice import (
+    almacen_version, directorio_actual, DIRECTORIO_ALMACEN, DIRECTORIO_ALTAS, preparar_version,
+    publicar_version, version_actual
+)
+
+
+ARCHIVO_ESTADO = 'estado_incremental.json'
+
+
+def cargar_estado(directorio_indices):
+    """
+    Estado incremental persistido junto al indice.
+
+    Returns:
+        dict: {'eliminados': [ids], 'archivos_eliminados': [nombres], 'deriva': {...}}
+    """
+    ruta = os.path.join(directorio_indices, ARCHIVO_ESTADO)
+    estado = {'eliminados': [], 'archivos_eliminados': [], 'deriva': {}}
+    if os.path.exists(ruta):
+        with open(ruta, 'r') as f:
+            estado.update(json.load(f))
+    return estado
+
+
+def guardar_estado(directorio_indices, estado):
+    """Escritura atomica: archivo temporal + os.replace."""
+    ruta = os.path.join(directorio_indices, ARCHIVO_ESTADO)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w') as f:
+        json.dump(estado, f, separators=(',', ':'))
+    os.replace(temporal, ruta)
+
+
+class IndiceIncremental:
+    """
+    Mantenimiento incremental de un indice con IDs estables (IndexIDMap2).
+
+    - ID estable = fila del vector en el almacen del corpus; las altas se
+      anexan a un segmento propio (datos/caracteristicas/altas) y reciben
+      PRIMER_ID_ALTA + su fila en el. El segmento solo crece y la
+      reingesta del corpus no lo toca: sus IDs y vectores sobreviven a
+      ingerir_directorio y entran en la siguiente indexacion completa.
+      El coste de un alta depende del lote, no del tamano del corpus.
+    - Las bajas se registran como lapidas: el ID se excluye de las
+      busquedas con un selector y se borra del mapeo. Cuando las lapidas
+      superan `fraccion_compactacion` del indice se compacta (remove_ids,
+      o reconstruccion desde el almacen si el tipo no lo soporta, p. ej. HNSW).
+    - El scaler queda congelado: los vectores nuevos se normalizan con el
+      min/max original (guardado con el indice) y se mide
+      cuanto se salen del rango [0, 1]. La proyeccion PCA / OPQ (si
+      existe) tambien queda congelada, igual que la proyeccion de las
+      firmas binarias: las altas solo agregan su firma.
+    - Cada guardado publica una version completa del indice (ver
+      versiones_indice); los buscadores la cargan sin reiniciar.
+
+    Attributes:
+        directorio_indices (str): Directorio raiz de indices (versiones + puntero ACTUAL)
+        version (str): Version cargada (None si el directorio no tiene versiones)
+        directorio_almacen (str): AlmacenCaracteristicas del corpus ingerido
+        directorio_altas (str): AlmacenCaracteristicas con las altas incrementales
+        directorio_vectores (str): Vectores del corpus fijados en la version cargada
+        indice_faiss (faiss.Index): IndexIDMap2 (con la proyeccion delante si la hay)
+        subindices (dict): {descriptor: faiss.IndexIDMap2} si se construyeron
+        indice_binario (faiss.IndexBinaryIDMap2): Firmas binarias (None si no hay prefiltro)
+        transformacion_firma (faiss.LinearTransform): Proyeccion congelada de las firmas
+        configuracion (dict): Contenido de configuracion_indice.json
+        mapeo_indices (TablaNombres): id_estable -> nombre_archivo (solo IDs vivos)
+        scaler (dict): Parametros de normalizacion (congelados)
+        normalizacion (NormalizacionMinMax): Min-Max congelado (normalizacion.npy)
+        estado (dict): Lapidas, archivos eliminados y deriva acumulada
+    """
+
+    def __init__(self, directorio_indices='datos/indices',
+                 directorio_almacen='datos/caracteristicas/almacen',
+                 directorio_altas='datos/caracteristicas/altas',
+                 fraccion_compactacion=0.1, umbral_deriva=0.01, tolerancia_exceso=0.25,
+                 ruta_vectores='datos/caracteristicas/vectores_caracteristicas.npy',
+                 ruta_json='datos/caracteristicas/caracteristicas_completas.json'):
+        self.directorio_indices = directorio_indices
+        self.directorio_almacen = directorio_almacen
+        self.directorio_altas = directorio_altas
+        self.directorio_vectores = None
+        self.ruta_vectores = ruta_vectores
+        self.ruta_json = ruta_json
+        self.fraccion_compactacion = fraccion_compactacion
+        self.umbral_deriva = umbral_deriva
+        self.tolerancia_exceso = tolerancia_exceso
+
+        self.indice_faiss = None
+        self.subindices = {}
+        self.indice_binario = None
+        self.transformacion_firma = None
+        self.configuracion = {}
+        self.mapeo_indices = None
+        self.scaler = None
+        self.normalizacion = None
+        self.estado = None
+        self.version = None
+        self.cargado = False
+
+    def cargar(self):
+        """
+        Flujo:
+        1. Carga indice (subindices por descriptor y firmas binarias), mapeo
+           y estado incremental de la version publicada
+        2. Convierte un indice plano sin IDs (anterior) a IndexIDMap2 y toma
+           la normalizacion (normalizacion.npy, o de scaler.pkl si es anterior)
+        3. Toma los vectores del corpus de la instantanea de la version; si
+           es anterior a ellas, del almacen (si solo hay .npy + JSON
+           legados, los migra a un almacen)
+        """
+        try:
+            # 1: Archivos del indice (version publicada)
+            self.version = version_actual(self.directorio_indices)
+            directorio = directorio_actual(self.directorio_indices)
+            ruta_indice = os.path.join(directorio, 'faiss_index.bin')
+            if not os.path.exists(ruta_indice):
+                print("No se encontro indice FAISS. Ejecuta indexacion primero.")
+                return False
+            self.indice_faiss = faiss.read_index(ruta_indice)
+
+            # Las altas y bajas crean tablas nuevas en memoria: no se mapea
+            self.mapeo_indices = TablaNombres.cargar(directorio, mapear=False)
+            self.estado = cargar_estado(directorio)
+
+            # Subindices por descriptor (mismos IDs que el indice principal)
+            self.configuracion = cargar_configuracion(directorio)
+            self.subindices = {
+                nombre: faiss.read_index(os.path.join(directorio, cfg['archivo']))
+                for nombre, cfg in self.configuracion.get('subindices', {}).items()
+            }
+            if self.configuracion.get('firma_binaria'):
+                self.indice_binario, self.transformacion_firma = cargar_firma(directorio)
+
+            # 2: Indice anterior sin IDs: los IDs implicitos son las filas
+            if not describir_indice(self.indice_faiss)['ids_estables']:
+                base = indice_base(self.indice_faiss)
+                if not isinstance(base, faiss.IndexFlat):
+                    print("ERROR: El indice no tiene IDs estables. Ejecuta la indexacion completa.")
+                    return False
+                vectores = base.reconstruct_n(0, base.ntotal)
+                self.indice_faiss = faiss.IndexIDMap2(faiss.IndexFlatL2(base.d))
+                self.indice_faiss.add_with_ids(vectores, np.arange(base.ntotal, dtype='int64'))
+                print("Indice convertido a IDs estables (IndexIDMap2)")
+            self.indice_faiss, self.normalizacion, self.scaler = integrar_transformaciones(
+                directorio, self.indice_faiss
+            )
+
+            # 3: Vectores originales del corpus (las filas coinciden con los IDs)
+            self.directorio_vectores = almacen_version(directorio)
+            if self.directorio_vectores is None:
+                if not AlmacenCaracteristicas.existe(self.directorio_almacen) and not self._migrar_legado():
+                    print("ERROR: Se requiere el almacen de caracteristicas para altas incrementales")
+                    return False
+                self.directorio_vectores = self.directorio_almacen
+
+            self.cargado = True
+            return True
+
+        except Exception as e:
+            print(f"Error cargando indice incremental: {e}")
+            return False
+
+    def _migrar_legado(self):
+        """Crea el almacen a partir de vectores .npy + metadatos JSON."""
+        if not (os.path.exists(self.ruta_vectores) and os.path.exists(self.ruta_json)):
+            return False
+        vectores = np.load(self.ruta_vectores, mmap_mode='r')
+        with open(self.ruta_json, 'r') as f:
+            metadatos = [{'archivo': item['archivo']} for item in json.load(f)]
+
+        almacen = AlmacenCaracteristicas(self.directorio_almacen, modo='w', dimension=vectores.shape[1])
+        almacen.agregar_lote(vectores, metadatos)
+        almacen.cerrar()
+        print(f"Almacen creado desde {self.ruta_vectores}: {len(almacen)} vectores")
+        return True
+
+    def _limpiar(self, vectores):
+        """
+        Limpia y recorta los vectores al rango del scaler congelado,
+        registrando la deriva. El indice los normaliza al agregarlos.
+        """
+        vectores = np.nan_to_num(vectores, nan=0.0, posinf=1.0, neginf=0.0)
+        normalizados = (vectores - self.scaler['min']) / self.scaler['range']
+
+        # Exceso fuera de [0, 1] en unidades normalizadas
+        exceso = np.maximum(normalizados - 1.0, 0.0) + np.maximum(-normalizados, 0.0)
+        fuera = exceso > 0
+        deriva = self.estado['deriva']
+        deriva['valores_totales'] = deriva.get('valores_totales', 0) + int(exceso.size)
+        deriva['valores_fuera_rango'] = deriva.get('valores_fuera_rango', 0) + int(fuera.sum())
+        deriva['max_exceso'] = max(deriva.get('max_exceso', 0.0), float(exceso.max(initial=0.0)))
+        columnas = set(deriva.get('caracteristicas_fuera_rango', []))
+        columnas.update(np.flatnonzero(fuera.any(axis=0)).tolist())
+        deriva['caracteristicas_fuera_rango'] = sorted(columnas)
+
+        # Igual que en las consultas: se recorta al rango del scaler
+        return np.ascontiguousarray(np.clip(vectores, self.scaler['min'], self.scaler['max']),
+                                    dtype='float32')
+
+    def informe_deriva(self):
+        """
+        Resume cuanto se salen los vectores agregados del min/max congelado.
+
+        Returns:
+            dict: Fraccion de valores fuera de rango, exceso maximo,
+                caracteristicas afectadas y si conviene un reajuste completo
+        """
+        deriva = self.estado['deriva'] if self.estado else {}
+        totales = deriva.get('valores_totales', 0)
+        fraccion = deriva.get('valores_fuera_rango', 0) / totales if totales else 0.0
+        max_exceso = deriva.get('max_exceso', 0.0)
+        return {
+            'valores_evaluados': totales,
+            'fraccion_fuera_rango': fraccion,
+            'max_exceso': max_exceso,
+            'caracteristicas_fuera_rango': len(deriva.get('caracteristicas_fuera_rango', [])),
+            'requiere_reajuste': fraccion > self.umbral_deriva or max_exceso > self.tolerancia_exceso
+        }
+
+    def agregar(self, vectores, metadatos):
+        """
+        Agrega un lote de imagenes sin reconstruir el indice.
+
+        Flujo:
+        1. Anexa los vectores originales al segmento de altas
+           (ID = PRIMER_ID_ALTA + fila; el contador es el manifiesto del
+           segmento, que nunca se reinicia)
+        2. Recorta al rango del scaler congelado (midiendo la deriva)
+        3. Agrega al indice con add_with_ids (normalizados, o sin normalizar
+           si el indice proyecta), a los subindices sus columnas normalizadas
+           y al indice binario las firmas; actualiza el mapeo
+
+        Args:
+            vectores (numpy.ndarray): Matriz (N, D) sin normalizar
+            metadatos (list): N diccionarios; sin 'archivo' se nombra alta_{fila:06d}.png
+
+        Returns:
+            dict: {'ids': [...], 'archivos': [...], 'deriva': informe_deriva()}
+        """
+        vectores = np.asarray(vectores, dtype=np.float32).reshape(-1, len(self.scaler['min']))
+
+        # 1: Segmento de altas (fuente de verdad para compactar o reindexar)
+        if AlmacenCaracteristicas.existe(self.directorio_altas):
+            altas = AlmacenCaracteristicas(self.directorio_altas, modo='a')
+        else:
+            altas = AlmacenCaracteristicas(self.directorio_altas, modo='w', dimension=vectores.shape[1],
+                                           disposicion=self.configuracion.get('disposicion'))
+        primera_fila = len(altas)
+        ids = np.arange(primera_fila, primera_fila + len(vectores), dtype='int64') + PRIMER_ID_ALTA
+        metadatos = [
+            {'archivo': f"alta_{primera_fila + i:06d}.png", **item, 'id': int(id_estable)}
+            if 'archivo' not in item else {**item, 'id': int(id_estable)}
+            for i, (item, id_estable) in enumerate(zip(metadatos, ids))
+        ]
+        altas.agregar_lote(vectores, metadatos)
+        altas.cerrar()
+
+        # 2-3: Indice (y subindices con sus columnas) y mapeo
+        limpios = self._limpiar(vectores)
+        normalizados = self.normalizacion.apply(limpios)
+        self.indice_faiss.add_with_ids(normalizados if recibe_normalizados(self.indice_faiss) else limpios, ids)
+        for nombre, indice in self.subindices.items():
+            cfg = self.configuracion['subindices'][nombre]
+            bloque = normalizados[:, cfg['desplazamiento']:cfg['desplazamiento'] + cfg['longitud']]
+            indice.add_with_ids(np.ascontiguousarray(bloque), ids)
+        if self.indice_binario is not None:
+            self.indice_binario.add_with_ids(calcular_firmas(self.transformacion_firma, limpios), ids)
+        nombres = [item['archivo'] for item in metadatos]
+        self.mapeo_indices = self.mapeo_indices.agregar(ids, nombres)
+        # Re-enrolar un archivo eliminado lo vuelve a habilitar
+        self.estado['archivos_eliminados'] = sorted(set(self.estado['archivos_eliminados']) - set(nombres))
+
+        return {
+            'ids': ids.tolist(),
+            'archivos': [item['archivo'] for item in metadatos],
+            'deriva': self.informe_deriva()
+        }
+
+    def eliminar(self, ids=None, archivos=None):
+        """
+        Da de baja imagenes por ID estable o por nombre de archivo.
+
+        Flujo:
+        1. Resuelve los IDs (los nombres con la busqueda inversa de la tabla)
+        2. Registra lapidas y quita las entradas del mapeo
+        3. Compacta si las lapidas superan fraccion_compactacion
+
+        Returns:
+            dict: {'eliminados': [...], 'no_encontrados': [...], 'compactado': bool}
+        """
+        # 1: Resolver IDs (clave = como se pidio, para informar los no encontrados)
+        claves = [str(i) for i in (ids or [])] + list(archivos or [])
+        solicitados = [int(i) for i in (ids or [])]
+        if archivos:
+            solicitados += self.mapeo_indices.ids_de(archivos).tolist()
+        nombres = self.mapeo_indices.nombres(solicitados)
+
+        # 2: Lapidas (la busqueda las excluye con un selector)
+        eliminados = []
+        no_encontrados = []
+        lapidas = set(self.estado['eliminados'])
+        archivos_eliminados = set(self.estado['archivos_eliminados'])
+        for clave, id_estable, nombre in zip(claves, solicitados, nombres):
+            if nombre is None or id_estable in lapidas:
+                no_encontrados.append(clave)
+                continue
+            lapidas.add(id_estable)
+            archivos_eliminados.add(nombre)
+            eliminados.append(id_estable)
+        self.mapeo_indices = self.mapeo_indices.eliminar(eliminados)
+        self.estado['eliminados'] = sorted(lapidas)
+        self.estado['archivos_eliminados'] = sorted(archivos_eliminados)
+
+        # 3: Compactacion periodica
+        compactado = False
+        if lapidas and len(lapidas) >= self.fraccion_compactacion * self.indice_faiss.ntotal:
+            compactado = self.compactar()['compactado']
+
+        return {'eliminados': eliminados, 'no_encontrados': no_encontrados, 'compactado': compactado}
+
+    def compactar(self):
+        """
+        Elimina fisicamente las lapidas del indice.
+
+        Flujo:
+        1. remove_ids si el tipo de indice lo soporta (Flat; tambien el
+           indice binario de firmas)
+        2. Si no, reconstruye el indice con los IDs vivos a partir del
+           almacen, con el scaler congelado y los mismos parametros
+           - HNSW: no admite borrados
+           - IVF / IVF-PQ: IndexIDMap2.remove_ids supone que el indice
+             interno renumera sus filas como IndexFlat y desalinea los
+             IDs; se reutilizan el cuantizador y los codebooks entrenados
+
+        Returns:
+            dict: {'compactado': bool, 'eliminados': int, 'tiempo_ms': float}
+        """
+        lapidas = np.array(self.estado['eliminados'], dtype='int64')
+        if len(lapidas) == 0:
+            return {'compactado': False, 'eliminados': 0, 'tiempo_ms': 0.0}
+
+        inicio = time.perf_counter()
+        eliminados = self._compactar_indice(self.indice_faiss, lapidas, None)
+        for nombre in list(self.subindices):
+            self._compactar_indice(self.subindices[nombre], lapidas, nombre)
+        if self.indice_binario is not None:
+            self.indice_binario.remove_ids(lapidas)
+
+        self.estado['eliminados'] = []
+        tiempo = (time.perf_counter() - inicio) * 1000
+        print(f"Indice compactado: {eliminados} lapidas eliminadas en {tiempo:.1f} ms")
+        return {'compactado': True, 'eliminados': eliminados, 'tiempo_ms': tiempo}
+
+    def _compactar_indice(self, indice, lapidas, descriptor):
+        """Compacta el indice principal (descriptor None) o un subindice."""
+        base = indice_base(indice)
+        entrenado = base if isinstance(base, faiss.IndexIVF) else None
+        if entrenado is None:
+            try:
+                # 1: Borrado directo
+                return int(indice.remove_ids(lapidas))
+            except RuntimeError:
+                pass
+
+        # 2: Reconstruccion desde el almacen
+        nuevo = self._reconstruir(descriptor, entrenado)
+        if descriptor is None:
+            self.indice_faiss = nuevo
+        else:
+            self.subindices[descriptor] = nuevo
+        return indice.ntotal - nuevo.ntotal
+
+    def _reconstruir(self, descriptor, entrenado=None):
+        """
+        Reconstruye un indice con los IDs vivos, sin reajustar el scaler.
+
+        Con `entrenado` (IVF) se copia su entrenamiento y solo se vuelven a
+        agregar los vectores; si no, se crea y entrena un indice nuevo.
+        """
+        vivos = np.array(self.mapeo_indices.ids, dtype='int64')
+
+        vectores = VectoresPorId.abrir(self.directorio_vectores, self.directorio_altas)[vivos]
+        vectores = np.nan_to_num(vectores, nan=0.0, posinf=1.0, neginf=0.0)
+        limpios = np.clip(vectores, self.scaler['min'], self.scaler['max'])
+
+        # Principal: su cadena (proyeccion con la normalizacion plegada) o los
+        # vectores normalizados si no tiene; subindice: sus columnas normalizadas
+        cfg = self.configuracion
+        cadena = []
+        normalizados = aplicar_transformacion(self.normalizacion, limpios)
+        if descriptor is None:
+            cadena = transformaciones_indice(self.indice_faiss)
+            transformados = normalizados if not cadena else limpios
+            for transformacion in cadena:
+                transformados = aplicar_transformacion(transformacion, transformados)
+        else:
+            cfg = self.configuracion['subindices'][descriptor]
+            transformados = normalizados[:, cfg['desplazamiento']:cfg['desplazamiento'] + cfg['longitud']]
+
+        if entrenado is not None:
+            base = faiss.clone_index(entrenado)
+            base.reset()
+            indice = faiss.IndexIDMap2(base)
+            indice.add_with_ids(np.ascontiguousarray(transformados, dtype='float32'), vivos)
+        else:
+            indice, _, _ = construir_indice_ids(
+                cfg.get('tipo', 'flat'), transformados, vivos, cfg.get('parametros')
+            )
+
+        if cadena:
+            indice = envolver_transformaciones(indice, [copiar_transformacion(t) for t in cadena])
+        return indice
+
+    def guardar(self):
+        """
+        Publica indice, subindices, firmas, mapeo, estado y la instantanea
+        del almacen como una version nueva.
+
+        Flujo:
+        1. Verifica que nadie haya publicado otra version desde la carga
+           (p. ej. una reindexacion en otro proceso)
+        2. Escribe todos los archivos en un directorio temporal
+        3. Cambia el puntero ACTUAL de forma atomica
+
+        Returns:
+            str: Version publicada
+        """
+        # 1: Conflicto con otra publicacion
+        if version_actual(self.directorio_indices) != self.version:
+            raise RuntimeError(f"El indice cambio en disco (version {version_actual(self.directorio_indices)}, "
+                               f"cargada {self.version}); vuelve a cargarlo")
+
+        # 2: Version completa (con el scaler congelado)
+        directorio = preparar_version(self.directorio_indices)
+        faiss.write_index(self.indice_faiss, os.path.join(directorio, 'faiss_index.bin'))
+        self.normalizacion.guardar(directorio)
+        for nombre, indice in self.subindices.items():
+            faiss.write_index(indice, os.path.join(directorio, self.configuracion['subindices'][nombre]['archivo']))
+        if self.indice_binario is not None:
+            guardar_firma(directorio, self.indice_binario, self.transformacion_firma)
+        self.mapeo_indices.guardar(directorio)
+        guardar_configuracion(directorio, self.configuracion)
+        guardar_estado(directorio, self.estado)
+        # El corpus sigue siendo el de la version cargada (sus IDs son esas
+        # filas aunque se haya reingerido); las altas, el segmento actual
+        fijar_almacen(self.directorio_vectores, os.path.join(directorio, DIRECTORIO_ALMACEN))
+        if AlmacenCaracteristicas.existe(self.directorio_altas):
+            fijar_almacen(self.directorio_altas, os.path.join(directorio, DIRECTORIO_ALTAS))
+
+        # 3: Publicacion
+        self.version = publicar_version(self.directorio_indices, directorio, 'incremental',
+                                        total_vectores=int(self.indice_faiss.ntotal),
+                                        activos=len(self.mapeo_indices))
+        self.directorio_vectores = almacen_version(directorio_actual(self.directorio_indices))
+        return self.version
+
+    def obtener_estadisticas(self):
+        if not self.cargado:
+            return {"estado": "No cargado"}
+
+        return {
+            'version': self.version,
+            'total_vectores': self.indice_faiss.ntotal,
+            'activos': len(self.mapeo_indices),
+            'lapidas': len(self.estado['eliminados']),
+            **describir_indice(self.indice_faiss),
+            'subindices': list(self.subindices),
+            'firmas_binarias': self.indice_binario.ntotal if self.indice_binario is not None else None,
+            'deriva': self.informe_deriva()
+        }
@@ -0,0 +1,388 @@
+"""
+Fabrica de indices FAISS configurables (Flat, SQ8 / fp16, IVF-Flat, HNSW, IVF-PQ).
+Centraliza la construccion, el entrenamiento y los parametros de consulta.
+"""
+
+import json
+import os
+
+import faiss
+import numpy as np
+
+
+# Tipos soportados -> nombre de la clase FAISS resultante
+TIPOS_INDICE = {
+    'flat': 'IndexFlatL2',
+    'sq8': 'IndexScalarQuantizer',
+    'sqfp16': 'IndexScalarQuantizer',
+    'ivf': 'IndexIVFFlat',
+    'hnsw': 'IndexHNSWFlat',
+    'ivfpq': 'IndexIVFPQ'
+}
+
+# Puntos de entrenamiento por centroide que recomienda FAISS
+PUNTOS_POR_CENTROIDE = 39
+
+ARCHIVO_CONFIGURACION = 'configuracion_indice.json'
+
+# Cuantizacion escalar de cada tipo 'sq*' (un codigo por dimension)
+CUANTIZADORES = {
+    'sq8': faiss.ScalarQuantizer.QT_8bit,
+    'sqfp16': faiss.ScalarQuantizer.QT_fp16
+}
+NOMBRES_CUANTIZADOR = {
+    faiss.ScalarQuantizer.QT_8bit: 'QT_8bit',
+    faiss.ScalarQuantizer.QT_fp16: 'QT_fp16'
+}
+
+# Verificacion de recall contra busqueda exacta al construir
+CONSULTAS_RECALL = 200
+K_RECALL = 10
+
+
+def _divisor_cercano(dimension, objetivo):
+    """Mayor divisor de `dimension` que no supera `objetivo` (PQ exige m | d)."""
+    for m in range(min(objetivo, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def resolver_parametros(tipo, dimension, num_vectores, parametros=None):
+    """
+    Completa los parametros de construccion con valores por defecto
+    adaptados al tamano del dataset.
+
+    Valores por defecto:
+    - ivf / ivfpq: nlist = 4 * sqrt(N), limitado a N / 39 (entrenamiento estable)
+    - ivf / ivfpq: nprobe = nlist / 16 (minimo 1)
+    - ivfpq: m = mayor divisor de la dimension <= 64, nbits = 8 (o menos si N < 256)
+    - hnsw: M = 32, efConstruction = 200, efSearch = 64
+
+    Args:
+        tipo (str): Uno de TIPOS_INDICE
+        dimension (int): Dimension de los vectores
+        num_vectores (int): Vectores que se indexaran
+        parametros (dict): Valores explicitos (tienen prioridad)
+
+    Returns:
+        dict: Parametros completos
+    """
+    if tipo not in TIPOS_INDICE:
+        raise ValueError(f"Tipo de indice no soportado: {tipo} (opciones: {', '.join(TIPOS_INDICE)})")
+
+    parametros = dict(parametros or {})
+    resueltos = {}
+
+    if tipo in ('ivf', 'ivfpq'):
+        nlist = parametros.get('nlist') or int(4 * np.sqrt(max(num_vectores, 1)))
+        nlist = max(1, min(nlist, num_vectores // PUNTOS_POR_CENTROIDE or 1))
+        resueltos['nlist'] = nlist
+        resueltos['nprobe'] = min(parametros.get('nprobe') or max(1, nlist // 16), nlist)
+
+    if tipo == 'ivfpq':
+        resueltos['m'] = _divisor_cercano(dimension, parametros.get('m') or 64)
+        # El cuantizador necesita al menos 2^nbits puntos de entrenamiento
+        nbits = parametros.get('nbits') or 8
+        resueltos['nbits'] = max(1, min(nbits, int(np.log2(max(num_vectores, 2)))))
+
+    if tipo == 'hnsw':
+        resueltos['M'] = parametros.get('M') or 32
+        resueltos['efConstruction'] = parametros.get('efConstruction') or 200
+        resueltos['efSearch'] = parametros.get('efSearch') or 64
+
+    resueltos['muestra_entrenamiento'] = parametros.get('muestra_entrenamiento') or 100000
+    return resueltos
+
+
+def crear_indice(tipo, dimension, parametros):
+    """
+    Crea un indice vacio (sin entrenar) del tipo pedido con metrica L2.
+
+    Args:
+        tipo (str): Uno de TIPOS_INDICE
+        dimension (int): Dimension de los vectores
+        parametros (dict): Resultado de resolver_parametros
+
+    Returns:
+        faiss.Index: Indice listo para train/add
+    """
+    if tipo == 'flat':
+        return faiss.IndexFlatL2(dimension)
+
+    if tipo in CUANTIZADORES:
+        # Rango por dimension aprendido en el entrenamiento (sq8); fp16 no entrena
+        return faiss.IndexScalarQuantizer(dimension, CUANTIZADORES[tipo], faiss.METRIC_L2)
+
+    if tipo == 'hnsw':
+        indice = faiss.IndexHNSWFlat(dimension, parametros['M'])
+        indice.hnsw.efConstruction = parametros['efConstruction']
+        indice.hnsw.efSearch = parametros['efSearch']
+        return indice
+
+    # IVF: el cuantizador grueso es un indice plano sobre los centroides
+    cuantizador = faiss.IndexFlatL2(dimension)
+    if tipo == 'ivf':
+        indice = faiss.IndexIVFFlat(cuantizador, dimension, parametros['nlist'])
+    else:
+        indice = faiss.IndexIVFPQ(
+            cuantizador, dimension, parametros['nlist'], parametros['m'], parametros['nbits']
+        )
+    indice.nprobe = parametros['nprobe']
+    return indice
+
+
+def entrenar_indice(indice, vectores, tamano_muestra, semilla=0):
+    """
+    Entrena el indice con una muestra aleatoria de los vectores.
+
+    Flujo:
+    1. Omite indices que no requieren entrenamiento (Flat, fp16, HNSW)
+    2. Toma hasta `tamano_muestra` filas sin reemplazo
+    3. Entrena (k-means de IVF, codebooks de PQ, rangos de SQ8)
+
+    Returns:
+        int: Filas usadas para entrenar (0 si no hizo falta)
+    """
+    if indice.is_trained:
+        return 0
+
+    num_vectores = len(vectores)
+    if num_vectores > tamano_muestra:
+        generador = np.random.default_rng(semilla)
+        filas = np.sort(generador.choice(num_vectores, tamano_muestra, replace=False))
+        muestra = np.ascontiguousarray(vectores[filas], dtype='float32')
+    else:
+        muestra = np.ascontiguousarray(vectores, dtype='float32')
+
+    indice.train(muestra)
+    return len(muestra)
+
+
+def construir_indice_ids(tipo, vectores, ids, parametros=None):
+    """
+    Crea, entrena y llena un indice con IDs estables (IndexIDMap2).
+
+    Args:
+        tipo (str): Uno de TIPOS_INDICE
+        vectores (numpy.ndarray): Matriz (N, D) ya normalizada
+        ids (numpy.ndarray): ID estable de cada fila (int64)
+        parametros (dict): Parametros explicitos (se completan con resolver_parametros)
+
+    Returns:
+        tuple: (indice, parametros_resueltos, filas_entrenamiento)
+    """
+    vectores = np.ascontiguousarray(vectores, dtype='float32')
+    parametros = resolver_parametros(tipo, vectores.shape[1], len(vectores), parametros)
+    base = crear_indice(tipo, vectores.shape[1], parametros)
+    filas_entrenamiento = entrenar_indice(base, vectores, parametros['muestra_entrenamiento'])
+
+    indice = faiss.IndexIDMap2(base)
+    indice.add_with_ids(vectores, np.ascontiguousarray(ids, dtype='int64'))
+    return indice, parametros, filas_entrenamiento
+
+
+def envolver_transformaciones(indice, transformaciones):
+    """
+    Antepone transformaciones lineales al indice (IndexPreTransform).
+
+    Los vectores que se agregan o consultan pasan por la cadena en orden
+    dentro de FAISS, en una sola llamada por lote.
+
+    Args:
+        indice (faiss.Index): Indice construido sobre los vectores ya transformados
+        transformaciones (list): faiss.VectorTransform en orden de aplicacion
+    """
+    envuelto = faiss.IndexPreTransform(indice)
+    for transformacion in reversed(transformaciones):
+        envuelto.prepend_transform(transformacion)
+    return envuelto
+
+
+def transformaciones_indice(indice):
+    """Cadena de transformaciones del indice ([] si no es IndexPreTransform)."""
+    indice = faiss.downcast_index(indice)
+    if not isinstance(indice, faiss.IndexPreTransform):
+        return []
+    return [faiss.downcast_VectorTransform(indice.chain.at(i)) for i in range(indice.chain.size())]
+
+
+def indice_con_ids(indice):
+    """Indice sin la capa de transformaciones (IndexPreTransform) si la tiene."""
+    indice = faiss.downcast_index(indice)
+    if isinstance(indice, faiss.IndexPreTransform):
+        return faiss.downcast_index(indice.index)
+    return indice
+
+
+def medir_recall(indice, vectores, ids, k=K_RECALL, num_consultas=CONSULTAS_RECALL, semilla=0):
+    """
+    Recall@k del indice frente a la busqueda exacta en float32.
+
+    Flujo:
+    1. Toma num_consultas vectores del propio conjunto como consultas
+    2. Vecinos exactos con faiss.knn (sin construir un segundo indice)
+    3. Compara con los k vecinos del indice (IDs estables)
+
+    Returns:
+        dict: {'k', 'consultas', 'recall'}
+    """
+    vectores = np.ascontiguousarray(vectores, dtype='float32')
+    generador = np.random.default_rng(semilla)
+    filas = np.sort(generador.choice(len(vectores), min(num_consultas, len(vectores)), replace=False))
+    k = min(k, len(vectores))
+
+    # 1-2: Referencia exacta
+    consultas = vectores[filas]
+    _, exactos = faiss.knn(consultas, vectores, k)
+
+    # 3: Interseccion por consulta
+    _, aproximados = indice.search(consultas, k)
+    aciertos = sum(
+        len(np.intersect1d(ids[fila_exacta], fila_aproximada))
+        for fila_exacta, fila_aproximada in zip(exactos, aproximados)
+    )
+    return {'k': k, 'consultas': len(filas), 'recall': aciertos / float(k * len(filas))}
+
+
+def indice_base(indice):
+    """Indice interno sin las capas de transformaciones y de IDs (IndexIDMap2)."""
+    indice = indice_con_ids(indice)
+    if isinstance(indice, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(indice.index)
+    return indice
+
+
+def tipo_indice(indice):
+    """Nombre real de la clase FAISS (p. ej. 'IndexIVFPQ')."""
+    return type(indice_base(indice)).__name__
+
+
+def describir_indice(indice):
+    """
+    Tipo real y parametros de consulta vigentes del indice cargado.
+
+    Returns:
+        dict: {'tipo_indice', 'ids_estables', 'pretransformaciones', ...parametros relevantes}
+    """
+    base = indice_base(indice)
+    descripcion = {
+        'tipo_indice': type(base).__name__,
+        'ids_estables': isinstance(indice_con_ids(indice), (faiss.IndexIDMap, faiss.IndexIDMap2)),
+        'pretransformaciones': [type(t).__name__ for t in transformaciones_indice(indice)]
+    }
+    if isinstance(base, faiss.IndexScalarQuantizer):
+        descripcion['cuantizacion'] = NOMBRES_CUANTIZADOR.get(base.sq.qtype, str(base.sq.qtype))
+        descripcion['bytes_por_vector'] = base.code_size
+    if isinstance(base, faiss.IndexIVF):
+        descripcion['nlist'] = base.nlist
+        descripcion['nprobe'] = base.nprobe
+    if isinstance(base, faiss.IndexIVFPQ):
+        descripcion['m'] = base.pq.M
+        descripcion['nbits'] = base.pq.nbits
+    if isinstance(base, faiss.IndexHNSW):
+        descripcion['M'] = base.hnsw.nb_neighbors(1)
+        descripcion['efConstruction'] = base.hnsw.efConstruction
+        descripcion['efSearch'] = base.hnsw.efSearch
+    return descripcion
+
+
+def admite_selector_rango(indice):
+    """
+    Si range_search acepta el selector de exclusion en sus parametros.
+
+    IndexIDMap2.range_search vuelve a envolver el selector en unos
+    SearchParameters genericos y pierde los SearchParametersIVF (nprobe):
+    los indices IVF los rechazan ("IndexIVF params have incorrect type").
+    Con ellos las exclusiones se aplican sobre el resultado.
+    """
+    return not isinstance(indice_base(indice), faiss.IndexIVF)
+
+
+def parametros_busqueda(indice, nprobe=None, ef_search=None, excluidos=None, incluidos=None):
+    """
+    Parametros de consulta para una sola busqueda.
+
+    Se pasan a index.search(..., params=...) en lugar de modificar el
+    indice compartido, asi dos peticiones simultaneas no se pisan.
+
+    Args:
+        nprobe (int): Listas visitadas (IVF)
+        ef_search (int): Cola de busqueda (HNSW)
+        excluidos (numpy.ndarray): IDs eliminados (lapidas) que no deben devolverse
+        incluidos (numpy.ndarray): Unicos IDs candidatos (prefiltro binario);
+            tiene prioridad sobre `excluidos`, que ya debe venir descontado
+
+    Returns:
+        faiss.SearchParameters o None si no hay nada que ajustar
+    """
+    base = indice_base(indice)
+    selector = None
+    if incluidos is not None:
+        lote = faiss.IDSelectorBatch(np.ascontiguousarray(incluidos, dtype='int64'))
+        selector = lote
+    elif excluidos is not None and len(excluidos):
+        lote = faiss.IDSelectorBatch(np.ascontiguousarray(excluidos, dtype='int64'))
+        selector = faiss.IDSelectorNot(lote)
+
+    if isinstance(base, faiss.IndexIVF) and (nprobe is not None or selector is not None):
+        params = faiss.SearchParametersIVF(nprobe=min(int(nprobe or base.nprobe), base.nlist))
+    elif isinstance(base, faiss.IndexHNSW) and (ef_search is not None or selector is not None):
+        params = faiss.SearchParametersHNSW(efSearch=int(ef_search or base.hnsw.efSearch))
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+
+    if selector is not None:
+        params.sel = selector
+        # Los selectores deben vivir mientras se usen los parametros
+        params.referencias = (lote, selector)
+    return params
+
+
+def leer_indice(ruta, mapear=False, tipo=None):
+    """
+    Lee un indice serializado, opcionalmente mapeado en memoria.
+
+    Con mmap los datos del indice no se copian al heap del proceso: varios
+    procesos del servidor comparten las mismas paginas fisicas y el
+    arranque no crece con el tamano del corpus.
+    - IVF / IVF-PQ: IO_FLAG_MMAP (listas invertidas mapeadas)
+    - Flat / HNSW: IO_FLAG_MMAP_IFC (codigos planos mapeados en su lugar)
+
+    Args:
+        ruta (str): Archivo faiss_index.bin
+        mapear (bool): Intentar mmap (solo lectura)
+        tipo (str): Tipo guardado en configuracion_indice.json (elige la bandera)
+
+    Returns:
+        tuple: (indice, mapeado)
+    """
+    if mapear:
+        banderas = [faiss.IO_FLAG_MMAP_IFC, faiss.IO_FLAG_MMAP]
+        if tipo in ('ivf', 'ivfpq'):
+            banderas.reverse()
+        for bandera in banderas:
+            try:
+                return faiss.read_index(ruta, bandera | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError:
+                continue
+    return faiss.read_index(ruta), False
+
+
+def guardar_configuracion(directorio, configuracion):
+    """Guarda tipo y parametros del indice junto a faiss_index.bin."""
+    ruta = os.path.join(directorio, ARCHIVO_CONFIGURACION)
+    with open(ruta, 'w') as f:
+        json.dump(configuracion, f, indent=2)
+    return ruta
+
+
+def cargar_configuracion(directorio):
+    """Configuracion persistida del indice, o {} si el indice es anterior."""
+    ruta = os.path.join(directorio, ARCHIVO_CONFIGURACION)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, 'r') as f:
+        return json.load(f)
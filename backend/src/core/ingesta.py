@@ -0,0 +1,289 @@
+"""
+Ingesta en una sola pasada: decodificar -> preprocesar -> extraer -> almacenar.
+Evita escribir y volver a leer las imagenes procesadas en PNG.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from src.core.almacen_caracteristicas import AlmacenCaracteristicas
+from src.core.cache_caracteristicas import CacheCaracteristicas, hash_contenido
+from src.core.extraccion_caracteristicas import ExtractorMasivo
+from src.core.manifiesto_preprocesamiento import ManifiestoPreprocesamiento
+from src.core.preprocesamiento import PreprocesadorUnificado
+
+
+class EscritorSegundoPlano:
+    """
+    Hilo que escribe imagenes procesadas en disco sin bloquear la ingesta.
+
+    La cola esta acotada (`max_pendientes`) para limitar la memoria si el
+    disco es mas lento que la extraccion. cv2.imwrite libera el GIL.
+
+    Attributes:
+        escritas (int): Imagenes escritas correctamente
+        errores (list): (ruta, mensaje) de escrituras fallidas
+    """
+
+    def __init__(self, max_pendientes=64):
+        self.cola = queue.Queue(maxsize=max_pendientes)
+        self.escritas = 0
+        self.errores = []
+        self.hilo = threading.Thread(target=self._ejecutar, daemon=True)
+        self.hilo.start()
+
+    def _ejecutar(self):
+        while True:
+            tarea = self.cola.get()
+            if tarea is None:
+                break
+            ruta, imagen = tarea
+            try:
+                if cv2.imwrite(ruta, imagen):
+                    self.escritas += 1
+                else:
+                    self.errores.append((ruta, "cv2.imwrite fallo"))
+            except Exception as e:
+                self.errores.append((ruta, str(e)))
+
+    def encolar(self, ruta, imagen):
+        self.cola.put((ruta, imagen))
+
+    def cerrar(self):
+        """Espera a que se escriban todas las imagenes encoladas."""
+        self.cola.put(None)
+        self.hilo.join()
+
+
+class IngestaUnificada:
+    """
+    Etapa de ingesta que fusiona preprocesamiento y extraccion.
+
+    Cada imagen fuente se decodifica una sola vez, se preprocesa y se
+    extrae en memoria; el vector se anexa al AlmacenCaracteristicas. El PNG
+    procesado es opcional y se escribe en un hilo en segundo plano.
+
+    Con cache, la clave es el hash del archivo fuente + la configuracion
+    de preprocesamiento y extraccion: las fuentes sin cambios no se
+    decodifican (salvo que falte su PNG procesado).
+
+    Attributes:
+        preprocesador (PreprocesadorUnificado): Etapa de preprocesamiento
+        extractor (ExtractorMasivo): Etapa de extraccion
+    """
+
+    def __init__(self, preprocesador=None, extractor=None):
+        self.preprocesador = preprocesador or PreprocesadorUnificado()
+        self.extractor = extractor or ExtractorMasivo()
+
+    def configuracion(self):
+        return {
+            'preprocesamiento': self.preprocesador.configuracion(),
+            'extraccion': self.extractor.configuracion()
+        }
+
+    def procesar_ruta(self, ruta_entrada, devolver_imagen=False):
+        """
+        Decodifica, preprocesa y extrae una imagen sin propagar errores.
+
+        Returns:
+            tuple: (vector, imagen_procesada, error)
+                - vector: Fila float32 o None si fallo
+                - imagen_procesada: Solo si devolver_imagen, si no None
+        """
+        try:
+            img_original = cv2.imread(ruta_entrada)
+            if img_original is None:
+                return None, None, "No se pudo leer la imagen"
+
+            procesada = self.preprocesador.preprocesar_imagen(img_original)
+            matriz, _ = self.extractor.extraer_lote(procesada)
+            return matriz[0], (procesada if devolver_imagen else None), None
+        except Exception as e:
+            return None, None, str(e)
+
+    def ingerir_directorio(self, directorio_entrada, directorio_almacen, directorio_procesadas=None,
+                           num_procesos=1, tamano_chunk=8, ruta_cache=None, tamano_bloque=256,
+                           ruta_manifiesto=None):
+        """
+        Ingesta completa de un dataset en una sola pasada.
+
+        Flujo:
+        1. Lista las imagenes fuente (mismo orden y formatos que preprocesar_directorio)
+        2. (Con cache) separa las fuentes ya ingeridas con esta configuracion
+        3. Para cada fuente pendiente: decodifica -> preprocesa -> extrae
+           (secuencial o en un pool de procesos, respetando el orden)
+        4. Anexa los vectores al almacen por bloques
+        5. (Opcional) escribe proc_XXXXXX.png en un hilo en segundo plano
+
+        Con manifiesto, cada fuente conserva su nombre proc_XXXXXX.png entre
+        ejecuciones, las fuentes sin cambios reutilizan el hash registrado
+        (no se releen) y se borran los PNG de las fuentes que desaparecieron.
+
+        Args:
+            directorio_entrada (str): Directorio con el dataset original
+            directorio_almacen (str): AlmacenCaracteristicas de salida (se recrea)
+            directorio_procesadas (str): Donde escribir los PNG procesados (None = no escribir)
+            num_procesos (int): Procesos trabajadores (1 = secuencial, None = todos los nucleos)
+            tamano_chunk (int): Imagenes enviadas a cada trabajador por tarea
+            ruta_cache (str): Archivo SQLite de la cache de caracteristicas (opcional)
+            tamano_bloque (int): Filas acumuladas antes de cada escritura en el almacen
+            ruta_manifiesto (str): ManifiestoPreprocesamiento para nombres estables (opcional)
+
+        Returns:
+            int: Numero de imagenes ingeridas
+        """
+
+        # 1: Listar fuentes; el nombre depende de la posicion en el listado
+        # o, con manifiesto, del ID estable de la fuente
+        rutas_imagenes = self.preprocesador.listar_imagenes(directorio_entrada)
+        guardar_png = directorio_procesadas is not None
+        if guardar_png:
+            os.makedirs(directorio_procesadas, exist_ok=True)
+
+        manifiesto = None
+        hashes = {}
+        cambiadas = set(range(len(rutas_imagenes)))
+        if ruta_manifiesto:
+            manifiesto = ManifiestoPreprocesamiento(ruta_manifiesto, directorio_entrada)
+            plan, eliminadas = manifiesto.planificar(rutas_imagenes)
+            nombres = [item['nombre'] for item in plan]
+            cambiadas = set()
+            for i, item in enumerate(plan):
+                if item['cambiada']:
+                    cambiadas.add(i)
+                else:
+                    hashes[i] = item['hash']
+            for item in eliminadas:
+                ruta_png = os.path.join(directorio_procesadas or '', item['nombre'])
+                if guardar_png and os.path.exists(ruta_png):
+                    os.remove(ruta_png)
+                manifiesto.olvidar(item['relativa'])
+            print(f"Manifiesto: {len(cambiadas)} nuevas o modificadas, "
+                  f"{len(rutas_imagenes) - len(cambiadas)} sin cambios, {len(eliminadas)} eliminadas")
+        else:
+            nombres = [f"proc_{i:06d}.png" for i in range(len(rutas_imagenes))]
+
+        # 2: Cache por contenido de la fuente
+        cache = None
+        pendientes = list(range(len(rutas_imagenes)))
+        if ruta_cache or manifiesto is not None:
+            for i in cambiadas:
+                with open(rutas_imagenes[i], 'rb') as f:
+                    hashes[i] = hash_contenido(f.read())
+        if ruta_cache:
+            cache = CacheCaracteristicas(ruta_cache, self.configuracion())
+            pendientes = []
+            for i in range(len(rutas_imagenes)):
+                en_cache = cache.contiene(hashes[i])
+                falta_png = guardar_png and not os.path.exists(
+                    os.path.join(directorio_procesadas, nombres[i]))
+                if falta_png or not en_cache:
+                    pendientes.append(i)
+            print(f"Cache de ingesta: {len(rutas_imagenes) - len(pendientes)} recuperadas, "
+                  f"{len(pendientes)} por procesar")
+
+        if num_procesos is None:
+            num_procesos = os.cpu_count() or 1
+        num_procesos = max(1, min(num_procesos, len(pendientes) or 1))
+        print(f"Ingiriendo {len(pendientes)} imagenes ({num_procesos} proceso(s))...")
+
+        # 3: Decodificar -> preprocesar -> extraer (imap conserva el orden)
+        if num_procesos > 1:
+            pool = multiprocessing.Pool(num_procesos, initializer=_inicializar_trabajador,
+                                        initargs=(self.preprocesador, self.extractor))
+            tareas = ((rutas_imagenes[i], guardar_png) for i in pendientes)
+            procesados = pool.imap(_procesar_ruta_trabajador, tareas, chunksize=tamano_chunk)
+        else:
+            pool = None
+            procesados = (self.procesar_ruta(rutas_imagenes[i], guardar_png) for i in pendientes)
+        procesados = iter(tqdm(procesados, total=len(pendientes), desc="Ingesta"))
+
+        almacen = AlmacenCaracteristicas(
+            directorio_almacen, modo='w',
+            dimension=self.extractor.dimension, disposicion=self.extractor.disposicion
+        )
+        escritor = EscritorSegundoPlano() if guardar_png else None
+        bloque = np.empty((tamano_bloque, self.extractor.dimension), dtype=np.float32)
+        metadatos = []
+        errores = []
+        pendientes = set(pendientes)
+
+        try:
+            for i, ruta in enumerate(rutas_imagenes):
+                descriptores = cache.obtener(hashes[i]) if i not in pendientes else None
+                if descriptores is not None:
+                    vector = np.concatenate([descriptores[n] for n in self.extractor.disposicion])
+                else:
+                    if i in pendientes:
+                        vector, procesada, error = next(procesados)
+                    else:
+                        # Desalojada de la cache durante esta misma ingesta: se
+                        # procesa aqui (su PNG ya existe, no se vuelve a escribir)
+                        vector, procesada, error = self.procesar_ruta(ruta)
+                    if vector is None:
+                        # Una imagen fallida no detiene la ingesta
+                        errores.append({'archivo': ruta, 'error': error})
+                        continue
+                    if cache is not None:
+                        cache.guardar(hashes[i], self.extractor.separar_descriptores(vector))
+                    # 5: PNG procesado en segundo plano
+                    if escritor is not None and procesada is not None:
+                        escritor.encolar(os.path.join(directorio_procesadas, nombres[i]), procesada)
+
+                if manifiesto is not None and i in cambiadas:
+                    manifiesto.registrar(ruta, hashes[i])
+
+                # 4: Anexar al almacen por bloques
+                bloque[len(metadatos)] = vector
+                metadatos.append({'archivo': nombres[i], 'origen': ruta})
+                if len(metadatos) == tamano_bloque:
+                    almacen.agregar_lote(bloque, metadatos)
+                    metadatos = []
+
+            if metadatos:
+                almacen.agregar_lote(bloque[:len(metadatos)], metadatos)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            almacen.cerrar()
+            if escritor is not None:
+                escritor.cerrar()
+            if cache is not None:
+                cache.cerrar()
+                print(f"Estadisticas de cache: {cache.obtener_estadisticas()}")
+            if manifiesto is not None:
+                manifiesto.guardar()
+
+        if errores:
+            print(f"Imagenes con error: {len(errores)}")
+            for item in errores[:10]:
+                print(f"   {item['archivo']}: {item['error']}")
+        if escritor is not None:
+            print(f"PNG procesados escritos: {escritor.escritas} ({len(escritor.errores)} errores)")
+
+        print(f"Ingesta completada: {len(almacen)} imagenes en {directorio_almacen}")
+        return len(almacen)
+
+
+# Etapas propias de cada proceso trabajador: copias de las del proceso padre,
+# reconstruidas una sola vez por proceso con la misma configuracion (y por
+# tanto la misma clave de cache)
+_ingesta_trabajador = None
+
+
+def _inicializar_trabajador(preprocesador, extractor):
+    global _ingesta_trabajador
+    _ingesta_trabajador = IngestaUnificada(preprocesador, extractor)
+
+
+def _procesar_ruta_trabajador(tarea):
+    ruta_entrada, devolver_imagen = tarea
+    return _ingesta_trabajador.procesar_ruta(ruta_entrada, devolver_imagen)
@@ -0,0 +1,158 @@
+"""
+LBP uniforme vectorizado para una configuracion fija (P, R).
+Precalcula los pesos de interpolacion una sola vez y procesa imagenes
+completas (o lotes) con operaciones NumPy.
+"""
+
+import numpy as np
+
+
+class LBPUniformeRapido:
+    """
+    Motor LBP 'uniform' equivalente a skimage.feature.local_binary_pattern.
+
+    Reproduce exactamente el algoritmo de skimage:
+    - Vecinos en (-R sin(2 pi i / P), R cos(2 pi i / P)) redondeados a 5 decimales
+    - Interpolacion bilineal con valor 0 fuera de la imagen
+    - Bit = 1 si textura - centro >= 0
+    - Transiciones contadas entre vecinos consecutivos 0..P-1 (sin cerrar el circulo)
+    - Codigo = numero de unos si hay <= 2 transiciones, si no P + 1
+
+    Los pesos bilineales se calculan como skimage, a partir de la coordenada
+    absoluta (fila + desplazamiento), y las operaciones siguen su mismo orden,
+    por lo que los codigos (y los histogramas) son identicos bit a bit.
+
+    Attributes:
+        num_puntos (int): Numero de vecinos P
+        radio (float): Radio R del circulo de vecinos
+        margen (int): Relleno de ceros necesario alrededor de la imagen
+        vecinos (list): Por vecino: (desp_fila, desp_col, fila_min, fila_max, col_min, col_max)
+    """
+
+    def __init__(self, num_puntos=24, radio=8):
+        self.num_puntos = num_puntos
+        self.radio = radio
+
+        # Coordenadas de los vecinos (mismo redondeo que skimage)
+        angulos = 2 * np.pi * np.arange(num_puntos, dtype=np.float64) / num_puntos
+        filas = np.round(-radio * np.sin(angulos), 5)
+        columnas = np.round(radio * np.cos(angulos), 5)
+
+        # Esquinas enteras de la interpolacion bilineal de cada vecino
+        self.vecinos = [
+            (r, c, int(np.floor(r)), int(np.ceil(r)), int(np.floor(c)), int(np.ceil(c)))
+            for r, c in zip(filas, columnas)
+        ]
+        self.margen = int(np.ceil(radio))
+
+        # Pesos por forma de imagen: {(H, W): [(dr, dc) por vecino]}
+        self._pesos = {}
+
+    def _obtener_pesos(self, forma):
+        """
+        Pesos fraccionarios dr (H, 1) y dc (1, W) de cada vecino.
+
+        skimage calcula dr = (fila + desp) - floor(fila + desp), que depende
+        de la fila por redondeo; se reproduce con un vector por eje.
+        """
+        if forma in self._pesos:
+            return self._pesos[forma]
+
+        filas = np.arange(forma[0], dtype=np.float64)[:, np.newaxis]
+        columnas = np.arange(forma[1], dtype=np.float64)[np.newaxis, :]
+        pesos = [
+            ((filas + r) - (filas + fila_min), (columnas + c) - (columnas + col_min))
+            for r, c, fila_min, _, col_min, _ in self.vecinos
+        ]
+        self._pesos[forma] = pesos
+        return pesos
+
+    def codigos(self, imagen):
+        """
+        Calcula el codigo LBP uniforme de cada pixel.
+
+        Flujo:
+        1. Rellena con ceros (equivale a cval=0 fuera de la imagen)
+        2. Para cada vecino interpola la imagen desplazada completa
+           (los vecinos con desplazamiento entero no necesitan interpolar)
+        3. Acumula bits y transiciones entre vecinos consecutivos
+        4. Asigna P + 1 a los patrones no uniformes
+
+        Args:
+            imagen (numpy.ndarray): Imagen (H, W) en escala de grises
+
+        Returns:
+            numpy.ndarray: Codigos en [0, P + 1] con forma (H, W)
+        """
+        alto, ancho = imagen.shape
+        m = self.margen
+
+        # 1: Relleno con ceros
+        rellena = np.pad(imagen.astype(np.float64), m, mode='constant')
+        centro = rellena[m:m + alto, m:m + ancho]
+
+        def desplazada(df, dc):
+            return rellena[m + df:m + df + alto, m + dc:m + dc + ancho]
+
+        suma_bits = np.zeros((alto, ancho), dtype=np.uint8)
+        transiciones = np.zeros((alto, ancho), dtype=np.uint8)
+        bit_anterior = None
+
+        # 2: Interpolacion bilineal en el mismo orden de operaciones que skimage
+        # Con peso 0 la esquina sobrante no altera el valor, por eso se omite
+        for (_, _, fila_min, fila_max, col_min, col_max), (dr, dc) in zip(
+                self.vecinos, self._obtener_pesos((alto, ancho))):
+            if col_min == col_max:
+                superior = desplazada(fila_min, col_min)
+                inferior = desplazada(fila_max, col_min)
+            else:
+                superior = (1 - dc) * desplazada(fila_min, col_min)
+                superior += dc * desplazada(fila_min, col_max)
+                if fila_min != fila_max:
+                    inferior = (1 - dc) * desplazada(fila_max, col_min)
+                    inferior += dc * desplazada(fila_max, col_max)
+
+            if fila_min == fila_max:
+                textura = superior
+            else:
+                textura = (1 - dr) * superior
+                textura += dr * inferior
+
+            # 3: textura - centro >= 0 equivale a textura >= centro
+            bit = textura >= centro
+            suma_bits += bit
+            if bit_anterior is not None:
+                transiciones += bit != bit_anterior
+            bit_anterior = bit
+
+        # 4: Patrones uniformes (<= 2 transiciones) vs no uniformes
+        return np.where(transiciones <= 2, suma_bits, self.num_puntos + 1)
+
+    def histogramas(self, imagenes):
+        """
+        Histogramas LBP normalizados (suma = 1) via bincount.
+
+        Args:
+            imagenes (numpy.ndarray): Imagen (H, W) o lote (N, H, W)
+
+        Returns:
+            numpy.ndarray: (P + 2,) para una imagen o (N, P + 2) para un lote
+        """
+        imagenes = np.asarray(imagenes)
+        es_individual = imagenes.ndim == 2
+        if es_individual:
+            imagenes = imagenes[np.newaxis]
+
+        num_bins = self.num_puntos + 2
+        histogramas = np.empty((len(imagenes), num_bins), dtype=np.float64)
+
+        # Imagen por imagen: los temporales (H, W) caben en cache
+        for i, imagen in enumerate(imagenes):
+            conteo = np.bincount(self.codigos(imagen).ravel(), minlength=num_bins)
+            suma = conteo.sum()
+            if suma > 0:
+                histogramas[i] = conteo / suma
+            else:
+                histogramas[i] = 1.0 / num_bins
+
+        return histogramas[0] if es_individual else histogramas
@@ -0,0 +1,144 @@
+"""
+Manifiesto persistente fuente -> imagen procesada.
+Da a cada imagen fuente un ID estable y permite re-ingestas incrementales.
+"""
+
+import json
+import os
+
+from src.core.cache_caracteristicas import hash_contenido
+
+
+class ManifiestoPreprocesamiento:
+    """
+    Registro de fuentes ya preprocesadas con su firma y su ID estable.
+
+    Cada fuente (ruta relativa al directorio de entrada) recibe un ID la
+    primera vez que aparece y lo conserva para siempre; el nombre de salida
+    es proc_{ID:06d}.png. Agregar o quitar datasets no renombra el resto.
+
+    Deteccion de cambios:
+    1. Mismo tamano y mtime que lo registrado -> sin cambios (sin leer el archivo)
+    2. Si difieren, se compara el hash del contenido -> solo cambia si difiere
+
+    Formato (JSON compacto):
+        {"version": 1, "siguiente_id": N,
+         "fuentes": {ruta_relativa: {"id", "tamano", "mtime_ns", "hash"}}}
+
+    Attributes:
+        ruta (str): Archivo del manifiesto
+        directorio_entrada (str): Raiz de las rutas relativas
+        fuentes (dict): Entradas por ruta relativa
+        siguiente_id (int): Proximo ID a asignar (los IDs no se reutilizan)
+    """
+
+    VERSION = 1
+
+    def __init__(self, ruta, directorio_entrada):
+        self.ruta = ruta
+        self.directorio_entrada = directorio_entrada
+        self.fuentes = {}
+        self.siguiente_id = 0
+
+        if os.path.exists(ruta):
+            with open(ruta, 'r') as f:
+                datos = json.load(f)
+            self.fuentes = datos.get('fuentes', {})
+            self.siguiente_id = datos.get('siguiente_id', 0)
+
+    @staticmethod
+    def nombre_salida(id_estable):
+        return f"proc_{id_estable:06d}.png"
+
+    def _relativa(self, ruta):
+        return os.path.relpath(ruta, self.directorio_entrada).replace(os.sep, '/')
+
+    def planificar(self, rutas_imagenes):
+        """
+        Compara el listado actual con el manifiesto.
+
+        Flujo:
+        1. Asigna ID a las fuentes nuevas (en orden del listado)
+        2. Marca como cambiadas las nuevas y las de contenido distinto
+        3. Detecta fuentes registradas que ya no existen
+
+        Returns:
+            tuple: (plan, eliminadas)
+                - plan: Lista de {'ruta', 'id', 'nombre', 'hash', 'cambiada'}
+                  en el orden del listado ('hash' es None si aun no se conoce)
+                - eliminadas: Lista de {'relativa', 'id', 'nombre'}
+        """
+        plan = []
+        presentes = set()
+
+        for ruta in rutas_imagenes:
+            relativa = self._relativa(ruta)
+            presentes.add(relativa)
+            entrada = self.fuentes.get(relativa)
+
+            # 1: Fuente nueva -> ID estable nuevo
+            if entrada is None:
+                entrada = {'id': self.siguiente_id, 'tamano': None, 'mtime_ns': None, 'hash': None}
+                self.fuentes[relativa] = entrada
+                self.siguiente_id += 1
+
+            # 2: Comparar firma (stat rapido, hash solo si el stat difiere)
+            cambiada = entrada['hash'] is None
+            if not cambiada:
+                estado = os.stat(ruta)
+                if (estado.st_size, estado.st_mtime_ns) != (entrada['tamano'], entrada['mtime_ns']):
+                    with open(ruta, 'rb') as f:
+                        hash_actual = hash_contenido(f.read())
+                    if hash_actual == entrada['hash']:
+                        # Solo cambio el mtime (p. ej. copia): actualizar firma
+                        entrada['tamano'], entrada['mtime_ns'] = estado.st_size, estado.st_mtime_ns
+                    else:
+                        cambiada = True
+
+            plan.append({
+                'ruta': ruta,
+                'id': entrada['id'],
+                'nombre': self.nombre_salida(entrada['id']),
+                'hash': None if cambiada else entrada['hash'],
+                'cambiada': cambiada
+            })
+
+        # 3: Fuentes desaparecidas
+        eliminadas = [
+            {'relativa': relativa, 'id': entrada['id'], 'nombre': self.nombre_salida(entrada['id'])}
+            for relativa, entrada in self.fuentes.items()
+            if relativa not in presentes
+        ]
+        return plan, eliminadas
+
+    def registrar(self, ruta, hash_imagen=None):
+        """
+        Registra la firma de una fuente procesada correctamente.
+
+        Args:
+            ruta (str): Ruta de la fuente
+            hash_imagen (str): Hash del contenido (se calcula si no se da)
+        """
+        if hash_imagen is None:
+            with open(ruta, 'rb') as f:
+                hash_imagen = hash_contenido(f.read())
+        estado = os.stat(ruta)
+        entrada = self.fuentes[self._relativa(ruta)]
+        entrada.update({'tamano': estado.st_size, 'mtime_ns': estado.st_mtime_ns, 'hash': hash_imagen})
+
+    def olvidar(self, relativa):
+        self.fuentes.pop(relativa, None)
+
+    def guardar(self):
+        """Escritura atomica: archivo temporal + os.replace."""
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = self.ruta + '.tmp'
+        with open(temporal, 'w') as f:
+            json.dump({
+                'version': self.VERSION,
+                'siguiente_id': self.siguiente_id,
+                'fuentes': self.fuentes
+            }, f, separators=(',', ':'))
+        os.replace(temporal, self.ruta)
@@ -5,8 +5,16 @@
 import cv2
 import numpy as np
 import os
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+)
 from tqdm import tqdm
 
+from src.core.cache_caracteristicas import hash_contenido
+from src.core.manifiesto_preprocesamiento import ManifiestoPreprocesamiento
+
 
 class PreprocesadorUnificado:
     
@@ -18,6 +26,35 @@ class PreprocesadorUnificado:
         # clipLimit: Limita el contraste para evitar amplificacion excesiva de ruido
         # tileGridSize: Tamano de las regiones para ecualizacion local (8x8 pixeles)
         self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        
+        # Copias por hilo para el modo concurrente
+        self._local = threading.local()
+
+    # Extensiones reconocidas como imagen de entrada
+    formatos_imagen = ['.tif', '.tiff', '.png', '.jpg', '.jpeg']
+
+    def configuracion(self):
+        """Parametros que determinan la imagen preprocesada."""
+        return {
+            'tamano_objetivo': list(self.tamano_objetivo),
+            'clahe_clip': self.clahe.getClipLimit(),
+            'clahe_rejilla': list(self.clahe.getTilesGridSize()),
+            'mediana': 3
+        }
+
+    def __reduce__(self):
+        # El objeto CLAHE y las copias por hilo no se serializan: al enviarlo
+        # a otro proceso se reconstruye desde su configuracion
+        return (type(self), (self.tamano_objetivo,))
+
+    def listar_imagenes(self, directorio_entrada):
+        """Rutas de imagen bajo el directorio, en el orden de os.walk."""
+        rutas_imagenes = []
+        for root, dirs, files in os.walk(directorio_entrada):
+            for file in files:
+                if any(file.lower().endswith(fmt) for fmt in self.formatos_imagen):
+                    rutas_imagenes.append(os.path.join(root, file))
+        return rutas_imagenes
 
     def preprocesar_imagen(self, imagen):
         """
@@ -62,49 +99,206 @@ class PreprocesadorUnificado:
 
         return suavizada
 
-    def preprocesar_directorio(self, directorio_entrada, directorio_salida):
+    def preprocesar_bytes(self, datos):
+        """
+        Decodifica una imagen codificada (PNG, JPG, TIFF...) y la preprocesa.
+        
+        Returns:
+            numpy.ndarray: Imagen preprocesada, o None si no se pudo decodificar
+            (tambien con un buffer vacio, que cv2.imdecode no admite)
+        """
+        if len(datos) == 0:
+            return None
+        imagen = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if imagen is None:
+            return None
+        return self.preprocesar_imagen(imagen)
+
+    def preprocesar_lote_bytes(self, lista_datos, num_hilos=1):
+        """
+        Decodifica y preprocesa un lote de imagenes codificadas en hilos
+        (cada hilo con su propio CLAHE).
+        
+        Returns:
+            list: Imagen preprocesada (o None si fallo) por elemento, en orden
+        """
+        if num_hilos is None:
+            num_hilos = os.cpu_count() or 1
+        num_hilos = min(num_hilos, len(lista_datos))
+        if num_hilos <= 1:
+            return [self.preprocesar_bytes(datos) for datos in lista_datos]
+        with ThreadPoolExecutor(num_hilos) as ejecutor:
+            return list(ejecutor.map(lambda datos: self.instancia_hilo().preprocesar_bytes(datos),
+                                     lista_datos))
+
+    def _preprocesar_archivo(self, ruta_entrada, ruta_salida):
+        """
+        Lee, preprocesa y guarda una imagen.
+        
+        Returns:
+            str: Hash del contenido de la fuente si se escribio, si no None
+        """
+        # Leer imagen original (los bytes sirven tambien para el hash)
+        with open(ruta_entrada, 'rb') as f:
+            datos = f.read()
+        img_original = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img_original is None:
+            return None
+        
+        # Preprocesar y guardar imagen
+        img_procesada = self.preprocesar_imagen(img_original)
+        if not cv2.imwrite(ruta_salida, img_procesada):
+            return None
+        return hash_contenido(datos)
+
+    def instancia_hilo(self):
+        """
+        Copia del preprocesador propia del hilo actual (hilos de un lote o
+        de peticion del servidor). El objeto CLAHE de OpenCV guarda buffers
+        internos y no es seguro compartirlo entre hilos.
+        """
+        if not hasattr(self._local, 'preprocesador'):
+            self._local.preprocesador = PreprocesadorUnificado(self.tamano_objetivo)
+        return self._local.preprocesador
+
+    def _ejecutar_tareas(self, tareas, num_trabajadores, modo, max_en_vuelo):
+        """
+        Ejecuta (ruta_entrada, ruta_salida) y genera (tarea, hash) al terminar cada una.
+        """
+        if num_trabajadores <= 1:
+            for tarea in tareas:
+                yield tarea, self._preprocesar_archivo(*tarea)
+            return
+
+        if modo == 'procesos':
+            ejecutor = ProcessPoolExecutor(
+                num_trabajadores,
+                initializer=_inicializar_trabajador,
+                initargs=(self.tamano_objetivo,)
+            )
+            funcion = _preprocesar_archivo_trabajador
+        else:
+            ejecutor = ThreadPoolExecutor(num_trabajadores)
+            funcion = lambda ruta_entrada, ruta_salida: (
+                self.instancia_hilo()._preprocesar_archivo(ruta_entrada, ruta_salida)
+            )
+
+        # Ventana acotada de tareas en vuelo: se envia una nueva por cada
+        # una que termina, asi la memoria no crece con el dataset
+        with ejecutor:
+            en_vuelo = {}
+            for tarea in tareas:
+                if len(en_vuelo) >= max_en_vuelo:
+                    terminadas, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                    for futuro in terminadas:
+                        yield en_vuelo.pop(futuro), futuro.result()
+                en_vuelo[ejecutor.submit(funcion, *tarea)] = tarea
+            for futuro in as_completed(list(en_vuelo)):
+                yield en_vuelo.pop(futuro), futuro.result()
+
+    def preprocesar_directorio(self, directorio_entrada, directorio_salida, num_trabajadores=1,
+                               modo='hilos', max_en_vuelo=None, ruta_manifiesto=None):
         """
         Preprocesa todas las imagenes de un directorio y guarda los resultados.
         
         Flujo:
         1. Escanea recursivamente el directorio de entrada
         2. Identifica archivos de imagen por extension
-        3. Preprocesa cada imagen encontrada
+           (con manifiesto: solo las nuevas o modificadas, y borra las
+           salidas de fuentes que ya no existen)
+        3. Preprocesa cada imagen encontrada (secuencial o concurrente)
         4. Guarda con nombre (proc_XXXXXX.png)
+        
+        El nombre de salida nunca depende del orden en que terminan los
+        trabajadores: sin manifiesto es la posicion en el listado; con
+        manifiesto es el ID estable de la fuente.
+        
+        Args:
+            directorio_entrada (str): Directorio con el dataset original
+            directorio_salida (str): Directorio de imagenes procesadas
+            num_trabajadores (int): Hilos/procesos concurrentes (1 = secuencial, None = todos los nucleos)
+            modo (str): 'hilos' (OpenCV libera el GIL) o 'procesos'
+            max_en_vuelo (int): Imagenes en proceso a la vez (limita la memoria);
+                por defecto 4 por trabajador
+            ruta_manifiesto (str): ManifiestoPreprocesamiento para re-ejecuciones incrementales
+            
+        Returns:
+            int: Numero de imagenes procesadas disponibles en la salida
         """
         
         # Crear directorio de salida
         os.makedirs(directorio_salida, exist_ok=True)
 
         # 1: Encontrar todas las imagenes en el directorio
-        formatos_imagen = ['.tif', '.tiff', '.png', '.jpg', '.jpeg']
-        rutas_imagenes = []
-        
-        for root, dirs, files in os.walk(directorio_entrada):
-            for file in files:
-                if any(file.lower().endswith(fmt) for fmt in formatos_imagen):
-                    ruta_completa = os.path.join(root, file)
-                    rutas_imagenes.append(ruta_completa)
+        rutas_imagenes = self.listar_imagenes(directorio_entrada)
+
+        manifiesto = None
+        sin_cambios = 0
+        if ruta_manifiesto:
+            # Solo fuentes nuevas o modificadas; nombres por ID estable
+            manifiesto = ManifiestoPreprocesamiento(ruta_manifiesto, directorio_entrada)
+            plan, eliminadas = manifiesto.planificar(rutas_imagenes)
+            tareas = []
+            for item in plan:
+                ruta_salida = os.path.join(directorio_salida, item['nombre'])
+                if item['cambiada'] or not os.path.exists(ruta_salida):
+                    tareas.append((item['ruta'], ruta_salida))
+                else:
+                    sin_cambios += 1
+            for item in eliminadas:
+                ruta_salida = os.path.join(directorio_salida, item['nombre'])
+                if os.path.exists(ruta_salida):
+                    os.remove(ruta_salida)
+                manifiesto.olvidar(item['relativa'])
+            print(f"Manifiesto: {len(tareas)} por procesar, {sin_cambios} sin cambios, "
+                  f"{len(eliminadas)} eliminadas")
+        else:
+            tareas = [
+                (ruta_entrada, os.path.join(directorio_salida, f"proc_{i:06d}.png"))
+                for i, ruta_entrada in enumerate(rutas_imagenes)
+            ]
 
-        # 2: Preprocesar cada imagen encontrada
+        if num_trabajadores is None:
+            num_trabajadores = os.cpu_count() or 1
+        max_en_vuelo = max_en_vuelo or 4 * num_trabajadores
+
+        # 2: Preprocesar cada imagen pendiente
         contador = 0
-        print(f"Preprocesando {len(rutas_imagenes)} imagenes...")
+        descripcion_modo = f"{num_trabajadores} {modo}" if num_trabajadores > 1 else "secuencial"
+        print(f"Preprocesando {len(tareas)} imagenes ({descripcion_modo})...")
+        inicio = time.perf_counter()
 
         # tqdm: Barra de progreso visual
-        for ruta_entrada in tqdm(rutas_imagenes, desc="Preprocesamiento"):
-            
-            # Leer imagen original
-            img_original = cv2.imread(ruta_entrada)
-            
-            if img_original is not None:
-                # Preprocesar y guardar imagen
-                img_procesada = self.preprocesar_imagen(img_original)
-                nombre_salida = f"proc_{contador:06d}.png"
-                ruta_salida = os.path.join(directorio_salida, nombre_salida)
-                
-                cv2.imwrite(ruta_salida, img_procesada)
-                
+        try:
+            for (ruta_entrada, _), hash_imagen in tqdm(
+                    self._ejecutar_tareas(tareas, num_trabajadores, modo, max_en_vuelo),
+                    total=len(tareas), desc="Preprocesamiento"):
+                if hash_imagen is None:
+                    continue
                 contador += 1
+                if manifiesto is not None:
+                    manifiesto.registrar(ruta_entrada, hash_imagen)
+        finally:
+            # Lo ya procesado queda registrado aunque la ejecucion se interrumpa
+            if manifiesto is not None:
+                manifiesto.guardar()
+
+        # 3: Rendimiento
+        tiempo = time.perf_counter() - inicio
+        rendimiento = contador / tiempo if tiempo > 0 else 0.0
+        print(f"Preprocesamiento completado: {contador} imagenes procesadas "
+              f"en {tiempo:.1f}s ({rendimiento:.1f} imagenes/s)")
+        return contador + sin_cambios
+
+
+# Preprocesador propio de cada proceso trabajador (modo 'procesos')
+_preprocesador_trabajador = None
+
+
+def _inicializar_trabajador(tamano_objetivo):
+    global _preprocesador_trabajador
+    _preprocesador_trabajador = PreprocesadorUnificado(tamano_objetivo)
+
 
-        print(f"Preprocesamiento completado: {contador} imagenes procesadas")
-        return contador
\ No newline at end of file
+def _preprocesar_archivo_trabajador(ruta_entrada, ruta_salida):
+    return _preprocesador_trabajador._preprocesar_archivo(ruta_entrada, ruta_salida)
@@ -0,0 +1,254 @@
+"""
+Transformaciones lineales previas al indice: normalizacion Min-Max y
+proyeccion aprendida (PCA, opcionalmente con rotacion OPQ).
+La proyeccion (con la normalizacion plegada) se guarda dentro de
+faiss_index.bin como IndexPreTransform; los parametros Min-Max van en
+normalizacion.npy.
+"""
+
+import os
+import pickle
+
+import faiss
+import numpy as np
+
+from src.core.indices_faiss import resolver_parametros, transformaciones_indice
+
+
+TIPOS_PROYECCION = ('pca', 'opq')
+
+# Min y range por dimension (2 x D float32)
+ARCHIVO_NORMALIZACION = 'normalizacion.npy'
+
+# Filas transformadas por llamada (evita copiar toda la matriz a float32 de una vez)
+TAMANO_BLOQUE_PROYECCION = 65536
+
+# Normalizacion de indices anteriores (sin proyeccion)
+ARCHIVO_SCALER = 'scaler.pkl'
+
+
+class NormalizacionMinMax:
+    """
+    Normalizacion Min-Max por dimension: x' = (x - min) / range.
+
+    Es diagonal: se aplica elemento a elemento (D operaciones por vector).
+    Como faiss.LinearTransform seria una matriz densa D x D (~13 MB y D^2
+    multiplicaciones por vector con D = 1806), por eso no va en el
+    indice: si sigue una proyeccion PCA / OPQ la escala se pliega en su A
+    y b (plegar); si no, el vector se normaliza en NumPy antes de llegar
+    a FAISS.
+
+    Tiene apply / d_in / d_out como las transformaciones de FAISS, asi
+    que sirve con aplicar_transformacion.
+
+    Attributes:
+        minimo (np.ndarray): Minimo de cada dimension (float32)
+        rango (np.ndarray): max - min de cada dimension (float32, sin ceros)
+        maximo (np.ndarray): Limite superior del recorte (float32)
+    """
+
+    def __init__(self, minimo, rango):
+        self.minimo = np.asarray(minimo, dtype='float32')
+        self.rango = np.asarray(rango, dtype='float32')
+        self.maximo = self.minimo + self.rango
+        self.d_in = self.d_out = len(self.minimo)
+
+    def apply(self, vectores):
+        """Vectores (N, D) normalizados, float32."""
+        return ((np.asarray(vectores, dtype='float32') - self.minimo) / self.rango).astype('float32', copy=False)
+
+    def parametros(self):
+        """{'min', 'max', 'range'} (max = min + range, limite del recorte)."""
+        return {'min': self.minimo, 'max': self.maximo, 'range': self.rango}
+
+    def plegar(self, transformacion):
+        """
+        Compone la normalizacion con una transformacion lineal posterior:
+        A ((x - min) / range) + b = (A / range) x + (b - A (min / range)).
+
+        Returns:
+            faiss.LinearTransform: Misma salida que aplicar ambas, sobre el vector sin normalizar
+        """
+        escala = 1.0 / self.rango.astype(np.float64)
+        matriz = faiss.vector_to_array(transformacion.A).reshape(transformacion.d_out, self.d_in).astype(np.float64)
+        sesgo = faiss.vector_to_array(transformacion.b).astype(np.float64)
+        if len(sesgo) == 0:
+            sesgo = np.zeros(transformacion.d_out)
+
+        plegada = faiss.LinearTransform(self.d_in, transformacion.d_out, True)
+        faiss.copy_array_to_vector((matriz * escala).astype('float32').ravel(), plegada.A)
+        faiss.copy_array_to_vector((sesgo - matriz @ (self.minimo * escala)).astype('float32'), plegada.b)
+        plegada.is_trained = True
+        return plegada
+
+    @staticmethod
+    def existe(directorio):
+        return os.path.exists(os.path.join(directorio, ARCHIVO_NORMALIZACION))
+
+    def guardar(self, directorio):
+        np.save(os.path.join(directorio, ARCHIVO_NORMALIZACION), np.stack([self.minimo, self.rango]))
+
+    @classmethod
+    def cargar(cls, directorio):
+        minimo, rango = np.load(os.path.join(directorio, ARCHIVO_NORMALIZACION))
+        return cls(minimo, rango)
+
+
+def crear_normalizacion(minimo, rango):
+    """Normalizacion Min-Max con los parametros del entrenamiento (range sin ceros)."""
+    return NormalizacionMinMax(minimo, rango)
+
+
+def recibe_normalizados(indice):
+    """
+    True si el indice espera vectores ya normalizados (sin transformaciones
+    delante); False si recibe el vector recortado sin normalizar porque la
+    normalizacion va plegada en su proyeccion.
+    """
+    return not transformaciones_indice(indice)
+
+
+def copiar_transformacion(transformacion):
+    """Copia independiente (la cadena de un indice leido se libera con el)."""
+    escritor = faiss.VectorIOWriter()
+    faiss.write_VectorTransform(transformacion, escritor)
+    lector = faiss.VectorIOReader()
+    lector.data = escritor.data
+    return faiss.read_VectorTransform(lector)
+
+
+def entrenar_proyeccion(vectores, dimension, tipo='pca', tamano_muestra=100000, semilla=0,
+                        parametros_indice=None):
+    """
+    Aprende la proyeccion sobre una muestra de los vectores normalizados.
+
+    Flujo:
+    1. Toma hasta `tamano_muestra` filas sin reemplazo
+    2. Entrena PCA (centrado + componentes principales) hasta `dimension`
+    3. (opq) Entrena una rotacion OPQ sobre la salida del PCA y la
+       compone con el PCA en una sola transformacion lineal (A, b)
+
+    Args:
+        vectores (numpy.ndarray): Matriz (N, D) normalizada
+        dimension (int): Dimension de salida (< D)
+        tipo (str): 'pca' u 'opq' (OPQ solo aporta con indices ivfpq)
+        parametros_indice (dict): Parametros del indice (m de PQ para OPQ)
+
+    Returns:
+        tuple: (faiss.LinearTransform, descripcion) con descripcion =
+            {'tipo', 'dimension_entrada', 'dimension_salida', 'varianza_explicada'}
+    """
+    if tipo not in TIPOS_PROYECCION:
+        raise ValueError(f"Proyeccion no soportada: {tipo} (opciones: {', '.join(TIPOS_PROYECCION)})")
+    num_vectores, dimension_entrada = vectores.shape
+    if not 0 < dimension < dimension_entrada:
+        raise ValueError(f"La dimension proyectada debe estar entre 1 y {dimension_entrada - 1}")
+
+    # 1: Muestra de entrenamiento
+    if num_vectores > tamano_muestra:
+        generador = np.random.default_rng(semilla)
+        filas = np.sort(generador.choice(num_vectores, tamano_muestra, replace=False))
+        muestra = np.ascontiguousarray(vectores[filas], dtype='float32')
+    else:
+        muestra = np.ascontiguousarray(vectores, dtype='float32')
+
+    # 2: PCA
+    pca = faiss.PCAMatrix(dimension_entrada, dimension)
+    pca.train(muestra)
+    autovalores = np.clip(faiss.vector_to_array(pca.eigenvalues), 0.0, None)
+    varianza = float(autovalores[:dimension].sum() / autovalores.sum()) if autovalores.sum() > 0 else 1.0
+    matriz = faiss.vector_to_array(pca.A).reshape(dimension, dimension_entrada)
+    sesgo = faiss.vector_to_array(pca.b)
+
+    # 3: Rotacion OPQ compuesta con el PCA: y = R (A x + b)
+    if tipo == 'opq':
+        m = resolver_parametros('ivfpq', dimension, num_vectores, parametros_indice)['m']
+        opq = faiss.OPQMatrix(dimension, m)
+        opq.train(pca.apply(muestra))
+        rotacion = faiss.vector_to_array(opq.A).reshape(dimension, dimension)
+        matriz, sesgo = rotacion @ matriz, rotacion @ sesgo
+
+    # Solo A y b: PCAMatrix serializa ademas la matriz D x D completa
+    transformacion = faiss.LinearTransform(dimension_entrada, dimension, True)
+    faiss.copy_array_to_vector(matriz.astype('float32').ravel(), transformacion.A)
+    faiss.copy_array_to_vector(sesgo.astype('float32'), transformacion.b)
+    transformacion.is_trained = True
+
+    return transformacion, {
+        'tipo': tipo,
+        'dimension_entrada': dimension_entrada,
+        'dimension_salida': dimension,
+        'varianza_explicada': varianza
+    }
+
+
+def aplicar_transformacion(transformacion, vectores):
+    """
+    Aplica una transformacion FAISS por bloques de filas.
+
+    Returns:
+        numpy.ndarray: (N, dimension_salida) float32 contiguo
+    """
+    salida = np.empty((len(vectores), transformacion.d_out), dtype='float32')
+    for inicio in range(0, len(vectores), TAMANO_BLOQUE_PROYECCION):
+        bloque = np.ascontiguousarray(vectores[inicio:inicio + TAMANO_BLOQUE_PROYECCION], dtype='float32')
+        salida[inicio:inicio + len(bloque)] = transformacion.apply(bloque)
+    return salida
+
+
+def describir_proyeccion(descripcion, num_vectores):
+    """
+    Varianza explicada y memoria ahorrada por la proyeccion.
+
+    La memoria se mide sobre los vectores float32 que guardan los indices
+    Flat, IVF y HNSW (en IVF-PQ el codigo ocupa m bytes en ambos casos).
+
+    Returns:
+        dict: descripcion + bytes por vector y bytes ahorrados en el indice
+    """
+    bytes_entrada = 4 * descripcion['dimension_entrada']
+    bytes_salida = 4 * descripcion['dimension_salida']
+    return {
+        **descripcion,
+        'bytes_por_vector': {'original': bytes_entrada, 'proyectado': bytes_salida},
+        'memoria_ahorrada_bytes': (bytes_entrada - bytes_salida) * num_vectores,
+        'fraccion_memoria': bytes_salida / bytes_entrada
+    }
+
+
+def eliminar_archivos_legados(directorio):
+    """Borra scaler.pkl de una indexacion anterior (ahora normalizacion.npy en cada version)."""
+    ruta = os.path.join(directorio, ARCHIVO_SCALER)
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+
+def describir_normalizacion(indice):
+    if recibe_normalizados(indice):
+        return 'Min-Max [0,1] (elemento a elemento, normalizacion.npy)'
+    return 'Min-Max [0,1] (plegada en la transformacion del indice)'
+
+
+def integrar_transformaciones(directorio, indice):
+    """
+    Indice y normalizacion de una version guardada.
+
+    Flujo:
+    1. normalizacion.npy: el indice ya lleva plegada la normalizacion en
+       su proyeccion, o no lleva transformaciones y recibe vectores
+       normalizados (ver recibe_normalizados)
+    2. Indices anteriores (sin proyeccion): parametros de scaler.pkl
+
+    Returns:
+        tuple: (indice, normalizacion, scaler) con scaler = {'min', 'max', 'range'}
+    """
+    # 1: Parametros junto al indice
+    if NormalizacionMinMax.existe(directorio):
+        normalizacion = NormalizacionMinMax.cargar(directorio)
+        return indice, normalizacion, normalizacion.parametros()
+
+    # 2: scaler.pkl de indexaciones anteriores
+    with open(os.path.join(directorio, ARCHIVO_SCALER), 'rb') as f:
+        scaler = pickle.load(f)
+    normalizacion = crear_normalizacion(scaler['min'], scaler['range'])
+    return indice, normalizacion, normalizacion.parametros()
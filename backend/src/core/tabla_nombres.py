@@ -0,0 +1,229 @@
+"""
+Tabla compacta ID estable -> nombre de archivo.
+Sustituye el diccionario {str(id): nombre} serializado como JSON indentado.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+ARCHIVO_IDS = 'mapeo_ids.npy'
+ARCHIVO_DESPLAZAMIENTOS = 'mapeo_desplazamientos.npy'
+ARCHIVO_NOMBRES = 'mapeo_nombres.bin'
+ARCHIVO_HASHES = 'mapeo_hashes.npy'
+ARCHIVO_ORDEN_HASHES = 'mapeo_orden_hashes.npy'
+
+# Formato anterior (se sigue leyendo)
+ARCHIVO_MAPEO_JSON = 'mapeo_indices.json'
+
+ARCHIVOS_TABLA = [ARCHIVO_IDS, ARCHIVO_DESPLAZAMIENTOS, ARCHIVO_NOMBRES, ARCHIVO_HASHES, ARCHIVO_ORDEN_HASHES]
+
+
+def hash_nombres(codificados):
+    """Hash de 64 bits de cada nombre (UTF-8) para la busqueda inversa."""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(nombre, digest_size=8).digest(), 'little') for nombre in codificados],
+        dtype='uint64'
+    )
+
+
+def _reunir(desplazamientos, blob, filas):
+    """Desplazamientos y blob nuevos con solo las `filas` dadas, en ese orden."""
+    longitudes = desplazamientos[filas + 1] - desplazamientos[filas]
+    nuevos = np.zeros(len(filas) + 1, dtype='int64')
+    np.cumsum(longitudes, out=nuevos[1:])
+    origen = np.repeat(desplazamientos[filas] - nuevos[:-1], longitudes) + np.arange(nuevos[-1])
+    return nuevos, np.asarray(blob)[origen]
+
+
+class TablaNombres:
+    """
+    Arreglos planos que se pueden mapear en memoria:
+
+        mapeo_ids.npy                # IDs estables ordenados (int64, N)
+        mapeo_desplazamientos.npy    # Inicio de cada nombre en el blob (int64, N + 1)
+        mapeo_nombres.bin            # Nombres UTF-8 concatenados, sin separador
+        mapeo_hashes.npy             # Hash de cada nombre, ordenado (uint64, N)
+        mapeo_orden_hashes.npy       # Posicion de cada hash en la tabla (int64, N)
+
+    ID -> nombre es una busqueda binaria vectorizada sobre los IDs y un
+    corte del blob; nombre -> ID busca el hash y confirma comparando bytes
+    (las colisiones se resuelven igual). La tabla es inmutable: agregar y
+    eliminar devuelven una tabla nueva.
+
+    Attributes:
+        ids (np.ndarray): IDs estables ordenados
+        desplazamientos (np.ndarray): Limites de cada nombre en el blob
+        blob (np.ndarray): Bytes UTF-8 de todos los nombres (uint8)
+        hashes (np.ndarray): Hashes ordenados
+        orden_hashes (np.ndarray): Posicion en `ids` de cada hash
+    """
+
+    def __init__(self, ids, desplazamientos, blob, hashes, orden_hashes):
+        self.ids = ids
+        self.desplazamientos = desplazamientos
+        self.blob = blob
+        self.hashes = hashes
+        self.orden_hashes = orden_hashes
+
+    @classmethod
+    def desde_pares(cls, ids, nombres):
+        """
+        Construye la tabla desde IDs y nombres en cualquier orden.
+
+        Args:
+            ids (iterable): IDs estables (unicos)
+            nombres (iterable): Nombre de archivo de cada ID
+        """
+        ids = np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype='int64')
+        codificados = [nombre.encode('utf-8') for nombre in nombres]
+        if len(codificados) != len(ids):
+            raise ValueError(f"{len(ids)} IDs para {len(codificados)} nombres")
+        longitudes = np.fromiter((len(nombre) for nombre in codificados), dtype='int64', count=len(codificados))
+        return cls._componer(ids, longitudes, np.frombuffer(b''.join(codificados), dtype='uint8'),
+                             hash_nombres(codificados))
+
+    @classmethod
+    def _componer(cls, ids, longitudes, blob, hashes):
+        """Ordena por ID filas dadas como longitudes + blob + hash de cada nombre."""
+        desplazamientos = np.zeros(len(ids) + 1, dtype='int64')
+        np.cumsum(longitudes, out=desplazamientos[1:])
+
+        orden = np.argsort(ids, kind='stable')
+        ids = ids[orden]
+        if len(ids) > 1 and (np.diff(ids) == 0).any():
+            raise ValueError("La tabla de nombres no admite IDs repetidos")
+        desplazamientos, blob = _reunir(desplazamientos, blob, orden)
+        hashes = hashes[orden]
+
+        orden_hashes = np.argsort(hashes, kind='stable').astype('int64')
+        return cls(ids, desplazamientos, blob, hashes[orden_hashes], orden_hashes)
+
+    @classmethod
+    def desde_diccionario(cls, mapeo):
+        """Convierte un mapeo {id: nombre} (claves int o str, como el JSON anterior)."""
+        return cls.desde_pares(np.fromiter((int(clave) for clave in mapeo), dtype='int64', count=len(mapeo)),
+                               mapeo.values())
+
+    @staticmethod
+    def existe(directorio):
+        return (os.path.exists(os.path.join(directorio, ARCHIVO_IDS))
+                or os.path.exists(os.path.join(directorio, ARCHIVO_MAPEO_JSON)))
+
+    @classmethod
+    def cargar(cls, directorio, mapear=True):
+        """
+        Carga la tabla (mapeada en memoria de solo lectura si `mapear`).
+
+        Un indice anterior con mapeo_indices.json se convierte en memoria.
+        """
+        if not os.path.exists(os.path.join(directorio, ARCHIVO_IDS)):
+            with open(os.path.join(directorio, ARCHIVO_MAPEO_JSON), 'r') as f:
+                return cls.desde_diccionario(json.load(f))
+
+        modo = 'r' if mapear else None
+        arreglos = [np.load(os.path.join(directorio, archivo), mmap_mode=modo)
+                    for archivo in (ARCHIVO_IDS, ARCHIVO_DESPLAZAMIENTOS, ARCHIVO_HASHES, ARCHIVO_ORDEN_HASHES)]
+        ruta_blob = os.path.join(directorio, ARCHIVO_NOMBRES)
+        if mapear and os.path.getsize(ruta_blob) > 0:
+            blob = np.memmap(ruta_blob, dtype='uint8', mode='r')
+        else:
+            blob = np.fromfile(ruta_blob, dtype='uint8')
+        ids, desplazamientos, hashes, orden_hashes = arreglos
+        return cls(ids, desplazamientos, blob, hashes, orden_hashes)
+
+    def guardar(self, directorio):
+        """Escribe los cinco archivos en `directorio`."""
+        np.save(os.path.join(directorio, ARCHIVO_IDS), np.asarray(self.ids))
+        np.save(os.path.join(directorio, ARCHIVO_DESPLAZAMIENTOS), np.asarray(self.desplazamientos))
+        np.save(os.path.join(directorio, ARCHIVO_HASHES), np.asarray(self.hashes))
+        np.save(os.path.join(directorio, ARCHIVO_ORDEN_HASHES), np.asarray(self.orden_hashes))
+        np.asarray(self.blob).tofile(os.path.join(directorio, ARCHIVO_NOMBRES))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_estable):
+        return bool(self.posiciones([id_estable])[0] >= 0)
+
+    def posiciones(self, ids):
+        """Posicion de cada ID en la tabla (-1 si no esta), vectorizado."""
+        ids = np.asarray(ids, dtype='int64').ravel()
+        if len(self.ids) == 0:
+            return np.full(len(ids), -1, dtype='int64')
+        posiciones = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return np.where(np.asarray(self.ids)[posiciones] == ids, posiciones, -1)
+
+    def _nombre_en(self, posicion):
+        inicio, fin = self.desplazamientos[posicion], self.desplazamientos[posicion + 1]
+        return bytes(self.blob[inicio:fin]).decode('utf-8')
+
+    def nombres(self, ids, defecto=None):
+        """
+        Nombres de una lista de IDs.
+
+        Args:
+            ids (array-like): IDs estables (p. ej. la fila de resultados de FAISS)
+            defecto (str): Formato para IDs ausentes, con {id} (None = devuelve None)
+
+        Returns:
+            list: Un nombre (o el defecto) por ID
+        """
+        ids = np.asarray(ids, dtype='int64').ravel()
+        return [
+            self._nombre_en(posicion) if posicion >= 0
+            else (defecto.format(id=int(id_estable)) if defecto is not None else None)
+            for id_estable, posicion in zip(ids, self.posiciones(ids))
+        ]
+
+    def nombre(self, id_estable, defecto=None):
+        posicion = self.posiciones([id_estable])[0]
+        return self._nombre_en(posicion) if posicion >= 0 else defecto
+
+    def ids_de(self, nombres):
+        """
+        Busqueda inversa nombre -> ID estable.
+
+        Returns:
+            np.ndarray: ID de cada nombre (-1 si no esta)
+        """
+        codificados = [nombre.encode('utf-8') for nombre in nombres]
+        hashes = hash_nombres(codificados)
+        inicios = np.searchsorted(self.hashes, hashes, side='left')
+        fines = np.searchsorted(self.hashes, hashes, side='right')
+
+        resultado = np.full(len(codificados), -1, dtype='int64')
+        for i, (nombre, inicio, fin) in enumerate(zip(codificados, inicios, fines)):
+            # Normalmente un solo candidato; mas de uno solo si hay colision
+            for posicion in self.orden_hashes[inicio:fin]:
+                if bytes(self.blob[self.desplazamientos[posicion]:self.desplazamientos[posicion + 1]]) == nombre:
+                    resultado[i] = self.ids[posicion]
+                    break
+        return resultado
+
+    def _filas(self, posiciones):
+        """(ids, longitudes, blob, hashes) de las filas dadas, sin decodificar."""
+        desplazamientos, blob = _reunir(np.asarray(self.desplazamientos), self.blob, posiciones)
+        hashes_por_fila = np.empty(len(self.ids), dtype='uint64')
+        hashes_por_fila[self.orden_hashes] = self.hashes
+        return np.asarray(self.ids)[posiciones], np.diff(desplazamientos), blob, hashes_por_fila[posiciones]
+
+    def agregar(self, ids, nombres):
+        """Tabla nueva con los pares agregados (un ID existente se reemplaza)."""
+        nuevas = TablaNombres.desde_pares(ids, nombres)
+        conservadas = self._filas(np.flatnonzero(~np.isin(self.ids, nuevas.ids)))
+        agregadas = nuevas._filas(np.arange(len(nuevas)))
+        return TablaNombres._componer(*(np.concatenate(partes) for partes in zip(conservadas, agregadas)))
+
+    def eliminar(self, ids):
+        """Tabla nueva sin los IDs dados (los ausentes se ignoran)."""
+        posiciones = np.flatnonzero(~np.isin(self.ids, np.asarray(ids, dtype='int64')))
+        return TablaNombres._componer(*self._filas(posiciones))
+
+    def bytes_en_disco(self):
+        """Tamano aproximado de la tabla (todos los arreglos)."""
+        return int(sum(np.asarray(a).nbytes for a in
+                       (self.ids, self.desplazamientos, self.blob, self.hashes, self.orden_hashes)))
@@ -0,0 +1,197 @@
+"""
+Instantaneas versionadas del directorio de indices.
+Cada indexacion (o guardado incremental) escribe una version completa y
+la publica cambiando de forma atomica el puntero ACTUAL. La version incluye
+una instantanea de los vectores originales (ver fijar_almacen): reordenar
+o reconstruir nunca lee un almacen que otra ingesta esta reescribiendo.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo exclusion entre hilos del mismo proceso
+    fcntl = None
+
+from src.core.almacen_caracteristicas import AlmacenCaracteristicas
+
+
+DIRECTORIO_VERSIONES = 'versiones'
+ARCHIVO_ACTUAL = 'ACTUAL'
+ARCHIVO_MANIFIESTO = 'manifiesto.json'
+
+# Instantaneas de los vectores originales dentro de cada version:
+# corpus ingerido y segmento de altas incrementales
+DIRECTORIO_ALMACEN = 'almacen'
+DIRECTORIO_ALTAS = 'altas'
+
+# Versiones anteriores que se conservan (procesos que aun no recargaron)
+VERSIONES_CONSERVADAS = 3
+
+PREFIJO_PREPARACION = '.preparando-'
+ARCHIVO_BLOQUEO = '.bloqueo'
+
+_bloqueo_local = threading.Lock()
+
+
+def version_actual(directorio):
+    """Nombre de la version publicada, o None si el directorio no tiene versiones."""
+    ruta = os.path.join(directorio, ARCHIVO_ACTUAL)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, 'r') as f:
+        return f.read().strip() or None
+
+
+def directorio_actual(directorio):
+    """
+    Directorio con los archivos de la version publicada.
+
+    Sin puntero ACTUAL (indexaciones anteriores) los archivos estan
+    directamente en `directorio`.
+    """
+    version = version_actual(directorio)
+    if version is None:
+        return directorio
+    return os.path.join(directorio, DIRECTORIO_VERSIONES, version)
+
+
+def listar_versiones(directorio):
+    """Versiones completas ordenadas de la mas antigua a la mas reciente."""
+    ruta = os.path.join(directorio, DIRECTORIO_VERSIONES)
+    if not os.path.isdir(ruta):
+        return []
+    return sorted(nombre for nombre in os.listdir(ruta)
+                  if nombre.startswith('v') and nombre[1:].isdigit())
+
+
+def leer_manifiesto(directorio_version):
+    """Manifiesto de una version ({} si no existe)."""
+    ruta = os.path.join(directorio_version, ARCHIVO_MANIFIESTO)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, 'r') as f:
+        return json.load(f)
+
+
+@contextmanager
+def bloquear(directorio):
+    """
+    Exclusion mutua entre procesos sobre el directorio de indices.
+
+    flock sobre `directorio/.bloqueo`: con varios workers de gunicorn, una
+    modificacion completa (almacen -> indice -> publicacion) no se intercala
+    con otra ni reparte IDs duplicados. El sistema libera el bloqueo si el
+    proceso muere.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    with _bloqueo_local, open(os.path.join(directorio, ARCHIVO_BLOQUEO), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def preparar_version(directorio):
+    """
+    Directorio temporal donde se escribe la version nueva.
+
+    Los lectores nunca lo ven: solo se hace visible al publicarlo.
+    """
+    ruta = os.path.join(directorio, DIRECTORIO_VERSIONES)
+    os.makedirs(ruta, exist_ok=True)
+    return tempfile.mkdtemp(prefix=PREFIJO_PREPARACION, dir=ruta)
+
+
+def almacen_version(directorio_version, nombre=DIRECTORIO_ALMACEN):
+    """Instantanea de vectores originales de una version, o None si no la tiene."""
+    ruta = os.path.join(directorio_version, nombre)
+    return ruta if AlmacenCaracteristicas.existe(ruta) else None
+
+
+def descartar_version(preparacion):
+    """Borra una preparacion que no llego a publicarse."""
+    shutil.rmtree(preparacion, ignore_errors=True)
+
+
+def publicar_version(directorio, preparacion, origen, **datos):
+    """
+    Publica una version preparada.
+
+    Flujo:
+    1. Escribe el manifiesto (archivos y tamanos, tambien los del almacen
+       fijado; origen, version anterior)
+    2. Renombra el directorio temporal a v000001, v000002, ...
+    3. Cambia el puntero ACTUAL con archivo temporal + os.replace (atomico):
+       un lector ve la version anterior completa o la nueva completa
+    4. Borra las versiones antiguas (conserva VERSIONES_CONSERVADAS)
+
+    Args:
+        directorio (str): Directorio raiz de indices
+        preparacion (str): Directorio devuelto por preparar_version
+        origen (str): 'indexacion' o 'incremental'
+        **datos: Campos extra del manifiesto (p. ej. total_vectores)
+
+    Returns:
+        str: Nombre de la version publicada
+    """
+    anterior = version_actual(directorio)
+
+    # 1: Manifiesto
+    manifiesto = {
+        'origen': origen,
+        'creado': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'version_anterior': anterior,
+        **datos,
+        'archivos': {
+            os.path.relpath(os.path.join(raiz, nombre), preparacion): os.path.getsize(os.path.join(raiz, nombre))
+            for raiz, _, nombres in sorted(os.walk(preparacion)) for nombre in sorted(nombres)
+        }
+    }
+
+    # 2: Nombre definitivo (otro proceso pudo publicar a la vez)
+    while True:
+        existentes = listar_versiones(directorio)
+        numero = int(existentes[-1][1:]) + 1 if existentes else 1
+        version = f'v{numero:06d}'
+        manifiesto['version'] = version
+        with open(os.path.join(preparacion, ARCHIVO_MANIFIESTO), 'w') as f:
+            json.dump(manifiesto, f, indent=2)
+        try:
+            os.rename(preparacion, os.path.join(directorio, DIRECTORIO_VERSIONES, version))
+            break
+        except OSError:
+            if not os.path.exists(os.path.join(directorio, DIRECTORIO_VERSIONES, version)):
+                raise
+
+    # 3: Puntero
+    ruta = os.path.join(directorio, ARCHIVO_ACTUAL)
+    with open(ruta + '.tmp', 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(ruta + '.tmp', ruta)
+
+    # 4: Limpieza
+    limpiar_versiones(directorio)
+    print(f"Version publicada: {version} (anterior: {anterior})")
+    return version
+
+
+def limpiar_versiones(directorio, conservar=VERSIONES_CONSERVADAS):
+    """
+    Borra las versiones mas antiguas, nunca la publicada.
+
+    Un proceso que aun sirve una version borrada sigue leyendo sus
+    archivos abiertos o mapeados hasta recargar.
+    """
+    actual = version_actual(directorio)
+    antiguas = [v for v in listar_versiones(directorio) if v != actual][:-conservar or None]
+    for version in antiguas:
+        shutil.rmtree(os.path.join(directorio, DIRECTORIO_VERSIONES, version), ignore_errors=True)
+    return antiguas
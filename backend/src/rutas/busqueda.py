@@ -1,73 +1,290 @@
-from flask import request, jsonify, current_app
-import base64
-import cv2
+from flask import jsonify, current_app
+import math
+import os
+import time
 import numpy as np
 from src.core.preprocesamiento import PreprocesadorUnificado
 from src.core.extraccion_caracteristicas import ExtractorMasivo
-from src.core.busqueda_similitud import SistemaBusqueda
+from src.core.busqueda_similitud import ServicioBusqueda, distancia_para_similitud
+from src.core.cache_caracteristicas import hash_contenido
+from src.core.cache_resultados import CacheResultados, clave_resultados
+from src.core.fusion_tardia import METODOS_FUSION
+from src.utilidades.entrada_imagenes import leer_imagen_peticion, leer_imagenes_peticion
 
+# CLAHE y HOGDescriptor de OpenCV no admiten llamadas concurrentes sobre el
+# mismo objeto: cada hilo de peticion (gunicorn gthread) usa instancia_hilo()
 preprocesador = PreprocesadorUnificado()
 extractor = ExtractorMasivo()
-sistema_busqueda = SistemaBusqueda()
+# Recarga en caliente cuando se publica una version nueva del indice
+sistema_busqueda = ServicioBusqueda()
+
+# Busqueda por lote: imagenes por peticion e hilos de preprocesamiento / extraccion
+MAX_IMAGENES_LOTE = int(os.getenv('MAX_IMAGENES_LOTE', '1000'))
+HILOS_LOTE = int(os.getenv('HILOS_LOTE', str(os.cpu_count() or 1)))
+
+# Resultados por consulta: top_k por defecto y maximo (tambien acota el modo rango)
+TOP_K_DEFECTO = 10
+MAX_TOP_K = int(os.getenv('MAX_TOP_K', '1000'))
+
+# Cotas de los parametros de busqueda por consulta (acotan el coste de una peticion)
+MAX_NPROBE = int(os.getenv('MAX_NPROBE', '4096'))
+MAX_EF_SEARCH = int(os.getenv('MAX_EF_SEARCH', '4096'))
+MAX_REORDENAR = int(os.getenv('MAX_REORDENAR', '64'))
+MAX_SUPERVIVIENTES = int(os.getenv('MAX_SUPERVIVIENTES', '100000'))
+
+# Cache de resultados por (bytes de la imagen, version del indice, parametros);
+# CACHE_RESULTADOS_MB=0 la desactiva, CACHE_RESULTADOS_DISCO=ruta.sqlite la comparte entre procesos
+cache_resultados = CacheResultados(
+    limite_bytes=int(float(os.getenv('CACHE_RESULTADOS_MB', '64')) * 1024**2),
+    ttl=float(os.getenv('CACHE_RESULTADOS_TTL', '3600')) or None,
+    ruta_disco=os.getenv('CACHE_RESULTADOS_DISCO') or None
+)
+
+
+def _entero_acotado(datos, clave, minimo, maximo):
+    """Entero opcional de la peticion dentro de [minimo, maximo] (None si no viene)."""
+    valor = datos.get(clave)
+    if valor is None:
+        return None
+    if isinstance(valor, bool) or not isinstance(valor, int) or not minimo <= valor <= maximo:
+        raise ValueError(f"{clave} debe ser un entero entre {minimo} y {maximo}")
+    return valor
+
+
+def _pesos_peticion(pesos):
+    """Pesos de fusion tardia: {descriptor conocido: numero >= 0}, no todos cero."""
+    if pesos is None:
+        return None
+    if not isinstance(pesos, dict) or not pesos:
+        raise ValueError(f"pesos debe ser un objeto {{descriptor: peso}} con descriptores de {list(extractor.disposicion)}")
+    desconocidos = sorted(set(pesos) - set(extractor.disposicion))
+    if desconocidos:
+        raise ValueError(f"pesos: descriptores desconocidos {desconocidos} (validos: {list(extractor.disposicion)})")
+    for nombre, peso in pesos.items():
+        if isinstance(peso, bool) or not isinstance(peso, (int, float)) or not math.isfinite(peso) or peso < 0:
+            raise ValueError(f"pesos['{nombre}'] debe ser un numero >= 0")
+    if not any(pesos.values()):
+        raise ValueError("pesos no puede ser todo cero")
+    return pesos
+
+
+def parametros_peticion(datos):
+    """
+    Parametros de busqueda de la peticion (tambien forman la clave de la cache):
+    top_k, distancia_maxima / similitud_minima (umbral), modo ('knn' o 'rango':
+    todos los resultados dentro del umbral con range_search), nprobe (IVF),
+    ef_search (HNSW), reordenar (factor r), pesos/fusion (fusion tardia por
+    descriptor) y supervivientes (prefiltro binario, 0 = sin prefiltro).
+    Los enteros se acotan con MAX_NPROBE, MAX_EF_SEARCH, MAX_REORDENAR y
+    MAX_SUPERVIVIENTES (reordenar 0 = sin reordenar).
+    
+    Raises:
+        ValueError: Si algun parametro no es valido
+    """
+    modo = datos.get('modo', 'knn')
+    if modo not in ('knn', 'rango'):
+        raise ValueError("modo debe ser 'knn' o 'rango'")
+    rango = modo == 'rango'
+    
+    # En modo rango top_k es opcional: sin el se devuelven todos (hasta MAX_TOP_K)
+    top_k = datos.get('top_k', MAX_TOP_K if rango else TOP_K_DEFECTO)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+        raise ValueError(f"top_k debe ser un entero entre 1 y {MAX_TOP_K}")
+    
+    # Umbral: el mas estricto de distancia_maxima y similitud_minima
+    umbrales = []
+    if datos.get('distancia_maxima') is not None:
+        distancia_maxima = float(datos['distancia_maxima'])
+        if not math.isfinite(distancia_maxima) or distancia_maxima < 0:
+            raise ValueError("distancia_maxima debe ser un numero finito >= 0")
+        umbrales.append(distancia_maxima)
+    if datos.get('similitud_minima') is not None:
+        umbrales.append(distancia_para_similitud(float(datos['similitud_minima'])))
+    
+    fusion = datos.get('fusion', 'distancia')
+    if fusion not in METODOS_FUSION:
+        raise ValueError(f"fusion debe ser uno de {list(METODOS_FUSION)}")
+    
+    return {
+        'top_k': top_k,
+        'distancia_maxima': min(umbrales) if umbrales else None,
+        'rango': rango,
+        'nprobe': _entero_acotado(datos, 'nprobe', 1, MAX_NPROBE),
+        'ef_search': _entero_acotado(datos, 'ef_search', 1, MAX_EF_SEARCH),
+        'reordenar': _entero_acotado(datos, 'reordenar', 0, MAX_REORDENAR),
+        'pesos': _pesos_peticion(datos.get('pesos')),
+        'fusion': fusion,
+        'supervivientes': _entero_acotado(datos, 'supervivientes', 0, MAX_SUPERVIVIENTES)
+    }
+
 
 def configurar_rutas_busqueda(app):
     @app.route('/api/buscar-similares', methods=['POST'])
     def buscar_imagenes_similares():
         try:
+            sistema_busqueda.comprobar_version()
             if not sistema_busqueda.cargado:
                 return jsonify({"error": "El sistema no está indexado. Ejecuta /api/indexar-sistema primero"}), 400
         
-            datos = request.get_json()
-            
-            if 'imagen' not in datos:
-                return jsonify({"error": "Se requiere 'imagen' en formato base64"}), 400
+            # Imagen en multipart/form-data, cuerpo image/* o base64 en JSON
+            inicio = time.perf_counter()
+            try:
+                imagen_bytes, datos = leer_imagen_peticion()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            try:
+                parametros = parametros_peticion(datos)
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": f"Parametro invalido: {e}"}), 400
             
-            # Busqueda por imagen nueva
-            imagen_codificada = datos['imagen']
+            # Misma imagen, parametros y version del indice: resultado guardado
+            cache_resultados.sincronizar_version(sistema_busqueda.version)
+            clave = clave_resultados(hash_contenido(imagen_bytes), sistema_busqueda.version, parametros)
+            guardados = cache_resultados.obtener(clave)
+            if guardados is not None:
+                return jsonify({
+                    "exito": True,
+                    "resultados": guardados,
+                    "total_resultados": len(guardados),
+                    "tiempos_ms": {"cache": (time.perf_counter() - inicio) * 1000},
+                    "desde_cache": True
+                })
             
-            # Decodificar y preprocesar
-            imagen_bytes = base64.b64decode(imagen_codificada)
-            imagen_array = np.frombuffer(imagen_bytes, dtype=np.uint8)
-            imagen = cv2.imdecode(imagen_array, cv2.IMREAD_COLOR)
-            
-            if imagen is None:
+            # Decodificar (directo desde el buffer leido) y preprocesar
+            imagen_procesada = preprocesador.instancia_hilo().preprocesar_bytes(imagen_bytes)
+            if imagen_procesada is None:
                 return jsonify({"error": "No se pudo decodificar la imagen"}), 400
-                
-            imagen_procesada = preprocesador.preprocesar_imagen(imagen)
             
-            # Extraer características y buscar
-            resultados = sistema_busqueda.buscar_por_imagen(imagen_procesada, extractor)
+            # Extraer características y buscar (parametros solo para esta consulta)
+            respuesta = sistema_busqueda.buscar_por_imagen(
+                imagen_procesada, extractor.instancia_hilo(), devolver_tiempos=True, **parametros
+            )
+            if isinstance(respuesta, dict):
+                return jsonify(respuesta), 400
+            resultados, tiempos = respuesta
+            cache_resultados.guardar(clave, resultados, (time.perf_counter() - inicio) * 1000)
             
             return jsonify({
                 "exito": True,
                 "resultados": resultados,
-                "total_resultados": len(resultados)
+                "total_resultados": len(resultados),
+                "tiempos_ms": tiempos,
+                "desde_cache": False
             })
             
         except Exception as e:
             return jsonify({"error": f"Error en busqueda: {str(e)}"}), 500
 
+    @app.route('/api/buscar-similares-lote', methods=['POST'])
+    def buscar_lote_similares():
+        """
+        Busca N imagenes (lista base64 en JSON o varios archivos 'imagenes'
+        en multipart/form-data) en una sola llamada: preprocesamiento y
+        extraccion en paralelo y una sola busqueda (N, D) en FAISS.
+        Una imagen que no se puede decodificar devuelve su propio error
+        sin afectar a las demas.
+        """
+        try:
+            sistema_busqueda.comprobar_version()
+            if not sistema_busqueda.cargado:
+                return jsonify({"error": "El sistema no está indexado. Ejecuta /api/indexar-sistema primero"}), 400
+            
+            # Leer las imagenes (los errores de base64 quedan por imagen)
+            inicio = time.perf_counter()
+            try:
+                lista_datos, errores, datos = leer_imagenes_peticion()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if len(lista_datos) > MAX_IMAGENES_LOTE:
+                return jsonify({"error": f"Maximo {MAX_IMAGENES_LOTE} imagenes por lote"}), 400
+            try:
+                parametros = parametros_peticion(datos)
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": f"Parametro invalido: {e}"}), 400
+            lista_bytes = {i: imagen_bytes for i, imagen_bytes in enumerate(lista_datos) if imagen_bytes is not None}
+            
+            # Consultas ya resueltas en la cache no se procesan
+            cache_resultados.sincronizar_version(sistema_busqueda.version)
+            claves = {
+                i: clave_resultados(hash_contenido(imagen_bytes), sistema_busqueda.version, parametros)
+                for i, imagen_bytes in lista_bytes.items()
+            }
+            resultados_por_imagen = {}
+            for i, clave in claves.items():
+                guardados = cache_resultados.obtener(clave)
+                if guardados is not None:
+                    resultados_por_imagen[i] = guardados
+                    del lista_bytes[i]
+            
+            # Decodificar y preprocesar en paralelo
+            posiciones = list(lista_bytes)
+            procesadas = dict(zip(posiciones, preprocesador.instancia_hilo().preprocesar_lote_bytes(
+                [lista_bytes[i] for i in posiciones], num_hilos=HILOS_LOTE
+            )))
+            validas = []
+            for i, imagen in procesadas.items():
+                if imagen is None:
+                    errores[i] = "No se pudo decodificar la imagen"
+                else:
+                    validas.append(i)
+            
+            # Extraccion y busqueda de todo el lote
+            tiempos = {}
+            if validas:
+                respuesta = sistema_busqueda.buscar_por_lote(
+                    np.stack([procesadas[i] for i in validas]), extractor.instancia_hilo(),
+                    num_hilos=HILOS_LOTE, **parametros
+                )
+                if isinstance(respuesta, dict):
+                    return jsonify(respuesta), 400
+                resultados, tiempos = respuesta
+                # Coste del lote repartido entre las consultas calculadas
+                tiempo_por_consulta = (time.perf_counter() - inicio) * 1000 / len(validas)
+                for i, resultados_imagen in zip(validas, resultados):
+                    resultados_por_imagen[i] = resultados_imagen
+                    cache_resultados.guardar(claves[i], resultados_imagen, tiempo_por_consulta)
+            
+            consultas = []
+            for i in range(len(lista_datos)):
+                if i in errores:
+                    consultas.append({"indice": i, "exito": False, "error": errores[i]})
+                else:
+                    consultas.append({
+                        "indice": i,
+                        "exito": True,
+                        "resultados": resultados_por_imagen[i],
+                        "total_resultados": len(resultados_por_imagen[i]),
+                        "desde_cache": i not in procesadas
+                    })
+            
+            return jsonify({
+                "exito": True,
+                "consultas": consultas,
+                "total_consultas": len(consultas),
+                "fallidas": len(errores),
+                "desde_cache": len(resultados_por_imagen) - len(validas),
+                "tiempos_ms": tiempos
+            })
+            
+        except Exception as e:
+            return jsonify({"error": f"Error en busqueda por lote: {str(e)}"}), 500
+
     @app.route('/api/extraer-caracteristicas', methods=['POST'])
     def extraer_caracteristicas():
         try:
-            datos = request.get_json()
-            if 'imagen' not in datos:
-                return jsonify({"error": "No se proporcionó imagen"}), 400
-            
-            imagen_codificada = datos['imagen']
+            # Imagen en multipart/form-data, cuerpo image/* o base64 en JSON
+            try:
+                imagen_bytes, _ = leer_imagen_peticion()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
             
             # Decodificar y preprocesar
-            imagen_bytes = base64.b64decode(imagen_codificada)
-            imagen_array = np.frombuffer(imagen_bytes, dtype=np.uint8)
-            imagen = cv2.imdecode(imagen_array, cv2.IMREAD_COLOR)
-            
-            if imagen is None:
+            imagen_procesada = preprocesador.instancia_hilo().preprocesar_bytes(imagen_bytes)
+            if imagen_procesada is None:
                 return jsonify({"error": "No se pudo decodificar la imagen"}), 400
-                
-            imagen_procesada = preprocesador.preprocesar_imagen(imagen)
             
             # Extraer características
-            resultado = extractor.extraer_imagen(imagen_procesada)
+            resultado = extractor.instancia_hilo().extraer_imagen(imagen_procesada)
             
             return jsonify({
                 "exito": True,
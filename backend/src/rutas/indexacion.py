@@ -1,25 +1,70 @@
 from flask import request, jsonify
+import base64
+import os
+import cv2
+import numpy as np
 from src.core.fusion_indexacion import SistemaFusionIndexacion
+from src.core.indice_incremental import IndiceIncremental
+from src.core.versiones_indice import bloquear, version_actual
+from src.rutas.busqueda import preprocesador, extractor, sistema_busqueda, cache_resultados
 
 sistema_indexado = True
 
+# Indice incremental cargado bajo demanda; las modificaciones se serializan
+# entre hilos y entre workers con bloquear() sobre el directorio de indices
+# (se recarga si otro proceso publico una version nueva)
+DIRECTORIO_INDICES = 'datos/indices'
+indice_incremental = None
+
+
+def obtener_indice_incremental():
+    global indice_incremental
+    if indice_incremental is None or indice_incremental.version != version_actual(DIRECTORIO_INDICES):
+        indice = IndiceIncremental()
+        if not indice.cargar():
+            return None
+        indice_incremental = indice
+    return indice_incremental
+
+
+def publicar_cambios(indice):
+    """Publica una version nueva del indice y la pone en servicio en el buscador compartido."""
+    indice.guardar()
+    sistema_busqueda.cargar_indices()
+
 def configurar_rutas_indexacion(app):
     @app.route('/api/indexar-sistema', methods=['POST'])
     def indexar_sistema_completo():
         try:
-            global sistema_indexado
+            global sistema_indexado, indice_incremental
+            
+            # Tipo de indice opcional: flat (por defecto), sq8, sqfp16, ivf, hnsw o ivfpq
+            # dimension_proyeccion opcional: PCA (u OPQ con ivfpq) antes de indexar
+            # bits_firma opcional: firmas binarias para el prefiltro por Hamming
+            datos = request.get_json(silent=True) or {}
             
             # Ejecutar indexación completa
             sistema_indexacion = SistemaFusionIndexacion(
                 ruta_vectores='datos/caracteristicas/vectores_caracteristicas.npy',
                 ruta_json='datos/caracteristicas/caracteristicas_completas.json', 
-                directorio_salida='datos/indices'
+                directorio_salida=DIRECTORIO_INDICES,
+                tipo_indice=datos.get('tipo_indice', 'flat'),
+                parametros_indice=datos.get('parametros_indice'),
+                indices_por_descriptor=bool(datos.get('indices_por_descriptor', False)),
+                dimension_proyeccion=datos.get('dimension_proyeccion'),
+                tipo_proyeccion=datos.get('tipo_proyeccion', 'pca'),
+                bits_firma=datos.get('bits_firma'),
+                supervivientes_firma=datos.get('supervivientes_firma')
             )
             
-            exito = sistema_indexacion.ejecutar_fase_completa()
+            with bloquear(DIRECTORIO_INDICES):
+                exito = sistema_indexacion.ejecutar_fase_completa()
+                # Version nueva publicada: descartar el incremental en memoria
+                indice_incremental = None
             
             if exito:
                 sistema_indexado = True
+                sistema_busqueda.cargar_indices()
                 stats = sistema_indexacion.obtener_estadisticas()
                 
                 return jsonify({
@@ -33,21 +78,120 @@ def configurar_rutas_indexacion(app):
         except Exception as e:
             return jsonify({"error": f"Error en indexación: {str(e)}"}), 500
 
+    @app.route('/api/indice/agregar', methods=['POST'])
+    def agregar_al_indice():
+        """
+        Enrola imagenes nuevas sin reindexar el corpus.
+        
+        Flujo:
+        1. Decodifica y preprocesa cada imagen (base64)
+        2. Extrae caracteristicas del lote
+        3. Agrega al indice con el scaler congelado (ID estable en el segmento de altas)
+        4. Guarda los PNG procesados y recarga el buscador
+        """
+        try:
+            datos = request.get_json()
+            entradas = datos.get('imagenes', []) if datos else []
+            if not entradas:
+                return jsonify({"error": "Se requiere 'imagenes': [{'imagen': base64, 'nombre': opcional}]"}), 400
+            
+            # 1: Decodificar y preprocesar
+            procesadas = []
+            metadatos = []
+            for entrada in entradas:
+                imagen_bytes = base64.b64decode(entrada['imagen'])
+                imagen = cv2.imdecode(np.frombuffer(imagen_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if imagen is None:
+                    return jsonify({"error": "No se pudo decodificar una de las imagenes"}), 400
+                procesadas.append(preprocesador.instancia_hilo().preprocesar_imagen(imagen))
+                metadatos.append({'origen': entrada.get('nombre', 'api')})
+            
+            # 2: Extraer (matriz (N, D))
+            vectores, _ = extractor.instancia_hilo().extraer_lote(np.stack(procesadas))
+            
+            with bloquear(DIRECTORIO_INDICES):
+                indice = obtener_indice_incremental()
+                if indice is None:
+                    return jsonify({"error": "No se pudo cargar el índice incremental. Ejecuta /api/indexar-sistema primero"}), 400
+                
+                # 3: Alta incremental
+                resultado = indice.agregar(vectores, metadatos)
+                
+                # 4: PNG procesados (servidos por /api/imagen) y recarga
+                os.makedirs('datos/procesadas', exist_ok=True)
+                for nombre, procesada in zip(resultado['archivos'], procesadas):
+                    cv2.imwrite(os.path.join('datos/procesadas', nombre), procesada)
+                publicar_cambios(indice)
+            
+            return jsonify({"exito": True, **resultado})
+            
+        except Exception as e:
+            return jsonify({"error": f"Error agregando al índice: {str(e)}"}), 500
+
+    @app.route('/api/indice/eliminar', methods=['POST'])
+    def eliminar_del_indice():
+        """Da de baja imagenes por 'ids' estables o por nombre en 'archivos'."""
+        try:
+            datos = request.get_json() or {}
+            if not datos.get('ids') and not datos.get('archivos'):
+                return jsonify({"error": "Se requiere 'ids' o 'archivos'"}), 400
+            
+            with bloquear(DIRECTORIO_INDICES):
+                indice = obtener_indice_incremental()
+                if indice is None:
+                    return jsonify({"error": "No se pudo cargar el índice incremental. Ejecuta /api/indexar-sistema primero"}), 400
+                resultado = indice.eliminar(ids=datos.get('ids'), archivos=datos.get('archivos'))
+                publicar_cambios(indice)
+            
+            return jsonify({"exito": True, **resultado})
+            
+        except Exception as e:
+            return jsonify({"error": f"Error eliminando del índice: {str(e)}"}), 500
+
+    @app.route('/api/indice/compactar', methods=['POST'])
+    def compactar_indice():
+        try:
+            with bloquear(DIRECTORIO_INDICES):
+                indice = obtener_indice_incremental()
+                if indice is None:
+                    return jsonify({"error": "No se pudo cargar el índice incremental. Ejecuta /api/indexar-sistema primero"}), 400
+                resultado = indice.compactar()
+                publicar_cambios(indice)
+            
+            return jsonify({"exito": True, **resultado})
+            
+        except Exception as e:
+            return jsonify({"error": f"Error compactando el índice: {str(e)}"}), 500
+
+    @app.route('/api/indice/estado', methods=['GET'])
+    def estado_indice_incremental():
+        """Altas, lapidas e informe de deriva del scaler congelado."""
+        with bloquear(DIRECTORIO_INDICES):
+            indice = obtener_indice_incremental()
+            if indice is None:
+                return jsonify({"error": "No se pudo cargar el índice incremental. Ejecuta /api/indexar-sistema primero"}), 400
+            return jsonify(indice.obtener_estadisticas())
+
     @app.route('/api/estado-sistema', methods=['GET'])
     def obtener_estado_sistema():
-        from src.core.busqueda_similitud import SistemaBusqueda
-        sistema_busqueda = SistemaBusqueda()
+        sistema_busqueda.comprobar_version()
         stats = sistema_busqueda.obtener_estadisticas() if sistema_indexado else {}
         
         return jsonify({
             "sistema_indexado": sistema_indexado,
             "estadisticas": stats,
+            "cache_resultados": cache_resultados.obtener_estadisticas(),
             "endpoints_disponibles": [
                 "/api/salud",
                 "/api/preprocesar", 
                 "/api/extraer-caracteristicas",
                 "/api/indexar-sistema",
                 "/api/buscar-similares",
-                "/api/estado-sistema"
+                "/api/buscar-similares-lote",
+                "/api/estado-sistema",
+                "/api/indice/agregar",
+                "/api/indice/eliminar",
+                "/api/indice/compactar",
+                "/api/indice/estado"
             ]
         })
\ No newline at end of file
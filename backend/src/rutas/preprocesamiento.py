@@ -1,8 +1,8 @@
-from flask import request, jsonify
+from flask import jsonify
 import base64
 import cv2
-import numpy as np
 from src.core.preprocesamiento import PreprocesadorUnificado
+from src.utilidades.entrada_imagenes import leer_imagen_peticion
 
 preprocesador = PreprocesadorUnificado()
 
@@ -10,22 +10,21 @@ def configurar_rutas_preprocesamiento(app):
     @app.route('/api/preprocesar', methods=['POST'])
     def preprocesar_imagen():
         try:
-            datos = request.get_json()
-            if 'imagen' not in datos:
-                return jsonify({"error": "No se proporcionó imagen"}), 400
+            # Imagen en multipart/form-data, cuerpo image/* o base64 en JSON
+            try:
+                imagen_bytes, _ = leer_imagen_peticion()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
             
-            imagen_codificada = datos['imagen']
-            
-            # Decodificar imagen base64
-            imagen_bytes = base64.b64decode(imagen_codificada)
-            imagen_array = np.frombuffer(imagen_bytes, dtype=np.uint8)
-            imagen = cv2.imdecode(imagen_array, cv2.IMREAD_COLOR)
+            # Decodificar directamente desde el buffer leido
+            imagen = cv2.imdecode(imagen_bytes, cv2.IMREAD_COLOR)
             
             if imagen is None:
                 return jsonify({"error": "No se pudo decodificar la imagen"}), 400
             
             # Preprocesar imagen
-            imagen_procesada = preprocesador.preprocesar_imagen(imagen)
+            # (instancia del hilo: el CLAHE no se comparte entre hilos de peticion)
+            imagen_procesada = preprocesador.instancia_hilo().preprocesar_imagen(imagen)
             
             # Codificar resultado
             _, buffer = cv2.imencode('.png', imagen_procesada)
@@ -0,0 +1,159 @@
+"""
+Lectura de imagenes de una peticion HTTP en tres formatos:
+- multipart/form-data: archivo en el campo 'imagen' (o varios en 'imagenes'),
+  parametros en los demas campos del formulario
+- Cuerpo binario (image/* o application/octet-stream): la imagen es el
+  cuerpo completo, parametros en la query string
+- JSON: imagen en base64 (formato original, se mantiene por compatibilidad)
+
+Los formatos binarios se leen del flujo de la peticion directamente a un
+buffer uint8 que cv2.imdecode consume sin copias intermedias.
+"""
+
+import base64
+import binascii
+import json
+
+import numpy as np
+from flask import request
+
+
+# Tamano de lectura cuando el flujo no informa su longitud
+TAMANO_BLOQUE = 1024 * 1024
+
+
+def _valor(texto):
+    """Valor de un campo de formulario o query string: JSON si se puede ('5', '{"LBP": 1}'), si no texto."""
+    try:
+        return json.loads(texto)
+    except (TypeError, ValueError):
+        return texto
+
+
+def _longitud(flujo):
+    """Bytes restantes de un flujo con seek (archivos de multipart), o None."""
+    try:
+        posicion = flujo.tell()
+        flujo.seek(0, 2)
+        final = flujo.tell()
+        flujo.seek(posicion)
+        return final - posicion
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def leer_flujo(flujo, longitud=None):
+    """
+    Lee un flujo binario a un buffer uint8.
+
+    Con longitud conocida se reserva el buffer una vez y se llena con
+    readinto; si no, se leen bloques y se unen.
+
+    Returns:
+        numpy.ndarray: Bytes leidos (uint8, 1D)
+    """
+    if longitud is None:
+        longitud = _longitud(flujo)
+    if longitud is not None and hasattr(flujo, 'readinto'):
+        buffer = np.empty(longitud, dtype=np.uint8)
+        vista = memoryview(buffer)
+        leidos = 0
+        while leidos < longitud:
+            n = flujo.readinto(vista[leidos:])
+            if not n:
+                break
+            leidos += n
+        return buffer[:leidos]
+
+    bloques = []
+    while True:
+        bloque = flujo.read(TAMANO_BLOQUE)
+        if not bloque:
+            break
+        bloques.append(bloque)
+    return np.frombuffer(b''.join(bloques), dtype=np.uint8)
+
+
+def es_cuerpo_binario():
+    return request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream'
+
+
+def decodificar_base64(imagen_codificada):
+    """
+    Decodifica base64 estricto: caracteres fuera del alfabeto ('@@') son un
+    error de la peticion y no un buffer vacio que falla en cv2.imdecode.
+
+    Raises:
+        ValueError: Si el texto no es base64 valido
+    """
+    try:
+        return np.frombuffer(base64.b64decode(imagen_codificada, validate=True), dtype=np.uint8)
+    except (binascii.Error, TypeError) as e:
+        raise ValueError("Base64 invalido") from e
+
+
+def leer_imagen_peticion(campo='imagen'):
+    """
+    Imagen codificada (PNG, JPG, ...) y parametros de la peticion actual.
+
+    Returns:
+        tuple: (bytes de la imagen como numpy.ndarray uint8, dict de parametros)
+
+    Raises:
+        ValueError: Si falta la imagen o no se puede leer
+    """
+    if request.mimetype == 'multipart/form-data':
+        parametros = {clave: _valor(texto) for clave, texto in request.form.items()}
+        archivo = request.files.get(campo)
+        if archivo is None:
+            raise ValueError(f"Se requiere el archivo '{campo}' en el formulario")
+        return leer_flujo(archivo.stream), parametros
+
+    if es_cuerpo_binario():
+        parametros = {clave: _valor(texto) for clave, texto in request.args.items()}
+        datos = leer_flujo(request.stream, request.content_length)
+        if not len(datos):
+            raise ValueError("El cuerpo de la peticion esta vacio")
+        return datos, parametros
+
+    parametros = request.get_json(silent=True) or {}
+    if campo not in parametros:
+        raise ValueError(f"Se requiere '{campo}' en formato base64, multipart/form-data o un cuerpo image/*")
+    return decodificar_base64(parametros[campo]), parametros
+
+
+def leer_imagenes_peticion(campo='imagenes'):
+    """
+    Varias imagenes de la peticion actual (multipart con varios archivos
+    en `campo`, o JSON con una lista base64).
+
+    Returns:
+        tuple: (lista de bytes uint8 o None si no se pudo leer, {posicion: error},
+            dict de parametros)
+
+    Raises:
+        ValueError: Si no hay imagenes
+    """
+    if request.mimetype == 'multipart/form-data':
+        parametros = {clave: _valor(texto) for clave, texto in request.form.items()}
+        archivos = request.files.getlist(campo)
+        if not archivos:
+            raise ValueError(f"Se requieren archivos en el campo '{campo}' del formulario")
+        return [leer_flujo(archivo.stream) for archivo in archivos], {}, parametros
+
+    parametros = request.get_json(silent=True) or {}
+    imagenes_codificadas = parametros.get(campo)
+    if not isinstance(imagenes_codificadas, list) or not imagenes_codificadas:
+        raise ValueError(f"Se requiere '{campo}': lista de imagenes en formato base64 "
+                         "(o varios archivos en multipart/form-data)")
+
+    # Los errores de decodificacion quedan por imagen
+    lista_datos = []
+    errores = {}
+    for i, imagen_codificada in enumerate(imagenes_codificadas):
+        try:
+            lista_datos.append(decodificar_base64(imagen_codificada))
+        except ValueError as e:
+            lista_datos.append(None)
+            errores[i] = str(e)
+    return lista_datos, errores, parametros
@@ -2,6 +2,10 @@ import os
 import json
 import numpy as np
 
+from src.core.proyeccion import ARCHIVO_NORMALIZACION, ARCHIVO_SCALER
+from src.core.tabla_nombres import ARCHIVO_IDS, ARCHIVO_MAPEO_JSON, ARCHIVOS_TABLA
+from src.core.versiones_indice import directorio_actual
+
 def generar_resumen_sistema(directorio_base='datos'):
 
     directorios = [
@@ -37,7 +41,22 @@ def generar_resumen_sistema(directorio_base='datos'):
     return estadisticas
 
 def verificar_archivos_indices(directorio_indices='datos/indices'):
-    archivos_requeridos = ['faiss_index.bin', 'mapeo_indices.json', 'scaler.pkl']
+    # Archivos de la version publicada (puntero ACTUAL) o del directorio si es anterior
+    directorio_indices = directorio_actual(directorio_indices)
+    # Min-Max en normalizacion.npy (plegada tambien en la proyeccion, si la hay);
+    # scaler.pkl solo en indices anteriores
+    archivos_requeridos = ['faiss_index.bin']
+    if os.path.exists(os.path.join(directorio_indices, ARCHIVO_SCALER)) and \
+            not os.path.exists(os.path.join(directorio_indices, ARCHIVO_NORMALIZACION)):
+        archivos_requeridos.append(ARCHIVO_SCALER)
+    else:
+        archivos_requeridos.append(ARCHIVO_NORMALIZACION)
+    # Tabla binaria de nombres (mapeo_indices.json solo en indices anteriores)
+    if os.path.exists(os.path.join(directorio_indices, ARCHIVO_MAPEO_JSON)) and \
+            not os.path.exists(os.path.join(directorio_indices, ARCHIVO_IDS)):
+        archivos_requeridos.append(ARCHIVO_MAPEO_JSON)
+    else:
+        archivos_requeridos += ARCHIVOS_TABLA
     
     print("\nVerificando archivos de indice...")
     
@@ -55,4 +74,44 @@ def verificar_archivos_indices(directorio_indices='datos/indices'):
         return True
     else:
         print("   Faltan archivos de indice. El sistema necesita re-indexacion.")
-        return False
\ No newline at end of file
+        return False
+
+def memoria_mapeada(rutas):
+    """
+    Bytes mapeados y residentes de archivos abiertos con mmap en este proceso.
+    
+    Lee /proc/self/smaps (Linux). Las paginas residentes de un archivo
+    mapeado pertenecen a la cache de paginas del sistema y se comparten
+    entre todos los procesos que mapean el mismo archivo.
+    
+    Args:
+        rutas (list): Archivos a consultar
+    
+    Returns:
+        dict: {ruta: {'mapeado_bytes', 'residente_bytes'}} y 'rss_proceso_bytes'
+              (None si /proc no esta disponible)
+    """
+    reales = {os.path.realpath(ruta): ruta for ruta in rutas if ruta}
+    resultado = {ruta: {'mapeado_bytes': 0, 'residente_bytes': 0} for ruta in reales.values()}
+    resultado['rss_proceso_bytes'] = None
+    
+    try:
+        actual = None
+        with open('/proc/self/smaps', 'r') as f:
+            for linea in f:
+                partes = linea.split()
+                # Cabecera de region: "inicio-fin permisos offset dev inodo [ruta]"
+                if '-' in partes[0] and not partes[0].endswith(':'):
+                    actual = reales.get(partes[5]) if len(partes) >= 6 else None
+                elif actual is not None and partes[0] in ('Size:', 'Rss:'):
+                    clave = 'mapeado_bytes' if partes[0] == 'Size:' else 'residente_bytes'
+                    resultado[actual][clave] += int(partes[1]) * 1024
+        
+        with open('/proc/self/status', 'r') as f:
+            for linea in f:
+                if linea.startswith('VmRSS:'):
+                    resultado['rss_proceso_bytes'] = int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    
+    return resultado